@@ -1,19 +1,53 @@
-from pydantic import BaseModel, Field, field_validator
+from datetime import date
+from decimal import Decimal
+from typing import Annotated
+from uuid import UUID
+from pydantic import BaseModel, Field, PlainSerializer, TypeAdapter, field_validator
 import re
+try:
+    from app.models import (
+        MONEY_DECIMAL_PLACES, MONEY_DIGITS, PLAN_GROUP_LENGTH, PROCEDURE_CODE_LENGTH, SUBSCRIBER_LENGTH, Quadrant
+    )
+except ModuleNotFoundError:
+    from models import (
+        MONEY_DECIMAL_PLACES, MONEY_DIGITS, PLAN_GROUP_LENGTH, PROCEDURE_CODE_LENGTH, SUBSCRIBER_LENGTH, Quadrant
+    )
+
+# Abbreviations accepted for the quadrant, besides the full labels (case insensitive)
+QUADRANT_ALIASES = {
+    "U": Quadrant.UPPER,
+    "L": Quadrant.LOWER,
+    "UL": Quadrant.UPPER_LEFT,
+    "UR": Quadrant.UPPER_RIGHT,
+    "LL": Quadrant.LOWER_LEFT,
+    "LR": Quadrant.LOWER_RIGHT,
+    **{quadrant.value.upper(): quadrant for quadrant in Quadrant},
+}
+
+# Compiled once: the NPI check runs on every claim
+NPI_PATTERN = re.compile(r"\d{10}")
+
+# Money amounts must fit the NUMERIC(12, 2) columns: no fractions of a cent
+Money = Annotated[Decimal, Field(max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)]
+
+# Money in responses: exact Decimal internally, a JSON number on the wire
+MoneyAmount = Annotated[Decimal, PlainSerializer(float, return_type=float)]
 
 # Define the Pydantic model for the incoming JSON payload
 class ClaimPayload(BaseModel):
-    service_date: str = Field(..., description="The date the service was provided")
-    submitted_procedure: str = Field(..., description="The procedure code submitted, must begin with 'D'")
+    service_date: date = Field(..., description="The date the service was provided (YYYY-MM-DD)")
+    submitted_procedure: str = Field(..., max_length=PROCEDURE_CODE_LENGTH,
+                                     description="The procedure code submitted, must begin with 'D'")
     # quadrant is not a required field.
-    quadrant: str | None = Field(None, description="The quadrant where the procedure was performed")
-    plan_group: str = Field(..., description="The plan or group number associated with the claim")
-    subscriber: str = Field(..., description="The subscriber's identification number")
+    quadrant: Quadrant | None = Field(None, description="The quadrant where the procedure was performed")
+    plan_group: str = Field(..., max_length=PLAN_GROUP_LENGTH,
+                            description="The plan or group number associated with the claim")
+    subscriber: str = Field(..., max_length=SUBSCRIBER_LENGTH, description="The subscriber's identification number")
     provider_npi: str = Field(..., description="The 10-digit National Provider Identifier (NPI) of the provider")
-    provider_fees: float = Field(..., description="The provider's fees for the service")
-    allowed_fees: float = Field(..., description="The allowed fees for the procedure")
-    member_coinsurance: float = Field(..., description="The member's coinsurance amount")
-    member_copay: float = Field(..., description="The member's copay amount")
+    provider_fees: Money = Field(..., description="The provider's fees for the service")
+    allowed_fees: Money = Field(..., description="The allowed fees for the procedure")
+    member_coinsurance: Money = Field(..., description="The member's coinsurance amount")
+    member_copay: Money = Field(..., description="The member's copay amount")
 
     # Replace @validator with @field_validator
     @field_validator('submitted_procedure')
@@ -22,9 +56,16 @@ class ClaimPayload(BaseModel):
             raise ValueError('Submitted procedure must start with "D"')
         return value
 
+    @field_validator('quadrant', mode='before')
+    def normalize_quadrant(cls, value):
+        # "UL", "upper left" and "Upper Left" are the same quadrant; unknown values fail the enum check
+        if isinstance(value, str):
+            return QUADRANT_ALIASES.get(value.strip().upper(), value)
+        return value
+
     @field_validator('provider_npi')
     def validate_provider_npi(cls, value):
-        if not re.match(r'^\d{10}$', value):
+        if NPI_PATTERN.fullmatch(value) is None:
             raise ValueError('Provider NPI must be a 10-digit number')
         return value
 
@@ -44,3 +85,65 @@ class ClaimPayload(BaseModel):
             }
         }
     }
+
+
+# Validates a whole JSON array of claims in one call, parsing the raw bytes in pydantic-core
+ClaimPayloadList = TypeAdapter(list[ClaimPayload])
+
+
+# Response bodies. Declared as response models so FastAPI serializes them with
+# pydantic-core instead of walking the content with jsonable_encoder.
+class ClaimResponse(BaseModel):
+    id: UUID
+    service_date: date
+    submitted_procedure: str
+    quadrant: Quadrant | None = None
+    plan_group: str
+    subscriber: str
+    provider_npi: str
+    provider_fees: MoneyAmount
+    allowed_fees: MoneyAmount
+    member_coinsurance: MoneyAmount
+    member_copay: MoneyAmount
+    net_fee: MoneyAmount
+
+
+class TopProvider(BaseModel):
+    provider_npi: str
+    total_net_fee: MoneyAmount
+
+
+class TopProvidersPage(BaseModel):
+    top_providers: list[TopProvider]
+    next_cursor: str | None = Field(None, description="Pass it back as `cursor` to get the next page")
+
+
+class LiveTopProvider(TopProvider):
+    max_error: float = Field(description="total_net_fee overestimates the true total by at most this much")
+
+
+class LiveTopProviders(BaseModel):
+    window: str
+    total_net_fee: MoneyAmount = Field(description="Net fees of the claims accepted within the window")
+    max_error: float = Field(description="Any provider not listed has a true total of at most this much")
+    top_providers: list[LiveTopProvider]
+
+
+class SummaryTopProvider(TopProvider):
+    claim_count: int
+
+
+class SummaryTopProviders(BaseModel):
+    top_providers: list[SummaryTopProvider]
+
+
+class TrendPoint(BaseModel):
+    period: date
+    total_net_fee: MoneyAmount
+    claim_count: int
+    total_provider_fees: MoneyAmount
+    total_allowed_fees: MoneyAmount
+
+
+class Trend(BaseModel):
+    trend: list[TrendPoint]
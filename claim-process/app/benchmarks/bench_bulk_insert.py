@@ -0,0 +1,81 @@
+"""Compare claims/second of the single-claim path against `/claims/bulk`.
+
+Run from the `app` directory against a disposable database:
+
+    python -m benchmarks.bench_bulk_insert --claims 5000 --batch-size 5000
+"""
+import argparse
+import random
+import time
+
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+try:
+    from app.database import engine
+    from app.main import app
+except ModuleNotFoundError:
+    from database import engine
+    from main import app
+
+
+def make_claims(count: int) -> list[dict]:
+    """Generate synthetic, valid claim payloads."""
+    return [
+        {
+            "service_date": "2025-01-15",
+            "submitted_procedure": "D0180",
+            "quadrant": "Upper",
+            "plan_group": "GRP-1000",
+            "subscriber": f"{random.randrange(10**9, 10**10)}",
+            "provider_npi": f"{random.randrange(10**9, 10**10)}",
+            "provider_fees": round(random.uniform(50, 500), 2),
+            "allowed_fees": round(random.uniform(50, 500), 2),
+            "member_coinsurance": round(random.uniform(0, 50), 2),
+            "member_copay": round(random.uniform(0, 50), 2),
+        }
+        for _ in range(count)
+    ]
+
+
+def reset_schema():
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+
+def bench_single(client: TestClient, claims: list[dict]) -> float:
+    start = time.perf_counter()
+    for claim in claims:
+        client.post("/claims/", json=claim).raise_for_status()
+    return len(claims) / (time.perf_counter() - start)
+
+
+def bench_bulk(client: TestClient, claims: list[dict], batch_size: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(claims), batch_size):
+        response = client.post("/claims/bulk", json=claims[offset:offset + batch_size])
+        response.raise_for_status()
+        assert response.json()["failed"] == 0
+    return len(claims) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=5000, help="number of claims per scenario")
+    parser.add_argument("--batch-size", type=int, default=5000, help="claims per /claims/bulk request")
+    args = parser.parse_args()
+
+    claims = make_claims(args.claims)
+
+    with TestClient(app) as client:
+        reset_schema()
+        single = bench_single(client, claims)
+        reset_schema()
+        bulk = bench_bulk(client, claims, args.batch_size)
+        reset_schema()
+
+    print(f"single-claim path: {single:10.0f} claims/s")
+    print(f"bulk path:         {bulk:10.0f} claims/s  ({bulk / single:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
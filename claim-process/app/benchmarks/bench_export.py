@@ -0,0 +1,71 @@
+"""Rows/second and memory of the streaming claim export.
+
+Streams every claim of the configured database through the export encoder
+and reports the worker's resident memory along the way; it should stay flat
+however many rows are exported. Point it at a database that already holds
+claims, or let it generate them (disposable database only):
+
+    python -m benchmarks.bench_export --format csv --generate 2000000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+try:
+    from app.database import async_engine, engine
+    from app.exports import EXPORT_BATCH_SIZE, export_claims_statement, stream_claims
+except ModuleNotFoundError:
+    from database import async_engine, engine
+    from exports import EXPORT_BATCH_SIZE, export_claims_statement, stream_claims
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def generate_claims(count: int) -> None:
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("""
+            INSERT INTO claim (id, service_date, submitted_procedure, quadrant, plan_group, subscriber, provider_npi,
+                               provider_fees, allowed_fees, member_coinsurance, member_copay, net_fee)
+            SELECT gen_random_uuid(), DATE '2024-01-01' + i % 366, 'D0180', 'Upper Left', 'GRP-' || i % 50, 'S' || i,
+                   lpad((i % 5000)::text, 10, '1'), 100, 90, 0, 0, 10
+            FROM generate_series(1, :count) i
+        """), {"count": count})
+
+
+async def run(export_format: str, batch_size: int) -> None:
+    rows = size = 0
+    start_rss = peak_rss = rss_mb()
+    start = time.perf_counter()
+    async for chunk in stream_claims(export_claims_statement(), export_format, batch_size):
+        rows += chunk.count(b"\n")
+        size += len(chunk)
+        peak_rss = max(peak_rss, rss_mb())
+    elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+    print(f"{rows} lines, {size / 2**20:.0f} MiB in {elapsed:.1f} s: {rows / elapsed:.0f} rows/s")
+    print(f"RSS {start_rss:.0f} MiB at start, {peak_rss:.0f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="rows per server-side cursor fetch")
+    parser.add_argument("--generate", type=int, default=0, help="recreate the schema with this many synthetic claims")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_claims(args.generate)
+    asyncio.run(run(args.format, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Cost, memory and accuracy of the live top-providers rankings (no database needed).
+
+Feeds a skewed stream of claims from many distinct providers into the three
+sliding windows, then reports the time per accepted claim, the time to merge a
+window, the memory held by the summaries, and the observed error next to the
+documented bound:
+
+    python -m benchmarks.bench_heavy_hitters --claims 1000000 --providers 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+try:
+    from app.heavy_hitters import LIVE_TOP_CAPACITY, LiveTopProviders
+except ModuleNotFoundError:
+    from heavy_hitters import LIVE_TOP_CAPACITY, LiveTopProviders
+
+
+class StreamClock:
+    """Spreads the stream evenly over `seconds`, so that every bucket of the windows gets claims."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_stream(count: int, providers: int) -> list[tuple[str, float]]:
+    rng = random.Random(42)
+    stream = []
+    for _ in range(count):
+        # Half the claims go to a few heavy providers (Pareto), half to a long uniform tail
+        if rng.random() < 0.5:
+            provider = int(rng.paretovariate(1.1)) * 7919 % providers
+        else:
+            provider = rng.randrange(providers)
+        stream.append((f"{provider:010d}", round(rng.uniform(10, 500), 2)))
+    return stream
+
+
+def feed(live: LiveTopProviders, clock: StreamClock, stream: list[tuple[str, float]], step: float) -> None:
+    for i, (provider_npi, net_fee) in enumerate(stream):
+        clock.now = i * step
+        live.add(provider_npi, net_fee)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=1_000_000)
+    parser.add_argument("--providers", type=int, default=1_000_000, help="distinct provider NPIs")
+    parser.add_argument("--seconds", type=float, default=3600, help="time span of the stream")
+    parser.add_argument("--capacity", type=int, default=LIVE_TOP_CAPACITY)
+    args = parser.parse_args()
+
+    stream = make_stream(args.claims, args.providers)
+    clock = StreamClock()
+    live = LiveTopProviders(capacity=args.capacity, refresh_seconds=0, clock=clock)
+    step = args.seconds / args.claims
+
+    start = time.perf_counter()
+    feed(live, clock, stream, step)
+    elapsed = time.perf_counter() - start
+
+    # Memory is measured on a second pass: tracing allocations slows the first one down
+    tracemalloc.start()
+    memory_clock = StreamClock()
+    traced = LiveTopProviders(capacity=args.capacity, refresh_seconds=0, clock=memory_clock)
+    feed(traced, memory_clock, stream, step)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{len({npi for npi, _ in stream})} distinct providers, {args.claims} claims over {args.seconds:.0f} s")
+    print(f"add (all windows)      {elapsed / args.claims * 1e6:7.2f} us/claim")
+    print(f"summaries              {memory / 2**20:7.1f} MiB (bounded by windows x buckets x capacity)")
+
+    for name, window in live.windows.items():
+        start = time.perf_counter()
+        ranking = window.top()
+        merge_ms = (time.perf_counter() - start) * 1000
+
+        # Exact totals of the claims inside the window's buckets
+        first_bucket = window.current_bucket() - window.buckets + 1
+        exact = defaultdict(float)
+        for i, (provider_npi, net_fee) in enumerate(stream):
+            if int(i * step // window.bucket_seconds) >= first_bucket:
+                exact[provider_npi] += net_fee
+        true_top = sorted(exact, key=exact.get, reverse=True)[:10]
+        listed_top = [row[0] for row in ranking["top_providers"][:10]]
+        observed = max(estimate - exact[key] for key, estimate, _ in ranking["top_providers"][:100])
+        print(
+            f"window {name:<3} merge {merge_ms:6.1f} ms  top-10 recall {len(set(true_top) & set(listed_top)) / 10:.0%}  "
+            f"max error observed {observed:10.2f}  bound {ranking['max_error']:10.2f} "
+            f"({ranking['max_error'] / ranking['total_net_fee']:.3%} of the window)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Per-request cost of the rate limiter storages.
+
+Times `limiter.hit` (what slowapi runs on the event loop for every limited
+request) with each storage, the batched sync of the claimdb:// storage, and
+for comparison a database round trip per request. Run from the `app`
+directory against a disposable database:
+
+    python -m benchmarks.bench_rate_limit --hits 100000 --clients 1000
+"""
+import argparse
+import time
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from sqlalchemy import text
+from sqlmodel import SQLModel
+try:
+    from app.database import engine
+    from app.ratelimit import BoundedMemoryStorage, PostgresStorage
+except ModuleNotFoundError:
+    from database import engine
+    from ratelimit import BoundedMemoryStorage, PostgresStorage
+
+limit = parse("10/minute")
+
+
+def per_hit_us(storage, clients: list[str], hits: int) -> float:
+    limiter = FixedWindowRateLimiter(storage)
+    start = time.perf_counter()
+    for i in range(hits):
+        limiter.hit(limit, clients[i % len(clients)])
+    return (time.perf_counter() - start) / hits * 1e6
+
+
+def round_trip_us(clients: list[str], hits: int) -> float:
+    """One upsert per request, as a storage without batching would do."""
+    with engine.connect() as connection:
+        start = time.perf_counter()
+        for i in range(hits):
+            connection.execute(text(
+                "INSERT INTO rate_limit_counters (key, count, expires_at) VALUES (:key, 1, now() + interval '1 minute') "
+                "ON CONFLICT (key) DO UPDATE SET count = rate_limit_counters.count + 1 RETURNING count"
+            ), {"key": clients[i % len(clients)]})
+            connection.commit()
+        return (time.perf_counter() - start) / hits * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=100000, help="limit checks per storage")
+    parser.add_argument("--clients", type=int, default=1000, help="distinct client keys")
+    args = parser.parse_args()
+
+    clients = [f"10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    try:
+        print(f"memory://          {per_hit_us(MemoryStorage(), clients, args.hits):8.2f} us/request")
+        print(f"bounded-memory://  {per_hit_us(BoundedMemoryStorage(), clients, args.hits):8.2f} us/request")
+
+        # The sync thread is not started by a long interval: syncs are timed separately
+        storage = PostgresStorage(engine=engine, sync_seconds=3600)
+        print(f"claimdb://         {per_hit_us(storage, clients, args.hits):8.2f} us/request")
+        start = time.perf_counter()
+        synced = storage.sync()
+        print(f"  sync of {synced} keys  {(time.perf_counter() - start) * 1000:8.2f} ms, off the request path")
+
+        hits = min(args.hits, 5000)
+        print(f"round trip per request  {round_trip_us(clients, hits):8.2f} us/request")
+    finally:
+        SQLModel.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Latency of the cached read endpoints: uncached, cache hit, and 304 revalidation.
+
+Runs the app in-process against the configured database, which should hold
+claims and daily summaries already (the suite's synthetic claims, or a
+migrated copy of production data), and times each read endpoint with the
+cache bypassed, served from the cache and revalidated with If-None-Match:
+
+    python -m benchmarks.bench_response_cache --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+try:
+    from app.database import async_engine, read_async_engine
+    from app.main import app, limiter
+    from app.response_cache import response_cache
+except ModuleNotFoundError:
+    from database import async_engine, read_async_engine
+    from main import app, limiter
+    from response_cache import response_cache
+
+READS = {
+    "top_providers.date_range": ("/top-providers/", {"from": "2025-03-03", "to": "2025-03-09"}),
+    "top_providers.rollup_page": ("/top-providers/", {"limit": 100}),
+    "summaries.trend": ("/summaries/trend", {"interval": "week"}),
+}
+
+
+async def latencies(send, count: int) -> list[float]:
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await send()
+        assert response.status_code in (200, 304), response.status_code
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def bench(count: int) -> None:
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, (path, params) in READS.items():
+                ttl = response_cache.ttl
+                # A zero TTL recomputes every response, as without the cache
+                response_cache.ttl = 0
+                uncached = await latencies(lambda: client.get(path, params=params), count)
+                response_cache.ttl = ttl
+                etag = (await client.get(path, params=params)).headers["etag"]
+                hit = await latencies(lambda: client.get(path, params=params), count)
+                revalidated = await latencies(lambda: client.get(path, params=params, headers={"If-None-Match": etag}), count)
+                print(f"{name:<28} " + "  ".join(
+                    f"{label} p50 {statistics.median(timings) * 1000:7.2f} ms"
+                    for label, timings in (("uncached", uncached), ("hit", hit), ("304", revalidated))
+                ))
+    await async_engine.dispose()
+    await read_async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and mode")
+    args = parser.parse_args()
+    limiter.enabled = False
+    asyncio.run(bench(args.requests))
+
+
+if __name__ == "__main__":
+    main()
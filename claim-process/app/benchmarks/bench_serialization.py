@@ -0,0 +1,106 @@
+"""Serialization time per response and requests/second of the JSON endpoints.
+
+Compares the former encoding (jsonable_encoder, then the stdlib json module)
+with the current one (response models serialized by pydantic-core and orjson,
+leaderboard rows encoded straight to bytes). The requests/second part runs
+against a disposable database:
+
+    python -m benchmarks.bench_serialization --responses 20000 --requests 2000
+"""
+import argparse
+import time
+from decimal import Decimal
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from sqlmodel import SQLModel
+from starlette.responses import JSONResponse
+try:
+    from app.app_types import ClaimPayload, ClaimResponse
+    from app.benchmarks.bench_bulk_insert import make_claims
+    from app.claims import build_claim_rows, claim_response
+    from app.database import engine
+    from app.leaderboard import top_providers_json
+    from app.main import app, limiter
+    from app.metrics import json_default
+except ModuleNotFoundError:
+    from app_types import ClaimPayload, ClaimResponse
+    from benchmarks.bench_bulk_insert import make_claims
+    from claims import build_claim_rows, claim_response
+    from database import engine
+    from leaderboard import top_providers_json
+    from main import app, limiter
+    from metrics import json_default
+
+
+def per_response_us(encode, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        encode()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def bench_encoding(count: int) -> None:
+    claim = claim_response(build_claim_rows([ClaimPayload.model_validate(make_claims(1)[0])])[0])
+    claim_field = TypeAdapter(ClaimResponse)
+
+    def encode_claim():
+        # What FastAPI does for a response_model with a custom response class
+        content = claim_field.dump_python(claim_field.validate_python(claim), mode="json")
+        return orjson.dumps(content, default=json_default)
+
+    scenarios = {"claim": (lambda: JSONResponse(jsonable_encoder(claim)).body, encode_claim)}
+    for size in (10, 100):
+        rows = [(f"{npi:010d}", Decimal(f"{npi * 7 % 100000}.25")) for npi in range(size)]
+        page = {"top_providers": [{"provider_npi": npi, "total_net_fee": total} for npi, total in rows], "next_cursor": None}
+        scenarios[f"top providers ({size})"] = (
+            lambda page=page: JSONResponse(jsonable_encoder(page)).body,
+            lambda rows=rows: top_providers_json(rows, None),
+        )
+
+    for name, (before, after) in scenarios.items():
+        before_us, after_us = per_response_us(before, count), per_response_us(after, count)
+        print(f"{name:<20} before {before_us:7.1f} us  after {after_us:7.1f} us  ({before_us / after_us:.1f}x)")
+
+
+def requests_per_second(send, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        send().raise_for_status()
+    return count / (time.perf_counter() - start)
+
+
+def bench_requests(count: int) -> None:
+    claims = make_claims(count)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    limiter.enabled = False
+    try:
+        with TestClient(app) as client:
+            claim_iter = iter(claims)
+            post = requests_per_second(lambda: client.post("/claims/", json=next(claim_iter)), count)
+            top = requests_per_second(lambda: client.get("/top-providers/"), count)
+            page = requests_per_second(lambda: client.get("/top-providers/", params={"limit": 100}), count)
+    finally:
+        limiter.enabled = True
+        SQLModel.metadata.drop_all(engine)
+    print(f"POST /claims/                     {post:8.0f} requests/s")
+    print(f"GET /top-providers/ (cached)      {top:8.0f} requests/s")
+    print(f"GET /top-providers/?limit=100     {page:8.0f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=20000, help="responses encoded per scenario")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint (0 skips the database part)")
+    args = parser.parse_args()
+
+    bench_encoding(args.responses)
+    if args.requests:
+        bench_requests(args.requests)
+
+
+if __name__ == "__main__":
+    main()
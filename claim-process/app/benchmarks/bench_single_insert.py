@@ -0,0 +1,81 @@
+"""Latency of a single claim insert, with and without the post-commit refresh.
+
+Compares the former insert path (ORM add, commit, then `refresh` to read the
+id back) with the current one (client-side id, one INSERT, commit):
+
+    python -m benchmarks.bench_single_insert --inserts 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlmodel import SQLModel
+try:
+    from app.app_types import ClaimPayload
+    from app.benchmarks.bench_bulk_insert import make_claims
+    from app.claims import build_claim_rows, compute_net_fee, insert_claim_rows
+    from app.database import async_engine, async_session_factory, engine
+    from app.models import Claim
+except ModuleNotFoundError:
+    from app_types import ClaimPayload
+    from benchmarks.bench_bulk_insert import make_claims
+    from claims import build_claim_rows, compute_net_fee, insert_claim_rows
+    from database import async_engine, async_session_factory, engine
+    from models import Claim
+
+
+async def insert_with_refresh(session, payload: ClaimPayload):
+    claim = Claim(**payload.model_dump(), net_fee=compute_net_fee(payload))
+    session.add(claim)
+    await session.commit()
+    await session.refresh(claim)
+    return claim.id
+
+
+async def insert_without_refresh(session, payload: ClaimPayload):
+    row = build_claim_rows([payload])[0]
+    await insert_claim_rows(session, [row])
+    await session.commit()
+    return row["id"]
+
+
+async def measure(insert, payloads: list[ClaimPayload]) -> list[float]:
+    latencies = []
+    async with async_session_factory() as session:
+        for payload in payloads:
+            start = time.perf_counter()
+            await insert(session, payload)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(name: str, latencies: list[float]) -> str:
+    quantiles = statistics.quantiles(latencies, n=100)
+    return f"{name:<24} p50 {quantiles[49] * 1000:6.2f} ms  p99 {quantiles[98] * 1000:6.2f} ms"
+
+
+async def run(count: int):
+    payloads = [ClaimPayload.model_validate(claim) for claim in make_claims(count)]
+    # Warm up connections and statement caches
+    await measure(insert_without_refresh, payloads[:50])
+    with_refresh = await measure(insert_with_refresh, payloads)
+    without_refresh = await measure(insert_without_refresh, payloads)
+    await async_engine.dispose()
+    print(summarize("insert + refresh", with_refresh))
+    print(summarize("insert, no read-back", without_refresh))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserts", type=int, default=2000, help="inserts measured per variant")
+    args = parser.parse_args()
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    asyncio.run(run(args.inserts))
+    SQLModel.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
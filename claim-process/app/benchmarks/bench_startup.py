@@ -0,0 +1,122 @@
+"""Startup time, memory and throughput of the dev and production servers.
+
+Starts each server command in turn from the app directory, times it until
+`/metrics` answers, loads `/claims/` with concurrent clients (see load_test)
+and reports the proportional memory (PSS) of the whole process tree. Point
+it at a database migrated with `alembic upgrade head`:
+
+    python -m benchmarks.bench_startup --workers 4 --concurrency 50 --duration 10
+
+Also times the schema check each worker does at startup, against the
+create_all it replaces.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+import httpx
+from sqlmodel import SQLModel
+try:
+    from app.benchmarks.load_test import run
+    from app.database import engine, migrations_at_head
+except ModuleNotFoundError:
+    from benchmarks.load_test import run
+    from database import engine, migrations_at_head
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def server_commands(port: int, workers: int) -> dict[str, list[str]]:
+    return {
+        "dev (uvicorn --reload)": ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--reload"],
+        f"production (gunicorn, {workers} workers)": [
+            "gunicorn", "main:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+        ],
+    }
+
+
+def process_tree(pid: int) -> list[int]:
+    pids, queue = [], [pid]
+    while queue:
+        pid = queue.pop()
+        pids.append(pid)
+        for task in Path(f"/proc/{pid}/task").glob("*"):
+            children = (task / "children").read_text().split()
+            queue.extend(int(child) for child in children)
+    return pids
+
+
+def pss_mb(pid: int) -> float:
+    """Proportional set size of a process and its descendants: shared pages are counted once overall."""
+    total_kb = 0
+    for tree_pid in process_tree(pid):
+        with open(f"/proc/{tree_pid}/smaps_rollup") as rollup:
+            total_kb += next(int(line.split()[1]) for line in rollup if line.startswith("Pss:"))
+    return total_kb / 1024
+
+
+def wait_until_up(url: str, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"{url}/metrics").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+def bench_server(command: list[str], url: str, concurrency: int, duration: float) -> dict:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        command, cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        wait_until_up(url, timeout=60)
+        startup = time.perf_counter() - start
+        result = asyncio.run(run(url, "/claims/", concurrency, duration))
+        result.update(startup_s=startup, pss_mb=pss_mb(server.pid))
+        return result
+    finally:
+        # The whole group: the reloader and gunicorn both have child processes
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+def bench_schema_check(repeat: int = 5) -> None:
+    if not migrations_at_head():
+        print("The database is not at the Alembic head: run `alembic upgrade head` first")
+        return
+    for name, check in (("create_all", lambda: SQLModel.metadata.create_all(engine)), ("head check", migrations_at_head)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            check()
+        print(f"schema at startup, {name:<10} {(time.perf_counter() - start) / repeat * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per server")
+    args = parser.parse_args()
+
+    bench_schema_check()
+    url = f"http://127.0.0.1:{args.port}"
+    for name, command in server_commands(args.port, args.workers).items():
+        result = bench_server(command, url, args.concurrency, args.duration)
+        print(
+            f"{name:<32} startup {result['startup_s']:5.2f} s  {result['rps']:6.0f} req/s  "
+            f"p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:6.1f} ms  PSS {result['pss_mb']:5.0f} MiB  "
+            f"errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Claims validated per second, row by row against a single batch call.
+
+No database is needed. Run from the `app` directory:
+
+    python -m benchmarks.bench_validation --claims 50000
+"""
+import argparse
+import json
+import re
+import time
+
+from pydantic import TypeAdapter, field_validator
+try:
+    from app.app_types import ClaimPayload, ClaimPayloadList
+    from app.benchmarks.bench_bulk_insert import make_claims
+except ModuleNotFoundError:
+    from app_types import ClaimPayload, ClaimPayloadList
+    from benchmarks.bench_bulk_insert import make_claims
+
+
+class LegacyClaimPayload(ClaimPayload):
+    """ClaimPayload with the former NPI check, which looks the pattern up on every call."""
+
+    @field_validator('provider_npi')
+    def validate_provider_npi(cls, value):
+        if not re.match(r'^\d{10}$', value):
+            raise ValueError('Provider NPI must be a 10-digit number')
+        return value
+
+
+def best_rate(count: int, validate, repeat: int) -> float:
+    """Claims/second of the fastest of `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        validate()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=50000, help="claims per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per scenario (the fastest is reported)")
+    args = parser.parse_args()
+
+    body = json.dumps(make_claims(args.claims)).encode()
+    legacy_list = TypeAdapter(list[LegacyClaimPayload])
+    scenarios = {
+        "row by row, re.match NPI (before)": lambda: [LegacyClaimPayload.model_validate(item) for item in json.loads(body)],
+        "row by row": lambda: [ClaimPayload.model_validate(item) for item in json.loads(body)],
+        "batch validate_json, re.match NPI": lambda: legacy_list.validate_json(body),
+        "batch validate_json": lambda: ClaimPayloadList.validate_json(body),
+    }
+
+    baseline = None
+    for name, validate in scenarios.items():
+        rate = best_rate(args.claims, validate, args.repeat)
+        baseline = baseline or rate
+        print(f"{name:36s} {rate:10.0f} claims/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
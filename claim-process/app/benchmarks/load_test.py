@@ -0,0 +1,74 @@
+"""Concurrent load test against a running claim-process server.
+
+Fires `--concurrency` simultaneous clients at the server for `--duration`
+seconds and reports requests/second and latency percentiles per endpoint:
+
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 50
+
+`/top-providers/` is rate limited per client address, so only the
+`/claims/` endpoint is exercised unless `--top-providers` is given.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+try:
+    from app.benchmarks.bench_bulk_insert import make_claims
+except ModuleNotFoundError:
+    from benchmarks.bench_bulk_insert import make_claims
+
+
+async def run_client(client: httpx.AsyncClient, path: str, deadline: float, latencies: list[float], errors: list[int]):
+    claims = make_claims(100)
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if path == "/claims/":
+            response = await client.post(path, json=claims[i % len(claims)])
+        else:
+            response = await client.get(path)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        i += 1
+
+
+async def run(url: str, path: str, concurrency: int, duration: float) -> dict:
+    latencies: list[float] = []
+    errors: list[int] = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(run_client(client, path, deadline, latencies, errors) for _ in range(concurrency)))
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--top-providers", action="store_true", help="also load /top-providers/")
+    args = parser.parse_args()
+
+    paths = ["/claims/"] + (["/top-providers/"] if args.top_providers else [])
+    for path in paths:
+        result = asyncio.run(run(args.url, path, args.concurrency, args.duration))
+        print(
+            f"{result['path']:<16} {result['rps']:8.0f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+            f"p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
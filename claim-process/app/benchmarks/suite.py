@@ -0,0 +1,286 @@
+"""Performance regression suite: insert latency and throughput, top-providers latency by table size.
+
+Runs the app in-process (one event loop, as in one uvicorn worker) against the
+configured Postgres and RESETS ITS SCHEMA, so point it at a disposable
+database:
+
+    python -m benchmarks.suite --output results.json --baseline benchmarks/baseline.json
+
+Scenarios:
+
+* `single_insert`: latency of sequential `POST /claims/` requests.
+* `insert_throughput.c<N>`: claims/second with N concurrent clients.
+* `top_providers.<rows>.<query>`: `GET /top-providers/` latency once the claim
+  table holds <rows> synthetic claims (10k, 1M and 10M by default), for the
+  cached leaderboard, a page read from the provider_totals rollup and a date
+  range aggregated from the claims. The response cache is bypassed, so every
+  request runs its query.
+
+The synthetic claims are generated by Postgres itself (`generate_series`), one
+million rows per statement, so no row travels through Python. Most of the time
+goes to index maintenance: 10M claims take about 15 minutes on one vCPU. The
+table grows from one size to the next.
+
+Results are written as JSON (`--output`). With `--baseline`, every metric is
+compared to the stored run and the exit status is 1 if one of them got worse
+by more than `--tolerance`. `--save-baseline` stores the run as the new
+baseline. Timings depend on the machine: compare runs made on the same one.
+A baseline recorded on another Postgres major version is refused before the
+suite runs (`--allow-environment-mismatch` compares anyway).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import httpx
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel
+try:
+    from app.benchmarks.bench_bulk_insert import make_claims
+    from app.database import async_engine, engine
+    from app.leaderboard import leaderboard
+    from app.main import app, limiter
+    from app.partitions import ensure_claim_partitions
+    from app.response_cache import response_cache
+except ModuleNotFoundError:
+    from benchmarks.bench_bulk_insert import make_claims
+    from database import async_engine, engine
+    from leaderboard import leaderboard
+    from main import app, limiter
+    from partitions import ensure_claim_partitions
+    from response_cache import response_cache
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# Synthetic claims: service dates over two years, one monthly partition each
+SYNTHETIC_FIRST_DAY = date(2024, 1, 1)
+SYNTHETIC_DAYS = 731
+SYNTHETIC_PROVIDERS = 20000
+GENERATE_BATCH_ROWS = 1_000_000
+# Date range of the aggregated top-providers query: one week of claims
+TOP_PROVIDERS_QUERIES = {
+    "cached": {},
+    "rollup_page": {"limit": 100},
+    "date_range": {"from": "2025-03-03", "to": "2025-03-09"},
+}
+
+
+class Results:
+    """Metrics of a run, each with its unit and whether lower or higher is better."""
+
+    def __init__(self):
+        self.metrics: dict[str, dict] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str = "lower") -> None:
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "better": better}
+        print(f"{name:<40} {value:12.2f} {unit}")
+
+    def add_latencies(self, name: str, latencies: list[float]) -> None:
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.add(f"{name}.p50_ms", quantiles[49] * 1000, "ms")
+        self.add(f"{name}.p99_ms", quantiles[98] * 1000, "ms")
+
+
+def environment() -> dict:
+    with engine.connect() as connection:
+        server_version = connection.execute(text("SHOW server_version")).scalar()
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "postgres": server_version,
+    }
+
+
+def reset_schema() -> None:
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    last_day = date.fromordinal(SYNTHETIC_FIRST_DAY.toordinal() + SYNTHETIC_DAYS - 1)
+    with Session(engine) as session:
+        ensure_claim_partitions(session, today=last_day, ahead=0, since=SYNTHETIC_FIRST_DAY)
+
+
+def generate_claims(first: int, last: int) -> None:
+    """Insert synthetic claims number `first` to `last` (deterministic, spread over dates and providers)."""
+    for start in range(first, last + 1, GENERATE_BATCH_ROWS):
+        end = min(start + GENERATE_BATCH_ROWS - 1, last)
+        with engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO claim (id, service_date, submitted_procedure, quadrant, plan_group, subscriber,
+                                   provider_npi, provider_fees, allowed_fees, member_coinsurance, member_copay, net_fee)
+                SELECT gen_random_uuid(), CAST(:first_day AS date) + CAST((i * 7919) % :days AS integer), 'D0180',
+                       'Upper', 'GRP-' || i % 100, lpad((i % 1000000)::text, 10, '0'),
+                       lpad(((i * 104729) % :providers)::text, 10, '1'),
+                       provider_fees, allowed_fees, 10, 5, provider_fees + 10 + 5 - allowed_fees
+                FROM generate_series(CAST(:start AS bigint), :end) i,
+                     LATERAL (SELECT ((i * 31) % 40000) / 100.0 + 50 AS provider_fees,
+                                     ((i * 17) % 5000) / 100.0 AS allowed_fees) fees
+            """), {"first_day": SYNTHETIC_FIRST_DAY, "days": SYNTHETIC_DAYS, "providers": SYNTHETIC_PROVIDERS,
+                   "start": start, "end": end})
+    # Fresh statistics and visibility map, as autovacuum would eventually leave them
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM (ANALYZE) claim"))
+        connection.execute(text("VACUUM (ANALYZE) provider_totals"))
+
+
+async def timed(send) -> float:
+    start = time.perf_counter()
+    response = await send()
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bench_single_insert(client: httpx.AsyncClient, results: Results, count: int) -> None:
+    claims = make_claims(count)
+    latencies = [await timed(lambda claim=claim: client.post("/claims/", json=claim)) for claim in claims]
+    results.add_latencies("single_insert", latencies)
+
+
+async def bench_insert_throughput(client: httpx.AsyncClient, results: Results, concurrency: int,
+                                  duration: float) -> None:
+    claims = make_claims(500)
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+
+    async def run_client(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            latencies.append(await timed(lambda: client.post("/claims/", json=claims[i % len(claims)])))
+            i += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(offset) for offset in range(concurrency)))
+    results.add(f"insert_throughput.c{concurrency}.claims_per_s", len(latencies) / (time.perf_counter() - start),
+                "claims/s", better="higher")
+    results.add(f"insert_throughput.c{concurrency}.p99_ms", statistics.quantiles(latencies, n=100)[98] * 1000, "ms")
+
+
+async def bench_top_providers(client: httpx.AsyncClient, results: Results, rows: int, count: int) -> None:
+    for name, params in TOP_PROVIDERS_QUERIES.items():
+        # Drop the leaderboard cached at the previous size; the first request reloads it
+        leaderboard.clear()
+        await timed(lambda: client.get("/top-providers/", params=params))
+        latencies = [await timed(lambda: client.get("/top-providers/", params=params)) for _ in range(count)]
+        results.add_latencies(f"top_providers.{rows}.{name}", latencies)
+
+
+async def run_suite(args) -> Results:
+    results = Results()
+    reset_schema()
+    limiter.enabled = False
+    # A zero TTL recomputes every response: the timings are the queries', not the response cache's
+    ttl, response_cache.ttl = response_cache.ttl, 0
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://suite") as client:
+                await bench_single_insert(client, results, args.inserts)
+                for concurrency in args.concurrency:
+                    await bench_insert_throughput(client, results, concurrency, args.duration)
+
+                # The claims inserted above stay: they are few next to the generated ones
+                generated = 0
+                for rows in args.sizes:
+                    started = time.perf_counter()
+                    generate_claims(generated + 1, rows)
+                    print(f"generated {rows - generated} claims in {time.perf_counter() - started:.0f} s")
+                    generated = rows
+                    await bench_top_providers(client, results, rows, args.requests)
+    finally:
+        limiter.enabled = True
+        response_cache.ttl = ttl
+        await async_engine.dispose()
+    return results
+
+
+def major_version(server_version: str | None) -> str | None:
+    # "16.2", "13.15 (Debian 13.15-1.pgdg120+1)" and "17beta1" -> "16", "13", "17"
+    return re.match(r"\d+", server_version).group() if server_version else None
+
+
+def environment_mismatches(current: dict, baseline: dict) -> list[str]:
+    """Differences between two environments that make their timings incomparable."""
+    mismatches = []
+    if major_version(current.get("postgres")) != major_version(baseline.get("postgres")):
+        mismatches.append(f"Postgres {baseline.get('postgres')} in the baseline, {current.get('postgres')} here")
+    return mismatches
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print each metric next to its baseline value; returns the regressed metric names."""
+    regressions = []
+    print(f"\nCompared with the baseline of {baseline['environment'].get('created_at')} "
+          f"({baseline['environment'].get('git_commit')}), tolerance {tolerance:.0%}:")
+    for name, metric in current["metrics"].items():
+        reference = baseline["metrics"].get(name)
+        if reference is None or not reference["value"]:
+            print(f"  {name:<40} {metric['value']:12.2f} {metric['unit']}  (not in the baseline)")
+            continue
+        change = metric["value"] / reference["value"] - 1
+        worse = change > tolerance if metric["better"] == "lower" else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print(f"  {name:<40} {reference['value']:12.2f} -> {metric['value']:12.2f} {metric['unit']}  "
+              f"{change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserts", type=int, default=1000, help="sequential inserts for the latency")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 8, 32, 64], help="comma-separated client counts (default 1,8,32,64)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[10_000, 1_000_000, 10_000_000], help="claim table sizes (default 10k,1M,10M)")
+    parser.add_argument("--requests", type=int, default=200, help="top-providers requests per query and size")
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--baseline", type=Path, help=f"stored run to compare with (e.g. {DEFAULT_BASELINE.name})")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change reported as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write the run to {DEFAULT_BASELINE}")
+    parser.add_argument("--allow-environment-mismatch", action="store_true",
+                        help="compare with a baseline recorded on another Postgres major version")
+    args = parser.parse_args()
+
+    run = {"environment": environment()}
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    # Checked before the suite runs: a long run is not wasted on an incomparable baseline
+    mismatches = environment_mismatches(run["environment"], baseline["environment"]) if baseline else []
+    if mismatches:
+        print(f"The baseline {args.baseline} was recorded in another environment: {'; '.join(mismatches)}.")
+        if not args.allow_environment_mismatch:
+            print("Record a baseline here with --save-baseline, or pass --allow-environment-mismatch.")
+            sys.exit(2)
+        print("Comparing anyway (--allow-environment-mismatch).")
+    run["arguments"] = {"inserts": args.inserts, "concurrency": args.concurrency, "duration": args.duration,
+                        "sizes": args.sizes, "requests": args.requests}
+    run["metrics"] = asyncio.run(run_suite(args)).metrics
+
+    args.output.write_text(json.dumps(run, indent=2) + "\n")
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(run, indent=2) + "\n")
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+    if baseline:
+        regressions = compare(run, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
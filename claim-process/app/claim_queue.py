@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+try:
+    from app.claims import KEY_CONFLICT, KEY_NEW, fees_by_provider, insert_claim_rows, reserve_idempotency_keys
+    from app.database import async_session_factory
+    from app.leaderboard import record_committed_fees
+    from app.response_cache import response_cache
+    from app.metrics import DB_COMMIT_SECONDS
+    from app.models import ClaimQueueDeadLetter, ClaimQueueItem, Quadrant
+except ModuleNotFoundError:
+    from claims import KEY_CONFLICT, KEY_NEW, fees_by_provider, insert_claim_rows, reserve_idempotency_keys
+    from database import async_session_factory
+    from leaderboard import record_committed_fees
+    from response_cache import response_cache
+    from metrics import DB_COMMIT_SECONDS
+    from models import ClaimQueueDeadLetter, ClaimQueueItem, Quadrant
+
+logger = logging.getLogger(__name__)
+
+# "sync" writes claims inside the request, "queue" enqueues them for the worker
+CLAIM_INGESTION_MODE = os.getenv("CLAIM_INGESTION_MODE", "sync")
+# Broker used in queue mode, one of QUEUE_BACKENDS
+CLAIM_QUEUE_BACKEND = os.getenv("CLAIM_QUEUE_BACKEND", "postgres")
+# A batch is written once it holds QUEUE_BATCH_SIZE claims or QUEUE_BATCH_WAIT_SECONDS have passed
+QUEUE_BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "500"))
+QUEUE_BATCH_WAIT_SECONDS = float(os.getenv("QUEUE_BATCH_WAIT_SECONDS", "0.5"))
+# How long an idle worker sleeps before polling the queue again
+QUEUE_POLL_INTERVAL_SECONDS = float(os.getenv("QUEUE_POLL_INTERVAL_SECONDS", "0.05"))
+
+
+# Money columns travel as strings so the amounts stay exact
+MONEY_FIELDS = ("provider_fees", "allowed_fees", "member_coinsurance", "member_copay", "net_fee")
+
+
+def row_to_message(row: dict, idempotency_key: str | None = None) -> dict:
+    """Serialize a claim row (see claims.build_claim_rows) into a JSON message."""
+    message = {**row, "id": str(row["id"]), "service_date": row["service_date"].isoformat()}
+    if idempotency_key is not None:
+        message["idempotency_key"] = idempotency_key
+    if row["quadrant"] is not None:
+        message["quadrant"] = row["quadrant"].value
+    for field in MONEY_FIELDS:
+        message[field] = str(row[field])
+    return message
+
+
+def message_to_row(message: dict) -> dict:
+    row = {**message, "id": uuid.UUID(message["id"]), "service_date": date.fromisoformat(message["service_date"])}
+    row.pop("idempotency_key", None)
+    if message["quadrant"] is not None:
+        row["quadrant"] = Quadrant(message["quadrant"])
+    for field in MONEY_FIELDS:
+        row[field] = Decimal(message[field])
+    return row
+
+
+class ClaimQueue(ABC):
+    """Broker interface for queued claim ingestion.
+
+    `pending` is polled while a batch fills up, outside of any transaction.
+    `receive` is called inside the transaction that writes the batch, so a
+    backend can tie the removal of the messages to that transaction's commit.
+    `release` is called when the batch could not be written.
+    """
+
+    @abstractmethod
+    async def put(self, session: AsyncSession, messages: list[dict]) -> None:
+        ...
+
+    @abstractmethod
+    async def pending(self, session: AsyncSession, max_size: int) -> int:
+        """Number of messages ready to be received, counted up to `max_size`."""
+
+    @abstractmethod
+    async def receive(self, session: AsyncSession, max_size: int) -> list[dict]:
+        ...
+
+    async def release(self, messages: list[dict]) -> None:
+        pass
+
+
+class InMemoryClaimQueue(ClaimQueue):
+    """Process-local queue, drained by a worker task running in the same process.
+
+    Messages are lost if the process dies; meant for development and tests.
+    """
+
+    def __init__(self):
+        self.messages: deque[dict] = deque()
+
+    async def put(self, session: AsyncSession, messages: list[dict]) -> None:
+        self.messages.extend(messages)
+
+    async def pending(self, session: AsyncSession, max_size: int) -> int:
+        return min(max_size, len(self.messages))
+
+    async def receive(self, session: AsyncSession, max_size: int) -> list[dict]:
+        count = min(max_size, len(self.messages))
+        return [self.messages.popleft() for _ in range(count)]
+
+    async def release(self, messages: list[dict]) -> None:
+        self.messages.extendleft(reversed(messages))
+
+
+class PostgresClaimQueue(ClaimQueue):
+    """Durable queue in the claim_queue table.
+
+    Workers claim rows with `FOR UPDATE SKIP LOCKED`, so any number of them can
+    drain the table concurrently. The rows are deleted in the same transaction
+    that inserts the claims: a failed batch is rolled back and stays queued.
+    """
+
+    async def put(self, session: AsyncSession, messages: list[dict]) -> None:
+        await session.exec(insert(ClaimQueueItem), params=[{"payload": message} for message in messages])
+        await session.commit()
+
+    async def pending(self, session: AsyncSession, max_size: int) -> int:
+        # Without locking: rows another worker is writing may be counted, which only closes the batch early
+        ready = select(ClaimQueueItem.id).limit(max_size).subquery()
+        count = (await session.exec(select(func.count()).select_from(ready))).one()
+        # Ends the read transaction: no connection or lock is held while the batch fills up
+        await session.rollback()
+        return count
+
+    async def receive(self, session: AsyncSession, max_size: int) -> list[dict]:
+        claimed = (
+            select(ClaimQueueItem.id)
+            .order_by(ClaimQueueItem.id)
+            .limit(max_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        statement = delete(ClaimQueueItem).where(ClaimQueueItem.id.in_(claimed)).returning(ClaimQueueItem.payload)
+        return list((await session.exec(statement)).scalars())
+
+
+QUEUE_BACKENDS = {
+    "memory": InMemoryClaimQueue,
+    "postgres": PostgresClaimQueue,
+}
+
+_claim_queue: ClaimQueue | None = None
+
+
+def get_claim_queue() -> ClaimQueue:
+    """Return the process-wide queue of the configured backend."""
+    global _claim_queue
+    if _claim_queue is None:
+        _claim_queue = QUEUE_BACKENDS[CLAIM_QUEUE_BACKEND]()
+    return _claim_queue
+
+
+async def write_claims(session: AsyncSession, rows: list[dict], keys: list[str | None]) -> tuple[list[str], list[dict]]:
+    """Reserve the rows' Idempotency-Keys and insert the new rows; returns their statuses and the rows inserted."""
+    statuses = [KEY_NEW] * len(rows)
+    keyed = [position for position, key in enumerate(keys) if key is not None]
+    if keyed:
+        # Claims enqueued twice under the same Idempotency-Key are only written once
+        found = await reserve_idempotency_keys(session, [(keys[position], rows[position]) for position in keyed])
+        for position, status in zip(keyed, found):
+            statuses[position] = status
+    inserted = await insert_claim_rows(session, [row for row, status in zip(rows, statuses) if status == KEY_NEW])
+    return statuses, inserted
+
+
+async def process_batch(queue: ClaimQueue, session: AsyncSession, max_size: int = QUEUE_BATCH_SIZE,
+                        max_wait: float = QUEUE_BATCH_WAIT_SECONDS,
+                        poll_interval: float = QUEUE_POLL_INTERVAL_SECONDS) -> int:
+    """Collect a micro-batch of queued claims and write it in one transaction.
+
+    The batch is closed when `max_size` claims are pending or `max_wait`
+    seconds have passed. Waiting only polls the queue: the write transaction is
+    opened afterwards, so it is as short as the insert. Returns the number of
+    claims taken off the queue.
+
+    A batch the database rejects is written again row by row, each row in its
+    own SAVEPOINT. The rows it still rejects, and messages that are not claims,
+    are moved to claim_queue_dead_letters in the same transaction: one bad
+    message cannot keep the claims queued behind it from being written. Any
+    other failure (the connection, the commit) rolls the batch back and leaves
+    it queued for the next attempt.
+    """
+    deadline = time.monotonic() + max_wait
+    while await queue.pending(session, max_size) < max_size and time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+
+    messages = await queue.receive(session, max_size)
+    if not messages:
+        await session.rollback()
+        return 0
+
+    batch, dead_letters = [], []
+    for message in messages:
+        try:
+            batch.append((message, message_to_row(message), message.get("idempotency_key")))
+        except Exception as e:
+            dead_letters.append({"payload": message, "error": f"Invalid message: {e!r}"})
+    rows = [row for _, row, _ in batch]
+    keys = [key for _, _, key in batch]
+    try:
+        with DB_COMMIT_SECONDS.time():
+            try:
+                async with session.begin_nested():
+                    statuses, inserted = await write_claims(session, rows, keys)
+            except DBAPIError:
+                # One row the database rejects fails the whole INSERT: find it
+                statuses, inserted = [], []
+                for message, row, key in batch:
+                    try:
+                        async with session.begin_nested():
+                            (status,), written = await write_claims(session, [row], [key])
+                    except DBAPIError as e:
+                        status, written = None, []
+                        dead_letters.append({"payload": message, "error": str(e.orig)})
+                    statuses.append(status)
+                    inserted.extend(written)
+            if dead_letters:
+                await session.exec(insert(ClaimQueueDeadLetter), params=dead_letters)
+            await session.commit()
+    except Exception:
+        await session.rollback()
+        await queue.release(messages)
+        raise
+    for dead_letter in dead_letters:
+        # Accepted with 202 already: kept for an operator to fix and queue again
+        logger.error("Moved queued claim %s to claim_queue_dead_letters: %s",
+                     dead_letter["payload"].get("id"), dead_letter["error"])
+    for key, row, status in zip(keys, rows, statuses):
+        if status == KEY_CONFLICT:
+            # Accepted with 202 already: the client can no longer be told
+            logger.warning("Dropped queued claim %s: Idempotency-Key %r was used for a different claim", row["id"], key)
+    await record_committed_fees(session, fees_by_provider(inserted))
+    if inserted:
+        # Only invalidates this process's cache: API workers elsewhere wait for the TTL
+        response_cache.bump("claims")
+    return len(messages)
+
+
+async def run_worker(queue: ClaimQueue, batch_size: int = QUEUE_BATCH_SIZE,
+                     batch_wait: float = QUEUE_BATCH_WAIT_SECONDS) -> None:
+    """Drain the queue forever, one micro-batch (and one transaction) at a time."""
+    while True:
+        try:
+            async with async_session_factory() as session:
+                written = await process_batch(queue, session, batch_size, batch_wait)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to write a batch of queued claims")
+            await asyncio.sleep(QUEUE_POLL_INTERVAL_SECONDS)
+            continue
+        if written:
+            logger.info("Wrote %d queued claims", written)
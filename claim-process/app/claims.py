@@ -0,0 +1,304 @@
+import enum
+import hashlib
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import AsyncIterator, Iterable
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+try:
+    from app.app_types import ClaimPayload, ClaimPayloadList
+    from app.heavy_hitters import live_top_providers
+    from app.leaderboard import record_committed_fees
+    from app.response_cache import response_cache
+    from app.metrics import DB_COMMIT_SECONDS, VALIDATION_SECONDS
+    from app.models import Claim, IdempotencyKey
+except ModuleNotFoundError:
+    from app_types import ClaimPayload, ClaimPayloadList
+    from heavy_hitters import live_top_providers
+    from leaderboard import record_committed_fees
+    from response_cache import response_cache
+    from metrics import DB_COMMIT_SECONDS, VALIDATION_SECONDS
+    from models import Claim, IdempotencyKey
+
+# Number of claims written per multi-row INSERT and committed together
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# Namespace of the claim ids derived from Idempotency-Key headers
+IDEMPOTENCY_NAMESPACE = uuid.UUID("6f1c1b9e-8d5e-4f3a-9a53-1c0e8f7b2d41")
+# Longest Idempotency-Key accepted
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_KEY_CONFLICT = "Idempotency-Key was already used for a different claim"
+# Bulk rows are keyed "bulk:<key>:<index>"; single claims may not use the prefix, so the two never collide
+BULK_KEY_PREFIX = "bulk:"
+IDEMPOTENCY_KEY_RESERVED = f"Idempotency-Key may not start with {BULK_KEY_PREFIX!r}"
+
+# What reserve_idempotency_keys found for each row
+KEY_NEW = "new"
+KEY_REPLAYED = "replayed"
+KEY_CONFLICT = "conflict"
+
+# Content types treated as newline-delimited JSON by the bulk endpoint
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
+
+
+def compute_net_fee(payload: ClaimPayload) -> Decimal:
+    """Calculate the net fee of a single claim."""
+    return payload.provider_fees + payload.member_coinsurance + payload.member_copay - payload.allowed_fees
+
+
+def idempotent_claim_id(idempotency_key: str) -> uuid.UUID:
+    """Claim id derived from a client's Idempotency-Key: a retried request maps to the same row."""
+    return uuid.uuid5(IDEMPOTENCY_NAMESPACE, idempotency_key)
+
+
+def bulk_row_key(idempotency_key: str, index: int) -> str:
+    """Key recorded for row `index` of a bulk request sent with `idempotency_key`."""
+    return f"{BULK_KEY_PREFIX}{idempotency_key}:{index}"
+
+
+def build_claim_rows(payloads: Iterable[ClaimPayload], ids: Iterable[uuid.UUID] | None = None) -> list[dict]:
+    """Turn validated payloads into rows ready for a multi-row INSERT.
+
+    The id is generated here (client side) so the rows can be written without
+    reading anything back from the database. Pass `ids` (see
+    idempotent_claim_id) to make the inserts idempotent.
+    """
+    ids = iter(ids) if ids is not None else None
+    return [
+        {
+            "id": next(ids) if ids is not None else uuid.uuid4(),
+            **payload.model_dump(),
+            "net_fee": compute_net_fee(payload),
+        }
+        for payload in payloads
+    ]
+
+
+def canonical_value(value) -> str:
+    if isinstance(value, Decimal):
+        # 150, 150.0 and 150.00 are the same amount
+        return format(value.normalize(), "f")
+    if isinstance(value, enum.Enum):
+        return str(value.value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def claim_digest(row: dict) -> bytes:
+    """Digest of a claim's content (everything but its id), stored with its Idempotency-Key."""
+    content = "\x1f".join(f"{field}={canonical_value(row[field])}" for field in sorted(row) if field != "id")
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+async def reserve_idempotency_keys(session: AsyncSession, keyed_rows: list[tuple[str, dict]]) -> list[str]:
+    """Record the Idempotency-Key of each row, in the transaction that inserts the claims.
+
+    idempotency_keys is keyed on the key alone, so a retry collides with the
+    first attempt even when it changed the service date (part of the claim's
+    primary key). A request racing another one with the same key waits here
+    until the first one commits. Returns, for each row, KEY_NEW (insert it),
+    KEY_REPLAYED (stored by an earlier attempt with the same content) or
+    KEY_CONFLICT (the key was used for a different claim).
+    """
+    digests = [claim_digest(row) for _, row in keyed_rows]
+    first: dict[str, int] = {}
+    for position, (key, _) in enumerate(keyed_rows):
+        first.setdefault(key, position)
+    statement = insert(IdempotencyKey).on_conflict_do_nothing().returning(IdempotencyKey.key)
+    params = [
+        {"key": key, "claim_id": keyed_rows[position][1]["id"],
+         "service_date": keyed_rows[position][1]["service_date"], "payload_hash": digests[position]}
+        for key, position in first.items()
+    ]
+    reserved = set((await session.exec(statement, params=params)).scalars())
+
+    stored = {key: digests[position] for key, position in first.items() if key in reserved}
+    if len(stored) < len(first):
+        existing = select(IdempotencyKey.key, IdempotencyKey.payload_hash).where(
+            IdempotencyKey.key.in_([key for key in first if key not in reserved])
+        )
+        stored.update((await session.exec(existing)).all())
+
+    statuses = []
+    for position, (key, _) in enumerate(keyed_rows):
+        if key in reserved and first[key] == position:
+            statuses.append(KEY_NEW)
+        elif stored[key] == digests[position]:
+            statuses.append(KEY_REPLAYED)
+        else:
+            statuses.append(KEY_CONFLICT)
+    return statuses
+
+
+def stored_claim_matches(claim: Claim, row: dict) -> bool:
+    """True when a stored claim holds the same data as a row built from a request."""
+    return all(getattr(claim, field) == value for field, value in row.items())
+
+
+def claim_response(row: dict) -> dict:
+    """Response body for a stored (or queued) claim, built without re-reading it."""
+    return {**row, "id": str(row["id"])}
+
+
+def fees_by_provider(rows: Iterable[dict]) -> dict[str, Decimal]:
+    """Sum the net fee of the rows per provider."""
+    fees = defaultdict(Decimal)
+    for row in rows:
+        fees[row["provider_npi"]] += row["net_fee"]
+    return fees
+
+
+async def insert_claim_rows(session: AsyncSession, rows: list[dict]) -> list[dict]:
+    """Write the rows with a single executemany, batched into multi-row VALUES by SQLAlchemy.
+
+    Rows whose (id, service_date) already exists are skipped (ON CONFLICT DO
+    NOTHING): claims stored under an Idempotency-Key before idempotency_keys
+    existed are only recognized that way. Returns the rows actually inserted.
+    """
+    if not rows:
+        return []
+    statement = insert(Claim).on_conflict_do_nothing().returning(Claim.id)
+    inserted = set((await session.exec(statement, params=rows)).scalars())
+    return [row for row in rows if row["id"] in inserted]
+
+
+def is_ndjson(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+def parse_json_array(body: bytes) -> list:
+    """Parse a JSON array body; raises ValueError when it is not an array."""
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Request body must be a JSON array of claims")
+    return items
+
+
+async def iter_ndjson_lines(chunks) -> AsyncIterator[bytes]:
+    """Split an async stream of byte chunks into non-empty NDJSON lines."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def validate_claim(index: int, item) -> tuple[ClaimPayload | None, dict | None]:
+    """Validate one raw claim, returning either the payload or a row error."""
+    try:
+        with VALIDATION_SECONDS.time():
+            if isinstance(item, (bytes, str)):
+                return ClaimPayload.model_validate_json(item), None
+            return ClaimPayload.model_validate(item), None
+    except ValidationError as e:
+        return None, {"index": index, "errors": e.errors(include_url=False)}
+
+
+def validate_claim_batch(body: bytes) -> list[ClaimPayload] | None:
+    """Validate a JSON array body in a single pass, straight from the raw bytes.
+
+    Returns None when any row is invalid (or the body is not an array); the
+    caller then falls back to validate_claim row by row to report the errors.
+    """
+    try:
+        with VALIDATION_SECONDS.time():
+            return ClaimPayloadList.validate_json(body)
+    except ValidationError:
+        return None
+
+
+class BulkClaimWriter:
+    """Accumulate validated claims and flush them to the database in chunks.
+
+    Every chunk is written with one multi-row INSERT and one commit. A chunk
+    that fails in the database is rolled back and reported row by row without
+    affecting the chunks before or after it.
+    """
+
+    def __init__(self, session: AsyncSession, chunk_size: int = BULK_CHUNK_SIZE, idempotency_key: str | None = None):
+        self.session = session
+        self.chunk_size = chunk_size
+        # Row `index` of a keyed request gets the id of its bulk_row_key
+        self.idempotency_key = idempotency_key
+        self.pending: list[tuple[int, ClaimPayload]] = []
+        self.accepted: list[dict] = []
+        self.errors: list[dict] = []
+        self.replayed = 0
+
+    async def add(self, index: int, item) -> None:
+        payload, error = validate_claim(index, item)
+        if error is not None:
+            self.errors.append(error)
+            return
+        await self.add_valid(index, payload)
+
+    async def add_valid(self, index: int, payload: ClaimPayload) -> None:
+        """Queue a claim that was already validated (see validate_claim_batch)."""
+        self.pending.append((index, payload))
+        if len(self.pending) >= self.chunk_size:
+            await self.flush()
+
+    def reject(self, index: int, message: str) -> None:
+        self.errors.append({"index": index, "errors": [{"type": "value_error", "msg": message}]})
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        indexes = [index for index, _ in self.pending]
+        keys = ids = None
+        if self.idempotency_key is not None:
+            keys = [bulk_row_key(self.idempotency_key, index) for index in indexes]
+            ids = [idempotent_claim_id(key) for key in keys]
+        rows = build_claim_rows((payload for _, payload in self.pending), ids)
+        self.pending = []
+        statuses = [KEY_NEW] * len(rows)
+        try:
+            with DB_COMMIT_SECONDS.time():
+                if keys is not None:
+                    statuses = await reserve_idempotency_keys(self.session, list(zip(keys, rows)))
+                inserted = await insert_claim_rows(
+                    self.session, [row for row, status in zip(rows, statuses) if status == KEY_NEW]
+                )
+                await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            for index in indexes:
+                self.reject(index, str(e))
+            return
+        await record_committed_fees(self.session, fees_by_provider(inserted))
+        live_top_providers.add_rows(inserted)
+        if inserted:
+            response_cache.bump("claims")
+        inserted_ids = {row["id"] for row in inserted}
+        for index, row, status in zip(indexes, rows, statuses):
+            if status == KEY_CONFLICT:
+                self.reject(index, IDEMPOTENCY_KEY_CONFLICT)
+                continue
+            claim = {"index": index, "id": str(row["id"])}
+            if row["id"] not in inserted_ids:
+                # Written by an earlier attempt of the same request
+                claim["replayed"] = True
+                self.replayed += 1
+            self.accepted.append(claim)
+
+    async def result(self) -> dict:
+        await self.flush()
+        return {
+            "inserted": len(self.accepted) - self.replayed,
+            "replayed": self.replayed,
+            "failed": len(self.errors),
+            "claims": self.accepted,
+            "errors": sorted(self.errors, key=lambda error: error["index"]),
+        }
@@ -0,0 +1,133 @@
+"""Command-line entry points for maintenance jobs.
+
+Run them from the `app` directory, e.g.:
+
+    python cli.py backfill-provider-totals
+    python cli.py worker
+    python cli.py create-claim-partitions
+    python cli.py compact-daily-summary
+    python cli.py ingest-file claims.csv
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+
+from sqlmodel import Session
+try:
+    from app.claim_queue import QUEUE_BATCH_SIZE, QUEUE_BATCH_WAIT_SECONDS, InMemoryClaimQueue, get_claim_queue, run_worker
+    from app.database import engine
+    from app.ingest import INGEST_CHUNK_SIZE, ingest_file
+    from app.partitions import CLAIM_PARTITIONS_AHEAD, detach_claim_partition, ensure_claim_partitions
+    from app.rollups import backfill_provider_totals
+    from app.summaries import COMPACTION_INTERVAL_SECONDS, compact_daily_summary, run_compaction_worker
+except ModuleNotFoundError:
+    from claim_queue import QUEUE_BATCH_SIZE, QUEUE_BATCH_WAIT_SECONDS, InMemoryClaimQueue, get_claim_queue, run_worker
+    from database import engine
+    from ingest import INGEST_CHUNK_SIZE, ingest_file
+    from partitions import CLAIM_PARTITIONS_AHEAD, detach_claim_partition, ensure_claim_partitions
+    from rollups import backfill_provider_totals
+    from summaries import COMPACTION_INTERVAL_SECONDS, compact_daily_summary, run_compaction_worker
+
+
+def run_backfill_provider_totals(args):
+    with Session(engine) as session:
+        providers = backfill_provider_totals(session)
+    print(f"Rebuilt provider_totals for {providers} providers")
+
+
+def run_claim_worker(args):
+    queue = get_claim_queue()
+    if isinstance(queue, InMemoryClaimQueue):
+        raise SystemExit("The in-memory queue is drained inside the API process; use CLAIM_QUEUE_BACKEND=postgres")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(queue, args.batch_size, args.batch_wait))
+
+
+def parse_month(value: str) -> date:
+    """Parse a YYYY-MM argument into the first day of that month."""
+    return date.fromisoformat(f"{value}-01")
+
+
+def run_create_claim_partitions(args):
+    with Session(engine) as session:
+        created = ensure_claim_partitions(session, ahead=args.months_ahead, since=args.since)
+    print(f"Created {len(created)} claim partitions: {', '.join(created) or '-'}")
+
+
+def run_detach_claim_partition(args):
+    with Session(engine) as session:
+        name = detach_claim_partition(session, args.month)
+    print(f"Detached {name}; it is now a standalone table ready to be archived")
+
+
+def run_compact_daily_summary(args):
+    if args.once:
+        with Session(engine) as session:
+            rows = compact_daily_summary(session)
+        print(f"Compacted new claims into {rows} daily summary rows")
+        return
+    logging.basicConfig(level=logging.INFO)
+    run_compaction_worker(lambda: Session(engine), args.interval)
+
+
+def print_ingest_progress(report):
+    print(f"{report.loaded} claims loaded, {report.rejected} rejected, {report.rows_per_second:.0f} rows/s", flush=True)
+
+
+def run_ingest_file(args):
+    report = ingest_file(engine, args.path, job=args.job, rejects_path=args.rejects, chunk_size=args.chunk_size,
+                         workers=args.workers, input_format=args.format, progress=print_ingest_progress)
+    if report.skipped:
+        print(f"Resumed after row {report.skipped}, already loaded by an earlier run")
+    print(f"Loaded {report.loaded} claims and rejected {report.rejected} in {report.seconds:.1f} s: "
+          f"{report.rows_per_second:.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="claim-process maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill-provider-totals", help="rebuild provider_totals from the claim table")
+    backfill.set_defaults(func=run_backfill_provider_totals)
+
+    worker = subparsers.add_parser("worker", help="write queued claims to the database in micro-batches")
+    worker.add_argument("--batch-size", type=int, default=QUEUE_BATCH_SIZE, help="maximum claims per transaction")
+    worker.add_argument("--batch-wait", type=float, default=QUEUE_BATCH_WAIT_SECONDS,
+                        help="maximum seconds spent filling a batch")
+    worker.set_defaults(func=run_claim_worker)
+
+    partitions = subparsers.add_parser("create-claim-partitions",
+                                       help="create the monthly claim partitions ahead of time")
+    partitions.add_argument("--months-ahead", type=int, default=CLAIM_PARTITIONS_AHEAD,
+                            help="future months to create partitions for")
+    partitions.add_argument("--since", type=parse_month, metavar="YYYY-MM",
+                            help="also create the partitions of past months (moving their rows out of claim_default)")
+    partitions.set_defaults(func=run_create_claim_partitions)
+
+    detach = subparsers.add_parser("detach-claim-partition", help="detach a monthly claim partition for archival")
+    detach.add_argument("month", type=parse_month, metavar="YYYY-MM")
+    detach.set_defaults(func=run_detach_claim_partition)
+
+    compact = subparsers.add_parser("compact-daily-summary",
+                                    help="fold new claims into provider_daily_summary, every --interval seconds")
+    compact.add_argument("--interval", type=float, default=COMPACTION_INTERVAL_SECONDS,
+                         help="seconds between two compaction runs")
+    compact.add_argument("--once", action="store_true", help="run a single compaction and exit")
+    compact.set_defaults(func=run_compact_daily_summary)
+
+    ingest = subparsers.add_parser("ingest-file", help="load a CSV or NDJSON file of claims with COPY, resumably")
+    ingest.add_argument("path", help="CSV file with a header row, or NDJSON file (.ndjson/.jsonl)")
+    ingest.add_argument("--format", choices=("csv", "ndjson"), help="input format (default: from the file extension)")
+    ingest.add_argument("--rejects", help="NDJSON file receiving the invalid rows (default: <path>.rejects.ndjson)")
+    ingest.add_argument("--job", help="checkpoint name, to resume a file that moved (default: the absolute path of the file)")
+    ingest.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="rows per COPY and commit")
+    ingest.add_argument("--workers", type=int, help="validation processes (default: one per CPU)")
+    ingest.set_defaults(func=run_ingest_file)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
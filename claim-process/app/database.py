@@ -1,23 +1,338 @@
+import asyncio
+import functools
+import logging
 import os
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+try:
+    from app.metrics import (
+        POOL_CHECKOUT_SECONDS, READ_SESSIONS, REPLICA_LAG_SECONDS, SLOW_QUERIES, count_sql_statement, pool_collector
+    )
+except ModuleNotFoundError:
+    from metrics import (
+        POOL_CHECKOUT_SECONDS, READ_SESSIONS, REPLICA_LAG_SECONDS, SLOW_QUERIES, count_sql_statement, pool_collector
+    )
+
+logger = logging.getLogger(__name__)
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean environment variable ("1", "true", "yes" or "on")."""
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
 
 # Fetch database credentials from environment variables
 DATABASE_USER = os.getenv("POSTGRES_USER", "user")
 DATABASE_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 DATABASE_NAME = os.getenv("POSTGRES_DB", "dbname")
 DATABASE_HOST = os.getenv("POSTGRES_HOST", "db")  # Default to the service name in Docker Compose
+# Read replica serving the read-only endpoints; defaults to the primary itself
+DATABASE_READ_HOST = os.getenv("POSTGRES_READ_HOST", DATABASE_HOST)
+# Reads go back to the primary while the replica lags more than this (or cannot be reached)
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# How long a replica lag measurement is trusted before it is checked again
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+# Connection pool settings (per engine and per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))  # Seconds before a connection is replaced, -1 never
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 disables the timeout
+# Set when an external pooler such as PgBouncer (transaction mode) sits in front of
+# Postgres: connections are not pooled in-process and no prepared statements are kept.
+DB_EXTERNAL_POOLER = env_flag("DB_EXTERNAL_POOLER")
+# Statements slower than this are logged with their bind parameters; 0 leaves the hooks out
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Share of the slow SELECTs run again under EXPLAIN (ANALYZE, BUFFERS) to log their plan
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0"))
+# Longest statement or parameter list written to the log, in characters
+SLOW_QUERY_LOG_MAX_CHARS = int(os.getenv("SLOW_QUERY_LOG_MAX_CHARS", "2000"))
 
-# Construct the database URL
+# Alembic scripts, whose head revision is the schema the models expect
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Construct the database URLs
 DATABASE_URL = f"postgresql+psycopg2://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}/{DATABASE_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}/{DATABASE_NAME}"
+ASYNC_READ_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_READ_HOST}/{DATABASE_NAME}"
+
+
+class InstrumentedPoolMixin:
+    """Record how long each checkout waits for a connection."""
+
+    def connect(self):
+        start = time.perf_counter()
+        connection = super().connect()
+        POOL_CHECKOUT_SECONDS.labels(self.logging_name).observe(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(name: str, poolclass) -> dict:
+    """Engine keyword arguments for the configured pooling mode."""
+    if DB_EXTERNAL_POOLER:
+        return {"poolclass": NullPool, "pool_logging_name": name}
+    return {
+        "poolclass": poolclass,
+        "pool_logging_name": name,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def sync_connect_args() -> dict:
+    # Startup options are rejected by PgBouncer; set statement_timeout on the role instead
+    if DB_STATEMENT_TIMEOUT_MS and not DB_EXTERNAL_POOLER:
+        return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def async_connect_args() -> dict:
+    args = {}
+    if DB_STATEMENT_TIMEOUT_MS and not DB_EXTERNAL_POOLER:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    if DB_EXTERNAL_POOLER:
+        # Prepared statements do not survive transaction pooling: disable asyncpg's and
+        # SQLAlchemy's statement caches and give the statements asyncpg still prepares
+        # unique names.
+        args["statement_cache_size"] = 0
+        args["prepared_statement_cache_size"] = 0
+        args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    return args
+
+
+# Create the engines: the synchronous one is used by migrations, scripts and tests,
+# the asynchronous one by the request handlers so they never block the event loop.
+engine = create_engine(
+    DATABASE_URL, connect_args=sync_connect_args(), **pool_options("primary", InstrumentedQueuePool)
+)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=async_connect_args(),
+    **pool_options("primary_async", InstrumentedAsyncAdaptedQueuePool),
+)
+# With a replica, the read-only endpoints use their own engine, so read bursts do not
+# take the primary's connections nor its CPU. Without one they share the primary's
+# engine: a second pool would only double the connections to the same server.
+REPLICA_CONFIGURED = DATABASE_READ_HOST != DATABASE_HOST
+if REPLICA_CONFIGURED:
+    read_async_engine = create_async_engine(
+        ASYNC_READ_DATABASE_URL,
+        connect_args=async_connect_args(),
+        **pool_options("replica_async", InstrumentedAsyncAdaptedQueuePool),
+    )
+else:
+    read_async_engine = async_engine
+# Each distinct engine once: listeners registered twice would count every statement twice
+instrumented_engines = {"primary": engine, "primary_async": async_engine.sync_engine}
+if REPLICA_CONFIGURED:
+    instrumented_engines["replica_async"] = read_async_engine.sync_engine
+for name, instrumented_engine in instrumented_engines.items():
+    pool_collector.register(name, instrumented_engine)
+    event.listen(instrumented_engine, "before_cursor_execute", count_sql_statement)
+
+
+def shorten(value: str, max_chars: int = SLOW_QUERY_LOG_MAX_CHARS) -> str:
+    value = " ".join(value.split())
+    return value if len(value) <= max_chars else f"{value[:max_chars]}... ({len(value)} characters)"
+
+
+def is_explainable(statement: str) -> bool:
+    """Plain SELECTs only: EXPLAIN ANALYZE runs the statement again.
+
+    Locking reads (FOR UPDATE) would lock more rows and SELECT INTO would create a table.
+    """
+    words = statement.upper().split()
+    return bool(words) and words[0] == "SELECT" and not {"FOR", "INTO"} & set(words)
+
+
+class SlowQueryLog:
+    """Cursor execution listeners logging the statements slower than `threshold_ms`, with their parameters.
+
+    A sampled share of the slow SELECTs is executed again under EXPLAIN
+    (ANALYZE, BUFFERS), in a savepoint of the same transaction, and its plan is
+    logged as well: a query the planner moved to a sequential scan shows up
+    with the scan in the log. Each explained query runs twice, so keep the
+    sample rate low. The parameters are claim data: enable this where the
+    logs may hold it.
+    """
 
-# Create the engine
-engine = create_engine(DATABASE_URL)
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain_sample_rate: float = SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+                 sample=random.random):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.sample = sample
+
+    def attach(self, engine) -> None:
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def detach(self, engine) -> None:
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        # On the execution context: a statement that fails leaves nothing behind
+        context.slow_query_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed_ms = (time.perf_counter() - context.slow_query_start) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        SLOW_QUERIES.labels(conn.engine.pool.logging_name).inc()
+        logger.warning("Slow query (%.1f ms): %s Parameters: %s", elapsed_ms, shorten(statement), shorten(repr(parameters)))
+        if (not executemany and self.explain_sample_rate and self.sample() < self.explain_sample_rate
+                and is_explainable(statement)):
+            plan = self.explain(conn, statement, parameters)
+            if plan is not None:
+                logger.warning("Plan of the slow query (%.1f ms):\n%s", elapsed_ms, plan)
+
+    def explain(self, conn, statement, parameters) -> str | None:
+        """EXPLAIN (ANALYZE, BUFFERS) on the same connection; None if it fails (the transaction is kept)."""
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                plan = "\n".join(line for line, in cursor.fetchall())
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            logger.debug("Could not explain the slow query: %s", e)
+            return None
+        finally:
+            cursor.close()
+
+
+slow_query_log = SlowQueryLog()
+if SLOW_QUERY_MS > 0:
+    for instrumented_engine in instrumented_engines.values():
+        slow_query_log.attach(instrumented_engine)
+
+# Objects stay usable after commit so handlers can build responses without a reload
+async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+read_session_factory = async_sessionmaker(read_async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Seconds since the last replayed transaction, 0 when the replica has replayed all
+# the WAL it received (an idle primary writes nothing new) or is not a replica at all
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaMonitor:
+    """Decide whether reads may go to the replica, from its lag measured at most every `check_seconds`."""
+
+    def __init__(self, engine, max_lag: float = REPLICA_MAX_LAG_SECONDS, check_seconds: float = REPLICA_LAG_CHECK_SECONDS,
+                 timeout: float = 1.0, clock=time.monotonic):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_seconds = check_seconds
+        # A replica that does not answer in time counts as unreachable: the request waits at most this long
+        self.timeout = timeout
+        self.clock = clock
+        self.lag: float | None = None
+        self.checked_at: float | None = None
+
+    async def query_lag(self) -> float:
+        async with self.engine.connect() as connection:
+            return float((await connection.execute(REPLICA_LAG_QUERY)).scalar())
+
+    async def measure_lag(self) -> float | None:
+        """Current lag in seconds, None when the replica cannot be reached within `timeout`."""
+        try:
+            return await asyncio.wait_for(self.query_lag(), self.timeout)
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+            logger.debug("Replica lag check failed: %s", e)
+            return None
+
+    def is_usable(self) -> bool:
+        return self.lag is not None and self.lag <= self.max_lag
+
+    async def use_replica(self) -> bool:
+        now = self.clock()
+        if self.checked_at is None or now - self.checked_at >= self.check_seconds:
+            # Set first, so concurrent requests do not all check at once
+            self.checked_at = now
+            was_usable = self.is_usable()
+            self.lag = await self.measure_lag()
+            if self.lag is not None:
+                REPLICA_LAG_SECONDS.set(self.lag)
+            if was_usable and not self.is_usable():
+                logger.warning("Reading from the primary: the replica %s",
+                               "cannot be reached" if self.lag is None else f"lags {self.lag:.1f}s")
+        return self.is_usable()
+
+
+replica_monitor = ReplicaMonitor(read_async_engine)
+
+@functools.cache
+def migration_heads() -> frozenset[str]:
+    """Head revisions of the Alembic scripts (parsed once per process)."""
+    return frozenset(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+
+def migrations_at_head(bind=None) -> bool:
+    """Whether the database is stamped with the latest Alembic revision."""
+    with (bind or engine).connect() as connection:
+        return frozenset(MigrationContext.configure(connection).get_current_heads()) == migration_heads()
 
 def init_db():
-    """Initialize the database by creating all tables."""
+    """Create the tables, unless Alembic manages the schema and it is up to date.
+
+    The check is a single query; create_all looks up every table and index first.
+    """
+    if migrations_at_head():
+        return
     SQLModel.metadata.create_all(engine)
 
 def get_session():
     """Provide a session for interacting with the database."""
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    """Provide an asynchronous session for the request handlers."""
+    async with async_session_factory() as session:
+        yield session
+
+@asynccontextmanager
+async def read_session():
+    """Session for read-only work: on the replica, or on the primary while the replica lags (or without one)."""
+    target = "replica" if REPLICA_CONFIGURED and await replica_monitor.use_replica() else "primary"
+    READ_SESSIONS.labels(target).inc()
+    factory = read_session_factory if target == "replica" else async_session_factory
+    async with factory() as session:
+        yield session
+
+async def get_read_session():
+    """Provide a read-only session for the analytical endpoints (see read_session)."""
+    async with read_session() as session:
+        yield session
@@ -0,0 +1,48 @@
+"""Production server: gunicorn supervising uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Settings come from environment variables (WEB_CONCURRENCY, BIND, ...). Run
+`alembic upgrade head` first: the workers then skip create_all at startup.
+"""
+import gc
+import multiprocessing
+import os
+
+from uvicorn_worker import UvicornWorker
+
+
+class ClaimProcessWorker(UvicornWorker):
+    # Fail at startup if uvloop or httptools is missing instead of silently using asyncio/h11
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# One worker per CPU unless told otherwise
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = ClaimProcessWorker
+# Import the app once, in the master: the workers fork with it loaded, start
+# faster and share its (read-only) memory pages
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Access logs are left to the metrics middleware; enable them with ACCESS_LOG=-
+accesslog = os.getenv("ACCESS_LOG")
+
+
+def when_ready(server):
+    # Keep the objects of the preloaded app out of the garbage collector's reach, so
+    # collections in the workers do not write to (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections pooled before the fork would be shared by every worker: drop them
+    try:
+        from app.database import async_engine, engine, read_async_engine
+    except ModuleNotFoundError:
+        from database import async_engine, engine, read_async_engine
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    # The same engine as async_engine when no replica is configured: disposing it again is harmless
+    read_async_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,194 @@
+"""Live top providers by net fee over sliding windows (last minute, 5 minutes, hour).
+
+Every accepted claim adds its net fee to one Space-Saving summary per window.
+A window is a ring of LIVE_BUCKETS_PER_WINDOW time buckets, each with its own
+summary of at most `capacity` providers, and a read merges the buckets still
+inside the window. The window therefore slides by one bucket at a time (10
+seconds for 5m), and memory is bounded by windows x buckets x capacity counters
+however many distinct providers send claims.
+
+Error bounds. A bucket summary that is full evicts its smallest counter (its
+*floor*) for a new provider, which inherits that count. For every provider,
+`estimate - floor_sum <= true total <= estimate`, where `floor_sum` is the sum
+of the bucket floors of the window. Because the smallest of `capacity` counters
+is at most their average, `floor_sum <= window total / capacity`. Hence:
+
+* a provider's `total_net_fee` overestimates its true total by at most its
+  `max_error` (a per-provider bound, at most the window's `max_error`);
+* every provider whose true total exceeds the window's `max_error` is listed in
+  the ranking (before the `limit` cut).
+
+With the default capacity of 1000, the totals are within 0.1% of the window's
+net fees. Claims with a net fee of zero or less are not counted (Space-Saving
+needs positive weights), so a provider with negative net fees in the window is
+overestimated by their sum as well. The counters live in the process that
+accepted the claims: each API worker ranks its own share of the traffic.
+"""
+import heapq
+import os
+import time
+from collections import deque
+from decimal import Decimal
+from typing import Callable
+
+# Counters per bucket summary; the totals are within 1/capacity of the window's net fees
+LIVE_TOP_CAPACITY = int(os.getenv("LIVE_TOP_CAPACITY", "1000"))
+# How long a merged ranking is served before the buckets are merged again
+LIVE_TOP_REFRESH_SECONDS = float(os.getenv("LIVE_TOP_REFRESH_SECONDS", "1"))
+# Buckets per window: the window slides by 1/LIVE_BUCKETS_PER_WINDOW of its length
+LIVE_BUCKETS_PER_WINDOW = 30
+# Providers ranked per window, the largest limit of GET /top-providers/live
+LIVE_TOP_RANKED = 100
+# Windows of GET /top-providers/live, in seconds
+LIVE_WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+class SpaceSaving:
+    """Weighted Space-Saving summary: the heaviest keys of a stream with at most `capacity` counters."""
+
+    __slots__ = ("capacity", "counts", "errors", "heap", "total")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[str, float] = {}
+        # Count inherited from the evicted counter when the key was (re)admitted
+        self.errors: dict[str, float] = {}
+        # (count, key) entries; outdated ones are skipped lazily and dropped at 2 x capacity
+        self.heap: list[tuple[float, str]] = []
+        self.total = 0.0
+
+    def add(self, key: str, weight: float) -> None:
+        if weight <= 0:
+            return
+        self.total += weight
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0.0
+        else:
+            floor, victim = self.pop_min()
+            del counts[victim], self.errors[victim]
+            counts[key] = floor + weight
+            self.errors[key] = floor
+        heapq.heappush(self.heap, (counts[key], key))
+        if len(self.heap) > 2 * self.capacity:
+            self.heap = [(count, key) for key, count in counts.items()]
+            heapq.heapify(self.heap)
+
+    def pop_min(self) -> tuple[float, str]:
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    def floor(self) -> float:
+        """Upper bound of the count of any key that is not monitored."""
+        if len(self.counts) < self.capacity:
+            return 0.0
+        while self.counts.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+
+class SlidingTopK:
+    """Space-Saving summaries over the time buckets of one sliding window."""
+
+    def __init__(self, window_seconds: float, capacity: int = LIVE_TOP_CAPACITY,
+                 buckets: int = LIVE_BUCKETS_PER_WINDOW, refresh_seconds: float = LIVE_TOP_REFRESH_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.capacity = capacity
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        # (bucket number, summary), oldest first
+        self.ring: deque[tuple[int, SpaceSaving]] = deque()
+        self.ranking: dict | None = None
+        self.ranked_at = 0.0
+
+    def current_bucket(self) -> int:
+        return int(self.clock() // self.bucket_seconds)
+
+    def expire(self, bucket: int) -> None:
+        while self.ring and self.ring[0][0] <= bucket - self.buckets:
+            self.ring.popleft()
+
+    def add(self, key: str, weight: float) -> None:
+        bucket = self.current_bucket()
+        if not self.ring or self.ring[-1][0] != bucket:
+            self.expire(bucket)
+            self.ring.append((bucket, SpaceSaving(self.capacity)))
+        self.ring[-1][1].add(key, weight)
+
+    def top(self) -> dict:
+        """The merged ranking of the window, recomputed at most every `refresh_seconds`.
+
+        Returns the window's total, its error bound and the LIVE_TOP_RANKED
+        heaviest providers as (provider, estimate, max_error).
+        """
+        now = self.clock()
+        if self.ranking is None or now - self.ranked_at >= self.refresh_seconds:
+            self.ranking = self.merge()
+            self.ranked_at = now
+        return self.ranking
+
+    def merge(self) -> dict:
+        self.expire(self.current_bucket())
+        floors = [summary.floor() for _, summary in self.ring]
+        floor_sum = sum(floors)
+        # Per key, the sum over the buckets monitoring it of (count - floor): a bucket
+        # not monitoring the key may still hide up to its floor of it
+        above_floor: dict[str, float] = {}
+        for (_, summary), floor in zip(self.ring, floors):
+            for key, count in summary.counts.items():
+                above_floor[key] = above_floor.get(key, floor_sum) + count - floor
+        top = heapq.nsmallest(LIVE_TOP_RANKED, above_floor.items(), key=lambda item: (-item[1], item[0]))
+
+        rows = []
+        for key, estimate in top:
+            guaranteed = sum(
+                summary.counts[key] - summary.errors[key] for _, summary in self.ring if key in summary.counts
+            )
+            rows.append((key, estimate, estimate - guaranteed))
+        total = sum(summary.total for _, summary in self.ring)
+        return {"total_net_fee": total, "max_error": floor_sum, "top_providers": rows}
+
+
+class LiveTopProviders:
+    """One sliding top-K per window of LIVE_WINDOWS, fed with the accepted claims."""
+
+    def __init__(self, windows: dict[str, float] = LIVE_WINDOWS, **options):
+        self.windows = {name: SlidingTopK(seconds, **options) for name, seconds in windows.items()}
+
+    def add(self, provider_npi: str, net_fee: Decimal | float) -> None:
+        weight = float(net_fee)
+        for window in self.windows.values():
+            window.add(provider_npi, weight)
+
+    def add_rows(self, rows) -> None:
+        for row in rows:
+            self.add(row["provider_npi"], row["net_fee"])
+
+    def top(self, window: str, limit: int) -> dict:
+        ranking = self.windows[window].top()
+        return {
+            "window": window,
+            "total_net_fee": ranking["total_net_fee"],
+            "max_error": ranking["max_error"],
+            "top_providers": [
+                {"provider_npi": provider_npi, "total_net_fee": estimate, "max_error": max_error}
+                for provider_npi, estimate, max_error in ranking["top_providers"][:limit]
+            ],
+        }
+
+    def clear(self) -> None:
+        for window in self.windows.values():
+            window.ring.clear()
+            window.ranking = None
+
+
+# Process-wide live rankings fed by the claim endpoints
+live_top_providers = LiveTopProviders()
@@ -0,0 +1,158 @@
+import os
+import time
+from decimal import Decimal
+from typing import Callable, Iterable
+
+import orjson
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+try:
+    from app.metrics import DB_QUERY_SECONDS
+    from app.models import ProviderTotal
+    from app.rollups import top_providers_statement
+except ModuleNotFoundError:
+    from metrics import DB_QUERY_SECONDS
+    from models import ProviderTotal
+    from rollups import top_providers_statement
+
+# Number of providers kept in memory and how long before a full reload from the database
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "60"))
+
+
+class LeaderboardCache:
+    """In-memory top-N of `(provider_npi, total_net_fee)`.
+
+    The cache is loaded from provider_totals and then kept current from the
+    claims this process commits, so reads are served without touching the
+    database. Writes made by other processes are picked up by the periodic
+    full reload (`ttl` seconds).
+
+    Invariant: every provider outside the cache has a total lower than or equal
+    to the smallest cached total. Updates that cannot preserve it invalidate
+    the cache instead.
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE, ttl: float = LEADERBOARD_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self) -> None:
+        """Drop the cached entries; the next read reloads from the database."""
+        self.entries: dict[str, Decimal] = {}
+        # True when the cache holds every provider (fewer than `size` exist)
+        self.complete = False
+        self.loaded_at: float | None = None
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and self.clock() - self.loaded_at < self.ttl
+
+    def top(self) -> list[tuple[str, Decimal]] | None:
+        """Return the leaderboard, or None (a miss) when it must be reloaded."""
+        if not self.is_fresh():
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Same order as the database queries: total descending, ties by provider_npi
+        return sorted(self.entries.items(), key=lambda entry: (-entry[1], entry[0]))
+
+    def load(self, rows: Iterable[tuple[str, Decimal]]) -> None:
+        """Replace the cache with the top rows read from the database."""
+        self.entries = dict(rows)
+        self.complete = len(self.entries) < self.size
+        self.loaded_at = self.clock()
+
+    def apply(self, provider_npi: str, net_fee: Decimal) -> bool:
+        """Add a committed claim's net fee when the new total can be derived locally.
+
+        Returns False when the provider is not cached and might now belong in the
+        leaderboard; the caller must then look up its total and call `record`.
+        """
+        if not self.is_fresh():
+            return True
+        if provider_npi in self.entries:
+            self.record(provider_npi, self.entries[provider_npi] + net_fee)
+            return True
+        if self.complete:
+            # Every provider is cached, so an unknown one is new
+            self.record(provider_npi, net_fee)
+            return True
+        # An outside provider can only catch up with the cache if its fee is positive
+        return net_fee <= 0
+
+    def record(self, provider_npi: str, total_net_fee: Decimal) -> None:
+        """Apply the exact, current total of a provider."""
+        if not self.is_fresh():
+            return
+        floor = min(self.entries.values(), default=None)
+
+        if provider_npi in self.entries:
+            if not self.complete and total_net_fee < floor:
+                # A provider outside the cache may now rank above this one
+                self.clear()
+                return
+            self.entries[provider_npi] = total_net_fee
+            return
+
+        if self.complete or floor is None or total_net_fee > floor:
+            self.entries[provider_npi] = total_net_fee
+            if len(self.entries) > self.size:
+                del self.entries[min(self.entries, key=self.entries.get)]
+                self.complete = False
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "fresh": self.is_fresh()}
+
+
+# Process-wide leaderboard used by the endpoints
+leaderboard = LeaderboardCache()
+
+
+async def refresh_leaderboard(session: AsyncSession, cache: LeaderboardCache = leaderboard) -> list[tuple[str, Decimal]]:
+    """Reload the cache from provider_totals and return its entries."""
+    with DB_QUERY_SECONDS.time():
+        rows = (await session.exec(top_providers_statement(cache.size))).all()
+    cache.load(rows)
+    return [tuple(row) for row in rows]
+
+
+async def get_leaderboard(session: AsyncSession, cache: LeaderboardCache = leaderboard) -> list[tuple[str, Decimal]]:
+    """Serve the leaderboard from memory, reloading it on a miss."""
+    rows = cache.top()
+    if rows is None:
+        rows = await refresh_leaderboard(session, cache)
+    return rows
+
+
+async def record_committed_fees(session: AsyncSession, fees: dict[str, Decimal],
+                                cache: LeaderboardCache = leaderboard) -> None:
+    """Feed the net fees (per provider) of a committed transaction into the cache."""
+    unknown = [provider_npi for provider_npi, net_fee in fees.items() if not cache.apply(provider_npi, net_fee)]
+    if not unknown:
+        return
+    statement = select(ProviderTotal.provider_npi, ProviderTotal.total_net_fee).where(
+        ProviderTotal.provider_npi.in_(unknown)
+    )
+    with DB_QUERY_SECONDS.time():
+        totals = (await session.exec(statement)).all()
+    for provider_npi, total_net_fee in totals:
+        cache.record(provider_npi, total_net_fee)
+
+
+def top_providers_json(rows: Iterable[tuple[str, Decimal]], next_cursor: str | None) -> bytes:
+    """Encode a page of (provider_npi, total_net_fee) rows straight into the response body.
+
+    Produces the same JSON as the TopProvidersPage response model, without
+    building and validating a model per row.
+    """
+    return orjson.dumps({
+        "top_providers": [
+            {"provider_npi": provider_npi, "total_net_fee": float(total_net_fee)} for provider_npi, total_net_fee in rows
+        ],
+        "next_cursor": next_cursor,
+    })
@@ -1,112 +1,339 @@
-from fastapi import FastAPI, HTTPException, Depends
+from datetime import date
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 try:
-    from app.app_types import ClaimPayload
-    from app.database import get_session, init_db
-    from app.models import Claim
+    from app.app_types import ClaimPayload, ClaimResponse, LiveTopProviders, SummaryTopProviders, TopProvidersPage, Trend
+    from app.claim_queue import CLAIM_INGESTION_MODE, ClaimQueue, InMemoryClaimQueue, get_claim_queue, row_to_message, run_worker
+    from app.claims import (
+        BULK_KEY_PREFIX, IDEMPOTENCY_KEY_CONFLICT, IDEMPOTENCY_KEY_MAX_LENGTH, IDEMPOTENCY_KEY_RESERVED, KEY_CONFLICT,
+        KEY_NEW, BulkClaimWriter, build_claim_rows, claim_digest, claim_response, idempotent_claim_id,
+        insert_claim_rows, is_ndjson, iter_ndjson_lines, parse_json_array, reserve_idempotency_keys,
+        stored_claim_matches, validate_claim_batch
+    )
+    from app.database import async_session_factory, get_async_session, get_read_session, init_db
+    from app.exports import EXPORT_MEDIA_TYPES, export_claims_statement, stream_claims
+    from app.heavy_hitters import LIVE_TOP_RANKED, LIVE_WINDOWS, live_top_providers
+    from app.leaderboard import get_leaderboard, leaderboard, record_committed_fees, refresh_leaderboard, top_providers_json
+    from app.models import Claim, IdempotencyKey
+    from app.metrics import (
+        DB_COMMIT_SECONDS, DB_QUERY_SECONDS, SERIALIZATION_SECONDS, MetricsMiddleware, TimedJSONResponse, render_metrics
+    )
+    from app.ratelimit import RATE_LIMIT_STORAGE_URI
+    from app.response_cache import ResponseCacheMiddleware, response_cache
+    from app.rollups import MAX_TOP_PROVIDERS_LIMIT, decode_cursor, encode_cursor, filtered_top_providers_statement, top_providers_statement
+    from app.summaries import summary_top_providers_statement, summary_trend_statement
 except ModuleNotFoundError:
-    from app_types import ClaimPayload
-    from database import get_session, init_db
-    from models import Claim
-from sqlalchemy import func
-from sqlmodel import Session
-from contextlib import asynccontextmanager
+    from app_types import ClaimPayload, ClaimResponse, LiveTopProviders, SummaryTopProviders, TopProvidersPage, Trend
+    from claim_queue import CLAIM_INGESTION_MODE, ClaimQueue, InMemoryClaimQueue, get_claim_queue, row_to_message, run_worker
+    from claims import (
+        BULK_KEY_PREFIX, IDEMPOTENCY_KEY_CONFLICT, IDEMPOTENCY_KEY_MAX_LENGTH, IDEMPOTENCY_KEY_RESERVED, KEY_CONFLICT,
+        KEY_NEW, BulkClaimWriter, build_claim_rows, claim_digest, claim_response, idempotent_claim_id,
+        insert_claim_rows, is_ndjson, iter_ndjson_lines, parse_json_array, reserve_idempotency_keys,
+        stored_claim_matches, validate_claim_batch
+    )
+    from database import async_session_factory, get_async_session, get_read_session, init_db
+    from exports import EXPORT_MEDIA_TYPES, export_claims_statement, stream_claims
+    from heavy_hitters import LIVE_TOP_RANKED, LIVE_WINDOWS, live_top_providers
+    from leaderboard import get_leaderboard, leaderboard, record_committed_fees, refresh_leaderboard, top_providers_json
+    from models import Claim, IdempotencyKey
+    from metrics import (
+        DB_COMMIT_SECONDS, DB_QUERY_SECONDS, SERIALIZATION_SECONDS, MetricsMiddleware, TimedJSONResponse, render_metrics
+    )
+    from ratelimit import RATE_LIMIT_STORAGE_URI
+    from response_cache import ResponseCacheMiddleware, response_cache
+    from rollups import MAX_TOP_PROVIDERS_LIMIT, decode_cursor, encode_cursor, filtered_top_providers_statement, top_providers_statement
+    from summaries import summary_top_providers_statement, summary_trend_statement
+from sqlmodel.ext.asyncio.session import AsyncSession
+from contextlib import asynccontextmanager, suppress
+import asyncio
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 from starlette.requests import Request
 
-# Initialize the rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
-# Create an instance of the FastAPI class
-app = FastAPI()
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Initialize the rate limiter; RATE_LIMIT_STORAGE_URI=claimdb:// shares its counters between processes
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE_URI)
+# Rate limit of /top-providers/ per client address: 10 requests per minute, cache hits included
+TOP_PROVIDERS_RATE_LIMIT = "10/minute"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize the database (create tables) on startup
     init_db()
+    # Warm the in-memory leaderboard so the first reads are served from memory
+    async with async_session_factory() as session:
+        await refresh_leaderboard(session)
+
+    # A process-local queue can only be drained by a worker living in this process
+    worker = None
+    if CLAIM_INGESTION_MODE == "queue" and isinstance(get_claim_queue(), InMemoryClaimQueue):
+        worker = asyncio.create_task(run_worker(get_claim_queue()))
     yield
-    # Optionally add shutdown logic here (if needed)
+    if worker is not None:
+        worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker
 
-# Register the lifespan event handler
-app.lifespan = lifespan
+# Create an instance of the FastAPI class and register the lifespan event handler
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Read endpoints are answered from the response cache before any dependency runs, within
+# their rate limits; added first, so that the metrics middleware also times the cache hits
+app.add_middleware(ResponseCacheMiddleware, limiter=limiter, rate_limits={"/top-providers/": TOP_PROVIDERS_RATE_LIMIT})
+app.add_middleware(MetricsMiddleware)
+
+def check_date_range(from_date: date | None, to_date: date | None):
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
 
 # Define the endpoint to get the top 10 provider NPIs by net fees
-@app.get("/top-providers/")
-@limiter.limit("10/minute")  # Rate limit: 10 requests per minute
-async def get_top_providers(request: Request, session: Session = Depends(get_session)):
+@app.get("/top-providers/", response_model=TopProvidersPage)
+@limiter.limit(TOP_PROVIDERS_RATE_LIMIT)
+async def get_top_providers(
+    request: Request,
+    from_date: date | None = Query(None, alias="from", description="First service date included"),
+    to_date: date | None = Query(None, alias="to", description="Last service date included"),
+    plan_group: str | None = Query(None, description="Only count the claims of this plan group"),
+    limit: int = Query(10, ge=1, le=MAX_TOP_PROVIDERS_LIMIT, description="Number of providers per page"),
+    cursor: str | None = Query(None, description="next_cursor of the previous page"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    check_date_range(from_date, to_date)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        # Query to calculate the sum of net_fee for each provider_npi
-        results = (
-            session.query(Claim.provider_npi, func.sum(Claim.net_fee).label("total_net_fee"))
-            .group_by(Claim.provider_npi)
-            .order_by(func.sum(Claim.net_fee).desc())
-            .limit(10)
-            .all()
-        )
-
-        # Prepare the response as a list of dictionaries
-        top_providers = [
-            {"provider_npi": provider_npi, "total_net_fee": total_net_fee}
-            for provider_npi, total_net_fee in results
-        ]
-
-        return {"top_providers": top_providers}
+        if from_date or to_date or plan_group:
+            # Filtered rankings are aggregated from the claims, scanning only the matching partitions
+            statement = filtered_top_providers_statement(from_date, to_date, plan_group, limit, after)
+        elif after is not None or limit > leaderboard.size:
+            # Pages beyond the cached leaderboard are read from the provider_totals rollup
+            statement = top_providers_statement(limit, after)
+        else:
+            statement = None
+
+        if statement is None:
+            # Served from the in-memory leaderboard; reloaded from provider_totals on a miss
+            results = (await get_leaderboard(session))[:limit]
+        else:
+            with DB_QUERY_SECONDS.time():
+                results = (await session.exec(statement)).all()
+
+        # A full page may be followed by another one
+        next_cursor = encode_cursor(results[-1][1], results[-1][0]) if len(results) == limit else None
+
+        # The rows are encoded straight to bytes, skipping the response model round trip
+        with SERIALIZATION_SECONDS.time():
+            body = top_providers_json(results, next_cursor)
+        return Response(content=body, media_type="application/json")
 
     except RateLimitExceeded:
         raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Top providers over the last minutes, for live dashboards, answered from memory
+@app.get("/top-providers/live", response_model=LiveTopProviders)
+async def get_live_top_providers(
+    window: Literal[tuple(LIVE_WINDOWS)] = Query("5m", description="Sliding window: 1m, 5m or 1h"),
+    limit: int = Query(10, ge=1, le=LIVE_TOP_RANKED, description="Number of providers"),
+):
+    """Approximate top providers by net fee over the claims accepted by this process within the window.
+
+    Totals are estimates from Space-Saving summaries (see heavy_hitters.py):
+    each overestimates the true total by at most its `max_error`. The ranking
+    is recomputed at most once per second.
+    """
+    return live_top_providers.top(window, limit)
+
+# Top providers over a date range, answered from the daily summaries only
+@app.get("/summaries/top-providers", response_model=SummaryTopProviders)
+async def get_summary_top_providers(
+    from_date: date | None = Query(None, alias="from", description="First service date included"),
+    to_date: date | None = Query(None, alias="to", description="Last service date included"),
+    plan_group: str | None = Query(None, description="Only count the claims of this plan group"),
+    limit: int = Query(10, ge=1, le=MAX_TOP_PROVIDERS_LIMIT, description="Number of providers"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Rank providers from provider_daily_summary; claims newer than the last compaction are not included yet."""
+    check_date_range(from_date, to_date)
+    with DB_QUERY_SECONDS.time():
+        results = (await session.exec(summary_top_providers_statement(from_date, to_date, plan_group, limit))).all()
+    return {"top_providers": [
+        {"provider_npi": provider_npi, "total_net_fee": total_net_fee, "claim_count": claim_count}
+        for provider_npi, total_net_fee, claim_count in results
+    ]}
+
+# Net fee trend per day, week or month, answered from the daily summaries only
+@app.get("/summaries/trend", response_model=Trend)
+async def get_summary_trend(
+    from_date: date | None = Query(None, alias="from", description="First service date included"),
+    to_date: date | None = Query(None, alias="to", description="Last service date included"),
+    interval: Literal["day", "week", "month"] = Query("day", description="Length of each period"),
+    provider_npi: str | None = Query(None, description="Only count the claims of this provider"),
+    plan_group: str | None = Query(None, description="Only count the claims of this plan group"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    check_date_range(from_date, to_date)
+    statement = summary_trend_statement(from_date, to_date, interval, provider_npi, plan_group)
+    with DB_QUERY_SECONDS.time():
+        results = (await session.exec(statement)).all()
+    return {"trend": [row._asdict() for row in results]}
+
+def idempotency_key_header():
+    # Clients retrying a request send the same key; the retry is answered without a second write
+    return Header(None, alias="Idempotency-Key", min_length=1, max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+                  description="Unique key of the request; retries with the same key are not stored twice")
+
 # Endpoint to process and store the claim
-@app.post("/claims/")
-async def process_claim(payload: ClaimPayload, session: Session = Depends(get_session)):
+@app.post("/claims/", response_model=ClaimResponse)
+async def process_claim(
+    payload: ClaimPayload,
+    response: Response,
+    idempotency_key: str | None = idempotency_key_header(),
+    session: AsyncSession = Depends(get_async_session),
+    claim_queue: ClaimQueue = Depends(get_claim_queue),
+):
+    if idempotency_key and idempotency_key.startswith(BULK_KEY_PREFIX):
+        # The namespace of the bulk rows' keys
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_RESERVED)
+    ids = [idempotent_claim_id(idempotency_key)] if idempotency_key else None
+    if CLAIM_INGESTION_MODE == "queue":
+        return await enqueue_claim(payload, response, session, claim_queue, idempotency_key, ids)
     try:
-        # Calculate the net fee
-        net_fee = (
-            payload.provider_fees + payload.member_coinsurance + payload.member_copay - payload.allowed_fees
-        )
-
-        # Create the claim object to store in the database
-        claim = Claim(
-            service_date=payload.service_date,
-            submitted_procedure=payload.submitted_procedure,
-            quadrant=payload.quadrant,
-            plan_group=payload.plan_group,
-            subscriber=payload.subscriber,
-            provider_npi=payload.provider_npi,
-            provider_fees=payload.provider_fees,
-            allowed_fees=payload.allowed_fees,
-            member_coinsurance=payload.member_coinsurance,
-            member_copay=payload.member_copay,
-            net_fee=net_fee
-        )
-
-        # Add the claim to the session
-        session.add(claim)
-
-        # Commit the transaction
-        session.commit()
-
-        # Refresh the claim object to get the auto-generated id
-        session.refresh(claim)
+        # Build the row, including net_fee and the client-side generated (or key-derived) id
+        row = build_claim_rows([payload], ids)[0]
+
+        # Record the key, insert (ON CONFLICT DO NOTHING) and commit; only the id comes back
+        with DB_COMMIT_SECONDS.time():
+            status = KEY_NEW
+            if idempotency_key:
+                (status,) = await reserve_idempotency_keys(session, [(idempotency_key, row)])
+            if status == KEY_CONFLICT:
+                await session.rollback()
+                raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_CONFLICT)
+            inserted = await insert_claim_rows(session, [row]) if status == KEY_NEW else []
+            if status == KEY_NEW and not inserted:
+                # Stored under this key before idempotency_keys existed: compare with the claim itself
+                await check_stored_claim(session, row)
+            await session.commit()
+
+        if not inserted:
+            # A retry of a request that was already stored
+            response.headers["Idempotent-Replayed"] = "true"
+            return claim_response(row)
+
+        # Keep the in-memory leaderboard, the live rankings and the cached responses current
+        await record_committed_fees(session, {payload.provider_npi: row["net_fee"]})
+        live_top_providers.add(payload.provider_npi, row["net_fee"])
+        response_cache.bump("claims")
 
         # Prepare the response with the data including net_fee
-        return {
-            "id": str(claim.id),  # Return the ID as a string
-            "service_date": payload.service_date,
-            "submitted_procedure": payload.submitted_procedure,
-            "quadrant": payload.quadrant,
-            "plan_group": payload.plan_group,
-            "subscriber": payload.subscriber,
-            "provider_npi": payload.provider_npi,
-            "provider_fees": payload.provider_fees,
-            "allowed_fees": payload.allowed_fees,
-            "member_coinsurance": payload.member_coinsurance,
-            "member_copay": payload.member_copay,
-            "net_fee": net_fee
-        }
+        return claim_response(row)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+async def check_stored_claim(session: AsyncSession, row: dict) -> None:
+    """Reject a replayed Idempotency-Key whose stored claim differs (one primary key probe)."""
+    stored = await session.get(Claim, (row["id"], row["service_date"]))
+    if stored is None or not stored_claim_matches(stored, row):
+        await session.rollback()
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_CONFLICT)
+
+async def enqueue_claim(payload: ClaimPayload, response: Response, session: AsyncSession, claim_queue: ClaimQueue,
+                        idempotency_key: str | None = None, ids: list | None = None):
+    """Queue mode: hand the validated claim to the worker and answer 202 Accepted.
+
+    A key the worker already stored is answered here: replayed, or rejected
+    when it was used for a different claim. A key still waiting in the queue
+    is checked by the worker (see claim_queue.process_batch).
+    """
+    row = build_claim_rows([payload], ids)[0]
+    if idempotency_key:
+        stored = await session.get(IdempotencyKey, idempotency_key)
+        stored_hash = stored.payload_hash if stored is not None else None
+        await session.rollback()
+        if stored_hash is not None:
+            if stored_hash != claim_digest(row):
+                raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_CONFLICT)
+            response.headers["Idempotent-Replayed"] = "true"
+            return claim_response(row)
+    try:
+        await claim_queue.put(session, [row_to_message(row, idempotency_key)])
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Ranked when accepted: the worker that writes it may run in another process
+    live_top_providers.add(payload.provider_npi, row["net_fee"])
+
+    response.status_code = 202
+    return claim_response(row)
+
+# Endpoint to process and store a batch of claims
+@app.post("/claims/bulk")
+async def process_claims_bulk(
+    request: Request,
+    idempotency_key: str | None = idempotency_key_header(),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Accept a JSON array or an NDJSON stream of claims.
+
+    A JSON array is validated in one call; when it holds invalid rows, rows are
+    validated one by one and the invalid ones are reported with their index,
+    while the valid ones are written in chunks (one multi-row INSERT and one
+    commit per chunk). With an Idempotency-Key, rows already stored by an
+    earlier attempt are skipped and reported as replayed.
+    """
+    writer = BulkClaimWriter(session, idempotency_key=idempotency_key)
+
+    if is_ndjson(request.headers.get("content-type", "")):
+        # Consume the stream line by line so memory stays bounded by the chunk size
+        index = 0
+        async for line in iter_ndjson_lines(request.stream()):
+            await writer.add(index, line)
+            index += 1
+    else:
+        body = await request.body()
+        payloads = validate_claim_batch(body)
+        if payloads is not None:
+            # Every row is valid: validated in one call, straight from the bytes
+            for index, payload in enumerate(payloads):
+                await writer.add_valid(index, payload)
+            return await writer.result()
+
+        # Some rows are invalid: validate them one by one to report each error
+        try:
+            items = parse_json_array(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for index, item in enumerate(items):
+            await writer.add(index, item)
+
+    return await writer.result()
+
+# Stream claims out for reconciliation, without holding the result in memory
+@app.get("/claims/export")
+async def export_claims(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="ndjson or csv"),
+    provider_npi: str | None = Query(None, description="Only export the claims of this provider"),
+    from_date: date | None = Query(None, alias="from", description="First service date included"),
+    to_date: date | None = Query(None, alias="to", description="Last service date included"),
+):
+    """Stream the matching claims as NDJSON (one object per line) or CSV (with a header row)."""
+    check_date_range(from_date, to_date)
+    statement = export_claims_statement(provider_npi, from_date, to_date)
+    return StreamingResponse(
+        stream_claims(statement, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="claims.{export_format}"'},
+    )
+
+# Endpoint exposing the service metrics (routes, stages, connection pools) to Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
@@ -0,0 +1,147 @@
+import time
+import uuid
+from contextvars import ContextVar
+from decimal import Decimal
+
+import orjson
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from starlette.responses import JSONResponse
+
+# Requests per route template (not raw path, to keep label cardinality bounded)
+REQUEST_COUNT = Counter("http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+SQL_STATEMENTS_PER_REQUEST = Histogram(
+    "http_request_sql_statements",
+    "SQL statements executed while handling a request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+
+# Latency of the hot stages inside the handlers
+STAGE_SECONDS = Histogram(
+    "claim_stage_duration_seconds",
+    "Time spent in a stage of request handling",
+    ["stage"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+# Children bound once, so timing a stage costs no label lookup
+VALIDATION_SECONDS = STAGE_SECONDS.labels("validation")
+DB_COMMIT_SECONDS = STAGE_SECONDS.labels("db_commit")
+DB_QUERY_SECONDS = STAGE_SECONDS.labels("db_query")
+SERIALIZATION_SECONDS = STAGE_SECONDS.labels("serialization")
+
+# Statement counter of the request being handled, incremented by SQLAlchemy events
+_sql_statements: ContextVar[list[int] | None] = ContextVar("sql_statements", default=None)
+
+# Time spent waiting for a connection from a pool, per engine
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Read-only sessions per database they were routed to (replica, or primary on fallback)
+READ_SESSIONS = Counter("db_read_sessions_total", "Read-only sessions opened", ["target"])
+REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "Replication lag of the read replica at the last check")
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ["pool"])
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "http_response_cache_lookups_total", "Response cache lookups of the cached read endpoints", ["result"]
+)
+
+
+class PoolCollector:
+    """Report pool occupancy at scrape time, so it costs nothing per request."""
+
+    def __init__(self):
+        self.engines = {}
+
+    def register(self, name: str, engine) -> None:
+        # Keep the engine rather than its pool: dispose() replaces the pool
+        self.engines[name] = engine
+
+    def collect(self):
+        size = GaugeMetricFamily("db_pool_size", "Configured number of persistent connections", labels=["pool"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections currently in use", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size", labels=["pool"])
+        idle = GaugeMetricFamily("db_pool_checked_in", "Idle connections kept in the pool", labels=["pool"])
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            # NullPool (external pooler mode) keeps no connections and has no counters
+            if not hasattr(pool, "checkedout"):
+                continue
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+            idle.add_metric([name], pool.checkedin())
+        yield from (size, checked_out, overflow, idle)
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+def count_sql_statement(*args) -> None:
+    """`before_cursor_execute` listener counting statements for the current request."""
+    counter = _sql_statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def json_default(value):
+    """orjson fallback: money is Decimal and has always been sent as a JSON number, UUIDs as strings."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        # asyncpg returns its own UUID subclass, which orjson does not recognize
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, recording how long encoding its body takes."""
+
+    def render(self, content) -> bytes:
+        with SERIALIZATION_SECONDS.time():
+            return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording count, latency and SQL statements per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        counter = [0]
+        token = _sql_statements.set(counter)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _sql_statements.reset(token)
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_COUNT.labels(scope["method"], route, str(status)).inc()
+            REQUEST_SECONDS.labels(scope["method"], route).observe(elapsed)
+            SQL_STATEMENTS_PER_REQUEST.labels(route).observe(counter[0])
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Return the current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
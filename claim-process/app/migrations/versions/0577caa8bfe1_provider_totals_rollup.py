@@ -0,0 +1,66 @@
+"""provider_totals rollup maintained by a trigger on claim
+
+Revision ID: 0577caa8bfe1
+Revises: 4f17ddf2c015
+Create Date: 2026-10-17 09:12:41.530214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0577caa8bfe1'
+down_revision: Union[str, None] = '4f17ddf2c015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('provider_totals',
+    sa.Column('provider_npi', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('total_net_fee', sa.Float(), nullable=False),
+    sa.Column('claim_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('provider_npi')
+    )
+    op.create_index(op.f('ix_provider_totals_total_net_fee'), 'provider_totals', ['total_net_fee'], unique=False)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION claim_provider_totals_upsert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO provider_totals (provider_npi, total_net_fee, claim_count)
+        SELECT provider_npi, SUM(net_fee), COUNT(*)
+        FROM new_claims
+        GROUP BY provider_npi
+        ORDER BY provider_npi
+        ON CONFLICT (provider_npi) DO UPDATE SET
+            total_net_fee = provider_totals.total_net_fee + EXCLUDED.total_net_fee,
+            claim_count = provider_totals.claim_count + EXCLUDED.claim_count;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+
+    # Block claim inserts until the trigger exists and the backfill is done,
+    # so every claim is counted exactly once.
+    op.execute("LOCK TABLE claim IN SHARE MODE")
+    op.execute("""
+    CREATE TRIGGER claim_provider_totals
+    AFTER INSERT ON claim
+    REFERENCING NEW TABLE AS new_claims
+    FOR EACH STATEMENT EXECUTE FUNCTION claim_provider_totals_upsert()
+    """)
+    op.execute("""
+    INSERT INTO provider_totals (provider_npi, total_net_fee, claim_count)
+    SELECT provider_npi, SUM(net_fee), COUNT(*) FROM claim GROUP BY provider_npi
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS claim_provider_totals ON claim")
+    op.execute("DROP FUNCTION IF EXISTS claim_provider_totals_upsert()")
+    op.drop_index(op.f('ix_provider_totals_total_net_fee'), table_name='provider_totals')
+    op.drop_table('provider_totals')
@@ -0,0 +1,45 @@
+"""ingest_checkpoints for ingest-file, out of compaction_watermarks
+
+Revision ID: 3b8d5f0e9a72
+Revises: 9c4e2a7f1b63
+Create Date: 2026-10-17 21:38:12.640917
+
+Checkpoints of interrupted ingest-file runs, stored in compaction_watermarks
+under "ingest:<path>" until now, are moved over under their path, so those
+runs still resume.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8d5f0e9a72'
+down_revision: Union[str, None] = '9c4e2a7f1b63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingest_checkpoints',
+    sa.Column('rows_loaded', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('job', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('job')
+    )
+    op.execute(
+        "INSERT INTO ingest_checkpoints (job, rows_loaded, updated_at) "
+        "SELECT substr(job, length('ingest:') + 1), watermark, updated_at FROM compaction_watermarks "
+        "WHERE job LIKE 'ingest:%'"
+    )
+    op.execute("DELETE FROM compaction_watermarks WHERE job LIKE 'ingest:%'")
+
+
+def downgrade() -> None:
+    op.execute(
+        "INSERT INTO compaction_watermarks (job, watermark, updated_at) "
+        "SELECT 'ingest:' || job, rows_loaded, updated_at FROM ingest_checkpoints"
+    )
+    op.drop_table('ingest_checkpoints')
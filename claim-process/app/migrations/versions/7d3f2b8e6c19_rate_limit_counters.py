@@ -0,0 +1,37 @@
+"""rate_limit_counters, shared by the claimdb:// rate limiter storage
+
+Revision ID: 7d3f2b8e6c19
+Revises: a94c6e1b7d28
+Create Date: 2026-10-17 18:52:10.215734
+
+The table is UNLOGGED: the counters only matter for the current rate limit
+window, so they skip the WAL and are emptied after a crash.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3f2b8e6c19'
+down_revision: Union[str, None] = 'a94c6e1b7d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('rate_limit_counters',
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key'),
+    prefixes=['UNLOGGED']
+    )
+    op.create_index(op.f('ix_rate_limit_counters_expires_at'), 'rate_limit_counters', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_rate_limit_counters_expires_at'), table_name='rate_limit_counters')
+    op.drop_table('rate_limit_counters')
@@ -0,0 +1,36 @@
+"""idempotency_keys: one row per Idempotency-Key, independent of the claim partitions
+
+Revision ID: 9c4e2a7f1b63
+Revises: 7d3f2b8e6c19
+Create Date: 2026-10-17 21:04:37.518204
+
+Claims stored earlier under an Idempotency-Key have no row here (the key cannot
+be recovered from the claim id). A retry of such a request is still recognized
+by the claim's primary key, as before.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e2a7f1b63'
+down_revision: Union[str, None] = '7d3f2b8e6c19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('idempotency_keys',
+    sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('claim_id', sa.Uuid(), nullable=False),
+    sa.Column('service_date', sa.Date(), nullable=False),
+    sa.Column('payload_hash', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('idempotency_keys')
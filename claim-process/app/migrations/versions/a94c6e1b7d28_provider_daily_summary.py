@@ -0,0 +1,66 @@
+"""provider_daily_summary, compaction watermarks and claim.ingest_xid
+
+Revision ID: a94c6e1b7d28
+Revises: f81d3a6c2e47
+Create Date: 2026-10-17 15:21:44.608193
+
+`ingest_xid` is added without a default and the default is set afterwards, so
+the existing rows are not rewritten (they keep NULL and are picked up by the
+first compaction run). Its index is built CONCURRENTLY partition by partition.
+Run `python cli.py compact-daily-summary --once` after upgrading to fill the
+summaries.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a94c6e1b7d28'
+down_revision: Union[str, None] = 'f81d3a6c2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('provider_daily_summary',
+    sa.Column('provider_npi', sa.CHAR(length=10), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('plan_group', sqlmodel.sql.sqltypes.AutoString(length=32), nullable=False),
+    sa.Column('sum_net_fee', sa.Numeric(precision=16, scale=2), nullable=False),
+    sa.Column('claim_count', sa.Integer(), nullable=False),
+    sa.Column('sum_provider_fees', sa.Numeric(precision=16, scale=2), nullable=False),
+    sa.Column('sum_allowed_fees', sa.Numeric(precision=16, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('provider_npi', 'day', 'plan_group')
+    )
+    op.create_index(op.f('ix_provider_daily_summary_day'), 'provider_daily_summary', ['day'], unique=False)
+    op.create_table('compaction_watermarks',
+    sa.Column('watermark', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('job', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('job')
+    )
+
+    op.add_column('claim', sa.Column('ingest_xid', sa.BigInteger(), nullable=True))
+    op.alter_column('claim', 'ingest_xid', server_default=sa.text('(pg_current_xact_id()::text::bigint)'))
+
+    bind = op.get_bind()
+    partitions = bind.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'claim'::regclass ORDER BY c.relname"
+    )).scalars().all()
+    op.execute("CREATE INDEX IF NOT EXISTS ix_claim_ingest_xid ON ONLY claim (ingest_xid)")
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_ingest_xid_idx ON {partition} (ingest_xid)")
+            op.execute(f"ALTER INDEX ix_claim_ingest_xid ATTACH PARTITION {partition}_ingest_xid_idx")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_claim_ingest_xid', table_name='claim')
+    op.drop_column('claim', 'ingest_xid')
+    op.drop_table('compaction_watermarks')
+    op.drop_index(op.f('ix_provider_daily_summary_day'), table_name='provider_daily_summary')
+    op.drop_table('provider_daily_summary')
@@ -0,0 +1,172 @@
+"""Compact claim schema: DATE, NUMERIC money, bounded strings and a quadrant enum
+
+Revision ID: c5a1e8d2f934
+Revises: b3e9d1f07a42
+Create Date: 2026-10-17 11:26:08.417352
+
+The columns are converted without rewriting `claim` under an exclusive lock:
+
+1. Every converted column gets a `<column>_new` twin (a catalog-only change), and
+   a row trigger keeps the twins in step with rows written during the migration.
+2. Existing rows are converted in keyset batches of MIGRATION_BATCH_SIZE rows,
+   each batch in its own short transaction.
+3. NOT NULL is proven with `CHECK ... NOT VALID` + `VALIDATE` and the indexes are
+   built `CONCURRENTLY`; neither blocks reads or writes.
+4. A final short transaction drops the old columns and renames the twins.
+
+A value that cannot be converted (an unparsable date, an unknown quadrant, a
+string longer than its column) stops the batch with the offending value in the
+error. Fix the row and run the upgrade again: every step can be repeated.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a1e8d2f934'
+down_revision: Union[str, None] = 'b3e9d1f07a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "10000"))
+
+quadrant = postgresql.ENUM(
+    'Upper', 'Lower', 'Upper Left', 'Upper Right', 'Lower Left', 'Lower Right', name='quadrant'
+)
+
+# (column, new type, conversion from the old value, NOT NULL)
+COLUMNS = [
+    ('service_date', 'DATE', '{}::date', True),
+    ('submitted_procedure', 'VARCHAR(10)', '{}', True),
+    ('quadrant', 'quadrant', 'claim_quadrant_from_text({})', False),
+    ('plan_group', 'VARCHAR(32)', '{}', True),
+    ('subscriber', 'VARCHAR(32)', '{}', True),
+    ('provider_npi', 'CHAR(10)', '{}', True),
+    ('provider_fees', 'NUMERIC(12, 2)', 'round({}::numeric, 2)', True),
+    ('allowed_fees', 'NUMERIC(12, 2)', 'round({}::numeric, 2)', True),
+    ('member_coinsurance', 'NUMERIC(12, 2)', 'round({}::numeric, 2)', True),
+    ('member_copay', 'NUMERIC(12, 2)', 'round({}::numeric, 2)', True),
+    ('net_fee', 'NUMERIC(12, 2)', 'round({}::numeric, 2)', True),
+]
+
+# Indexes rebuilt on the new columns
+INDEXES = [('ix_claim_provider_npi', 'provider_npi'), ('ix_claim_net_fee', 'net_fee')]
+
+# Accepts the labels and the UL/UR/LL/LR/U/L abbreviations, like ClaimPayload
+QUADRANT_FUNCTION = """
+CREATE OR REPLACE FUNCTION claim_quadrant_from_text(value text) RETURNS quadrant AS $$
+    SELECT CASE upper(trim(value))
+        WHEN '' THEN NULL
+        WHEN 'U' THEN 'Upper'
+        WHEN 'L' THEN 'Lower'
+        WHEN 'UL' THEN 'Upper Left'
+        WHEN 'UR' THEN 'Upper Right'
+        WHEN 'LL' THEN 'Lower Left'
+        WHEN 'LR' THEN 'Lower Right'
+        ELSE initcap(trim(value))::quadrant
+    END
+$$ LANGUAGE sql IMMUTABLE
+"""
+
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION claim_compact_sync() RETURNS trigger AS $$
+BEGIN
+    {assignments}
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+""".format(assignments="\n    ".join(
+    f"NEW.{column}_new := {conversion.format(f'NEW.{column}')};" for column, _, conversion, _ in COLUMNS
+))
+
+SYNC_TRIGGER = """
+CREATE TRIGGER claim_compact_sync
+BEFORE INSERT OR UPDATE ON claim
+FOR EACH ROW EXECUTE FUNCTION claim_compact_sync()
+"""
+
+
+def backfill(bind) -> None:
+    """Convert the existing rows in primary key order, one short transaction per batch."""
+    assignments = ", ".join(f"{column}_new = {conversion.format(column)}" for column, _, conversion, _ in COLUMNS)
+    select_batch = sa.text("SELECT id FROM claim WHERE id > :after ORDER BY id LIMIT :limit")
+    update_batch = sa.text(
+        f"UPDATE claim SET {assignments} WHERE id = ANY(:ids) AND service_date_new IS NULL"
+    )
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        ids = bind.execute(select_batch, {"after": after, "limit": MIGRATION_BATCH_SIZE}).scalars().all()
+        if not ids:
+            return
+        bind.execute(update_batch, {"ids": ids})
+        after = ids[-1]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    quadrant.create(bind, checkfirst=True)
+    op.execute(QUADRANT_FUNCTION)
+    for column, type_, _, _ in COLUMNS:
+        op.execute(f"ALTER TABLE claim ADD COLUMN IF NOT EXISTS {column}_new {type_}")
+    op.execute(SYNC_FUNCTION)
+    op.execute("DROP TRIGGER IF EXISTS claim_compact_sync ON claim")
+    op.execute(SYNC_TRIGGER)
+
+    with op.get_context().autocommit_block():
+        backfill(bind)
+        for column, _, _, not_null in COLUMNS:
+            if not_null:
+                op.execute(f"ALTER TABLE claim DROP CONSTRAINT IF EXISTS claim_{column}_new_not_null")
+                op.execute(
+                    f"ALTER TABLE claim ADD CONSTRAINT claim_{column}_new_not_null "
+                    f"CHECK ({column}_new IS NOT NULL) NOT VALID"
+                )
+                op.execute(f"ALTER TABLE claim VALIDATE CONSTRAINT claim_{column}_new_not_null")
+        for name, column in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new")
+            op.execute(f"CREATE INDEX CONCURRENTLY {name}_new ON claim ({column}_new)")
+
+    # Swap: catalog-only changes, SET NOT NULL reuses the validated CHECK constraints
+    op.execute("DROP TRIGGER claim_compact_sync ON claim")
+    op.execute("DROP FUNCTION claim_compact_sync()")
+    for column, _, _, not_null in COLUMNS:
+        op.execute(f"ALTER TABLE claim DROP COLUMN {column}")
+        op.execute(f"ALTER TABLE claim RENAME COLUMN {column}_new TO {column}")
+        if not_null:
+            op.execute(f"ALTER TABLE claim ALTER COLUMN {column} SET NOT NULL")
+            op.execute(f"ALTER TABLE claim DROP CONSTRAINT claim_{column}_new_not_null")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+    op.execute("DROP FUNCTION claim_quadrant_from_text(text)")
+
+    # provider_totals holds one row per provider: converted in place
+    op.alter_column('provider_totals', 'provider_npi', type_=sa.CHAR(10))
+    op.alter_column(
+        'provider_totals', 'total_net_fee', type_=sa.Numeric(16, 2),
+        postgresql_using='round(total_net_fee::numeric, 2)'
+    )
+
+
+def downgrade() -> None:
+    # Rewrites both tables under an exclusive lock
+    op.alter_column('provider_totals', 'total_net_fee', type_=sa.Float(), postgresql_using='total_net_fee::float8')
+    op.alter_column('provider_totals', 'provider_npi', type_=sa.VARCHAR())
+    op.execute("""
+    ALTER TABLE claim
+        ALTER COLUMN service_date TYPE VARCHAR USING service_date::text,
+        ALTER COLUMN submitted_procedure TYPE VARCHAR,
+        ALTER COLUMN quadrant TYPE VARCHAR USING quadrant::text,
+        ALTER COLUMN plan_group TYPE VARCHAR,
+        ALTER COLUMN subscriber TYPE VARCHAR,
+        ALTER COLUMN provider_npi TYPE VARCHAR,
+        ALTER COLUMN provider_fees TYPE FLOAT USING provider_fees::float8,
+        ALTER COLUMN allowed_fees TYPE FLOAT USING allowed_fees::float8,
+        ALTER COLUMN member_coinsurance TYPE FLOAT USING member_coinsurance::float8,
+        ALTER COLUMN member_copay TYPE FLOAT USING member_copay::float8,
+        ALTER COLUMN net_fee TYPE FLOAT USING net_fee::float8
+    """)
+    quadrant.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,145 @@
+"""Partition claim by month of service_date
+
+Revision ID: e2b7c4a9d150
+Revises: c5a1e8d2f934
+Create Date: 2026-10-17 12:48:31.905126
+
+The existing table becomes the DEFAULT partition (`claim_default`) of a new
+partitioned `claim`, then every month of history is split out of it:
+
+1. A unique index on (id, service_date) is built CONCURRENTLY on the old table;
+   it backs the partition's primary key (the key must include service_date). So
+   is a `service_date` index, which finds the rows of each month to move.
+2. A short transaction renames the old table, swaps its primary key to that
+   index, creates the partitioned parent and attaches the old table as the
+   default partition. The parent's indexes adopt the existing ones.
+3. Each month found in claim_default gets its partition, most recent first, one
+   transaction per month: its rows are moved out of claim_default and the
+   partition is attached. Only inserts routed to claim_default (months without
+   a partition yet) wait for such a transaction; `PARTITION_LOCK_TIMEOUT`
+   bounds how long it waits for its locks.
+
+Splitting the history keeps claim_default small, which every later partition
+creation scans. The split can be resumed: run the upgrade again after a lock
+timeout and the remaining months are split. Future months are created with
+`python cli.py create-claim-partitions`.
+"""
+import os
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c4a9d150'
+down_revision: Union[str, None] = 'c5a1e8d2f934'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+COLUMNS = (
+    "id, service_date, submitted_procedure, quadrant, plan_group, subscriber, provider_npi, "
+    "provider_fees, allowed_fees, member_coinsurance, member_copay, net_fee"
+)
+
+# One month out of claim_default, in one transaction (statements sent together run as one)
+SPLIT_MONTH = """
+BEGIN;
+SET LOCAL lock_timeout = '{lock_timeout}';
+CREATE TABLE {name} (LIKE claim INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (service_date >= '{start}' AND service_date < '{end}');
+LOCK TABLE claim_default IN SHARE ROW EXCLUSIVE MODE;
+WITH moved AS (
+    DELETE FROM claim_default WHERE service_date >= '{start}' AND service_date < '{end}' RETURNING {columns}
+)
+INSERT INTO {name} ({columns}) SELECT {columns} FROM moved;
+ALTER TABLE claim ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}');
+ALTER TABLE {name} DROP CONSTRAINT {name}_bounds;
+COMMIT;
+"""
+
+PROVIDER_TOTALS_TRIGGER = """
+CREATE TRIGGER claim_provider_totals
+AFTER INSERT ON claim
+REFERENCING NEW TABLE AS new_claims
+FOR EACH STATEMENT EXECUTE FUNCTION claim_provider_totals_upsert()
+"""
+
+
+def split_history(bind) -> None:
+    """Move each month of claim_default into its own partition, most recent month first."""
+    months = bind.execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', service_date)::date FROM claim_default ORDER BY 1 DESC"
+    )).scalars().all()
+    for start in months:
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        bind.exec_driver_sql(SPLIT_MONTH.format(
+            name=f"claim_p{start:%Y_%m}", start=start, end=end, columns=COLUMNS, lock_timeout=PARTITION_LOCK_TIMEOUT
+        ))
+
+
+def swap_to_partitioned_table() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS claim_default_pkey")
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY claim_default_pkey ON claim (id, service_date)")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS claim_default_service_date_idx")
+        op.execute("CREATE INDEX CONCURRENTLY claim_default_service_date_idx ON claim (service_date)")
+
+    op.execute("ALTER TABLE claim RENAME TO claim_default")
+    op.execute("DROP TRIGGER claim_provider_totals ON claim_default")
+    op.execute("ALTER TABLE claim_default DROP CONSTRAINT claim_pkey")
+    op.execute("ALTER TABLE claim_default ADD CONSTRAINT claim_default_pkey PRIMARY KEY USING INDEX claim_default_pkey")
+    op.execute("ALTER INDEX ix_claim_provider_npi RENAME TO claim_default_provider_npi_idx")
+    op.execute("ALTER INDEX ix_claim_net_fee RENAME TO claim_default_net_fee_idx")
+
+    op.create_table('claim',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('service_date', sa.Date(), nullable=False),
+    sa.Column('submitted_procedure', sa.VARCHAR(length=10), nullable=False),
+    sa.Column('quadrant', postgresql.ENUM(name='quadrant', create_type=False), nullable=True),
+    sa.Column('plan_group', sa.VARCHAR(length=32), nullable=False),
+    sa.Column('subscriber', sa.VARCHAR(length=32), nullable=False),
+    sa.Column('provider_npi', sa.CHAR(length=10), nullable=False),
+    sa.Column('provider_fees', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('allowed_fees', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('member_coinsurance', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('member_copay', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('net_fee', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'service_date'),
+    postgresql_partition_by='RANGE (service_date)'
+    )
+    # No rows can conflict with other partitions yet, so the attach does not scan
+    op.execute("ALTER TABLE claim ATTACH PARTITION claim_default DEFAULT")
+    # Both indexes already exist on claim_default and are attached, not rebuilt
+    op.create_index(op.f('ix_claim_provider_npi'), 'claim', ['provider_npi'], unique=False)
+    op.create_index(op.f('ix_claim_net_fee'), 'claim', ['net_fee'], unique=False)
+    op.execute(PROVIDER_TOTALS_TRIGGER)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    partitioned = bind.execute(sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'claim'::regclass")).scalar()
+    if not partitioned:
+        swap_to_partitioned_table()
+
+    with op.get_context().autocommit_block():
+        split_history(bind)
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS claim_default_service_date_idx")
+
+
+def downgrade() -> None:
+    # Copies every claim back into a single table
+    op.execute("ALTER TABLE claim RENAME TO claim_partitioned")
+    op.execute("ALTER INDEX ix_claim_provider_npi RENAME TO claim_partitioned_provider_npi_idx")
+    op.execute("ALTER INDEX ix_claim_net_fee RENAME TO claim_partitioned_net_fee_idx")
+    op.execute("CREATE TABLE claim (LIKE claim_partitioned INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO claim SELECT * FROM claim_partitioned")
+    op.execute("DROP TABLE claim_partitioned")
+    op.execute("ALTER TABLE claim ADD CONSTRAINT claim_pkey PRIMARY KEY (id)")
+    op.create_index(op.f('ix_claim_provider_npi'), 'claim', ['provider_npi'], unique=False)
+    op.create_index(op.f('ix_claim_net_fee'), 'claim', ['net_fee'], unique=False)
+    op.execute(PROVIDER_TOTALS_TRIGGER)
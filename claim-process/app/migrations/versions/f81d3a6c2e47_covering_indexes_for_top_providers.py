@@ -0,0 +1,54 @@
+"""Covering indexes for the filtered top-providers queries
+
+Revision ID: f81d3a6c2e47
+Revises: e2b7c4a9d150
+Create Date: 2026-10-17 14:05:52.118630
+
+CREATE INDEX CONCURRENTLY is not supported on a partitioned table, so each
+index is created on the parent only (invalid until complete), built
+CONCURRENTLY on every partition and attached partition by partition. Writes
+are never blocked; the parent index becomes valid once the last partition is
+attached.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f81d3a6c2e47'
+down_revision: Union[str, None] = 'e2b7c4a9d150'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name, key columns, included columns
+INDEXES = [
+    ('ix_claim_service_date_provider_npi', 'service_date, provider_npi', 'net_fee'),
+    ('ix_claim_plan_group_service_date', 'plan_group, service_date', 'provider_npi, net_fee'),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    partitions = bind.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'claim'::regclass ORDER BY c.relname"
+    )).scalars().all()
+
+    for name, columns, include in INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY claim ({columns}) INCLUDE ({include})")
+    with op.get_context().autocommit_block():
+        for name, columns, include in INDEXES:
+            for partition in partitions:
+                partition_index = f"{partition}_{name[len('ix_claim_'):]}_idx"
+                op.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} "
+                    f"ON {partition} ({columns}) INCLUDE ({include})"
+                )
+                op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+
+def downgrade() -> None:
+    for name, _, _ in INDEXES:
+        op.drop_index(name, table_name='claim')
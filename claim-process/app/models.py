@@ -1,16 +1,183 @@
+import enum
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import BigInteger, CHAR, Column, DDL, DateTime, Enum, Index, LargeBinary, event, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import Field, SQLModel
 import uuid
 
+# Column sizes, shared with the payload validation in app_types
+PROCEDURE_CODE_LENGTH = 10
+PLAN_GROUP_LENGTH = 32
+SUBSCRIBER_LENGTH = 32
+NPI_LENGTH = 10
+# Money is stored as exact NUMERIC; totals get more integer digits than single claims
+MONEY_DIGITS = 12
+TOTAL_DIGITS = 16
+MONEY_DECIMAL_PLACES = 2
+
+class Quadrant(str, enum.Enum):
+    """Area of the mouth a procedure was performed on, stored as a Postgres enum."""
+    UPPER = "Upper"
+    LOWER = "Lower"
+    UPPER_LEFT = "Upper Left"
+    UPPER_RIGHT = "Upper Right"
+    LOWER_LEFT = "Lower Left"
+    LOWER_RIGHT = "Lower Right"
+
+# Store the labels ("Upper Left") rather than the member names ("UPPER_LEFT")
+QUADRANT_TYPE = Enum(Quadrant, name="quadrant", values_callable=lambda members: [member.value for member in members])
+
 class Claim(SQLModel, table=True):
+    """Claims, range partitioned by month of service_date (see partitions.py).
+
+    Postgres requires the partition key in the primary key, hence (id, service_date).
+    """
+    __table_args__ = (
+        # Covering indexes for the filtered top-providers queries (index-only scans)
+        Index("ix_claim_service_date_provider_npi", "service_date", "provider_npi", postgresql_include=["net_fee"]),
+        Index("ix_claim_plan_group_service_date", "plan_group", "service_date",
+              postgresql_include=["provider_npi", "net_fee"]),
+        {"postgresql_partition_by": "RANGE (service_date)"},
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    service_date: str
-    submitted_procedure: str
-    quadrant: str | None = None
-    plan_group: str
-    subscriber: str
-    provider_npi: str = Field(index=True) 
-    provider_fees: float
-    allowed_fees: float
-    member_coinsurance: float
-    member_copay: float
-    net_fee: float = Field(index=True)
+    service_date: date = Field(primary_key=True)
+    submitted_procedure: str = Field(max_length=PROCEDURE_CODE_LENGTH)
+    quadrant: Quadrant | None = Field(default=None, sa_type=QUADRANT_TYPE)
+    plan_group: str = Field(max_length=PLAN_GROUP_LENGTH)
+    subscriber: str = Field(max_length=SUBSCRIBER_LENGTH)
+    provider_npi: str = Field(index=True, sa_type=CHAR(NPI_LENGTH))
+    provider_fees: Decimal = Field(max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    allowed_fees: Decimal = Field(max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    member_coinsurance: Decimal = Field(max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    member_copay: Decimal = Field(max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    net_fee: Decimal = Field(index=True, max_digits=MONEY_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    # Id of the transaction that wrote the row, the watermark of the daily summary compaction.
+    # NULL for the rows written before the column existed.
+    ingest_xid: int | None = Field(default=None, sa_column=Column(
+        BigInteger, server_default=text("(pg_current_xact_id()::text::bigint)"), index=True
+    ))
+
+class IdempotencyKey(SQLModel, table=True):
+    """Idempotency-Key of a stored claim, with a digest of the claim's content.
+
+    Keyed on the key alone: the claim's primary key includes the partition key
+    (service_date), so it cannot tell a retry from a new claim sent under the
+    same key with another service date.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key: str = Field(primary_key=True)
+    claim_id: uuid.UUID
+    service_date: date
+    payload_hash: bytes = Field(sa_type=LargeBinary)
+
+class ProviderTotal(SQLModel, table=True):
+    """Running net-fee total per provider, maintained by a trigger on `claim`."""
+    __tablename__ = "provider_totals"
+
+    provider_npi: str = Field(primary_key=True, sa_type=CHAR(NPI_LENGTH))
+    total_net_fee: Decimal = Field(
+        default=0, index=True, max_digits=TOTAL_DIGITS, decimal_places=MONEY_DECIMAL_PLACES
+    )
+    claim_count: int = Field(default=0)
+
+class ProviderDailySummary(SQLModel, table=True):
+    """Claims aggregated per provider, day of service and plan group (see summaries.py)."""
+    __tablename__ = "provider_daily_summary"
+
+    provider_npi: str = Field(primary_key=True, sa_type=CHAR(NPI_LENGTH))
+    day: date = Field(primary_key=True, index=True)
+    plan_group: str = Field(primary_key=True, max_length=PLAN_GROUP_LENGTH)
+    sum_net_fee: Decimal = Field(default=0, max_digits=TOTAL_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    claim_count: int = Field(default=0)
+    sum_provider_fees: Decimal = Field(default=0, max_digits=TOTAL_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+    sum_allowed_fees: Decimal = Field(default=0, max_digits=TOTAL_DIGITS, decimal_places=MONEY_DECIMAL_PLACES)
+
+class CompactionWatermark(SQLModel, table=True):
+    """How far a compaction job has read the claim table (a transaction id horizon)."""
+    __tablename__ = "compaction_watermarks"
+
+    job: str = Field(primary_key=True)
+    watermark: int = Field(sa_column=Column(BigInteger, nullable=False))
+    updated_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    )
+
+class IngestCheckpoint(SQLModel, table=True):
+    """Input rows of a claim file loaded so far by ingest-file (see ingest.py)."""
+    __tablename__ = "ingest_checkpoints"
+
+    job: str = Field(primary_key=True)
+    rows_loaded: int = Field(sa_column=Column(BigInteger, nullable=False))
+    updated_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    )
+
+class RateLimitCounter(SQLModel, table=True):
+    """Fixed-window request counter shared by the API processes (see ratelimit.py).
+
+    UNLOGGED: the counters are short-lived, so they skip the WAL and are
+    simply emptied after a crash.
+    """
+    __tablename__ = "rate_limit_counters"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: str = Field(primary_key=True)
+    count: int = Field(default=0)
+    expires_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False, index=True))
+
+class ClaimQueueItem(SQLModel, table=True):
+    """Claim waiting to be written by the ingestion worker (Postgres queue backend)."""
+    __tablename__ = "claim_queue"
+
+    id: int | None = Field(default=None, primary_key=True)
+    payload: dict = Field(sa_column=Column(JSONB, nullable=False))
+    enqueued_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    )
+
+class ClaimQueueDeadLetter(SQLModel, table=True):
+    """Queued claim the ingestion worker could not write, set aside with its error (see claim_queue.process_batch)."""
+    __tablename__ = "claim_queue_dead_letters"
+
+    id: int | None = Field(default=None, primary_key=True)
+    payload: dict = Field(sa_column=Column(JSONB, nullable=False))
+    error: str
+    failed_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    )
+
+# Statement-level trigger: every INSERT into claim folds its new rows into
+# provider_totals in the same transaction, one upsert per provider. Rows are
+# upserted in provider_npi order so concurrent inserts lock them consistently.
+PROVIDER_TOTALS_FUNCTION = DDL("""
+CREATE OR REPLACE FUNCTION claim_provider_totals_upsert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO provider_totals (provider_npi, total_net_fee, claim_count)
+    SELECT provider_npi, SUM(net_fee), COUNT(*)
+    FROM new_claims
+    GROUP BY provider_npi
+    ORDER BY provider_npi
+    ON CONFLICT (provider_npi) DO UPDATE SET
+        total_net_fee = provider_totals.total_net_fee + EXCLUDED.total_net_fee,
+        claim_count = provider_totals.claim_count + EXCLUDED.claim_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+
+PROVIDER_TOTALS_TRIGGER = DDL("""
+CREATE TRIGGER claim_provider_totals
+AFTER INSERT ON claim
+REFERENCING NEW TABLE AS new_claims
+FOR EACH STATEMENT EXECUTE FUNCTION claim_provider_totals_upsert()
+""")
+
+# Catch-all partition for service dates without a monthly partition yet
+CLAIM_DEFAULT_PARTITION = DDL("CREATE TABLE claim_default PARTITION OF claim DEFAULT")
+
+event.listen(Claim.__table__, "after_create", PROVIDER_TOTALS_FUNCTION)
+event.listen(Claim.__table__, "after_create", PROVIDER_TOTALS_TRIGGER)
+event.listen(Claim.__table__, "after_create", CLAIM_DEFAULT_PARTITION)
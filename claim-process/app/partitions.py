@@ -0,0 +1,137 @@
+"""Monthly partitions of the claim table.
+
+`claim` is range partitioned by `service_date`. Every month gets its own
+partition (`claim_p2025_01` holds January 2025); claims for a month without a
+partition land in `claim_default`. Partitions should be created ahead of time
+(`python cli.py create-claim-partitions`, e.g. from a monthly cron job) so the
+default partition stays small.
+"""
+import os
+import re
+from datetime import date
+
+from sqlalchemy import text
+from sqlmodel import Session
+try:
+    from app.models import Claim
+except ModuleNotFoundError:
+    from models import Claim
+
+# Number of future months that get a partition ahead of time
+CLAIM_PARTITIONS_AHEAD = int(os.getenv("CLAIM_PARTITIONS_AHEAD", "3"))
+# How long a partition create or detach waits for its locks before giving up, instead of queueing queries behind it
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+DEFAULT_PARTITION = "claim_default"
+MONTHLY_PARTITION = re.compile(r"^claim_p\d{4}_\d{2}$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"claim_p{month:%Y_%m}"
+
+
+def is_claim_partition(name: str) -> bool:
+    """True for the tables managed here (they are not in the SQLModel metadata)."""
+    return name == DEFAULT_PARTITION or MONTHLY_PARTITION.match(name) is not None
+
+
+def list_claim_partitions(session: Session) -> list[str]:
+    """Names of the partitions currently attached to claim."""
+    rows = session.exec(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'claim'::regclass ORDER BY c.relname"
+    ))
+    return [name for name, in rows]
+
+
+def create_claim_partition(session: Session, month: date) -> bool:
+    """Create and attach the partition of `month`; returns False if it already exists.
+
+    Claims of that month already stored in the default partition are moved into
+    the new partition first, otherwise Postgres refuses the attach.
+
+    The attach scans the whole default partition under an ACCESS EXCLUSIVE lock
+    to prove it holds no claim of the month, and inserts routed to the default
+    partition wait for this transaction. Both are cheap while claim_default
+    stays small: create partitions ahead of time, and split history out of it
+    (the partitioning migration does). `PARTITION_LOCK_TIMEOUT` bounds how long
+    the transaction waits for its locks.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if session.exec(text("SELECT to_regclass(:name)"), params={"name": name}).one()[0] is not None:
+        return False
+
+    columns = ", ".join(column.name for column in Claim.__table__.columns)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    session.exec(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+    session.exec(text(f"CREATE TABLE {name} (LIKE claim INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    # Proves the bounds of the new table, so the attach does not scan it as well
+    session.exec(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+        f"CHECK (service_date >= '{bounds['start']}' AND service_date < '{bounds['end']}')"
+    ))
+    # Keep new claims of this month out of the default partition until the attach commits
+    session.exec(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+    session.exec(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE service_date >= :start AND service_date < :end RETURNING {columns}) "
+            f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+        ),
+        params=bounds,
+    )
+    # SHARE UPDATE EXCLUSIVE on claim (reads and writes of the other partitions go on),
+    # ACCESS EXCLUSIVE on the default partition, which is scanned
+    session.exec(text(
+        f"ALTER TABLE claim ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    session.exec(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    session.commit()
+    return True
+
+
+def ensure_claim_partitions(session: Session, today: date | None = None, ahead: int = CLAIM_PARTITIONS_AHEAD,
+                            since: date | None = None) -> list[str]:
+    """Create the partitions from `since` (default: this month) up to `ahead` months from now.
+
+    Each partition is created in its own transaction. Returns the names of the
+    partitions that were created.
+    """
+    current = month_start(today or date.today())
+    month = month_start(since) if since else current
+    created = []
+    while month <= add_months(current, ahead):
+        if create_claim_partition(session, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def detach_claim_partition(session: Session, month: date) -> str:
+    """Detach the partition of `month` for archival and return its name.
+
+    The partition becomes a standalone table with its rows and indexes; nothing
+    is copied or rewritten. Dump it (`pg_dump -t <name>`) and drop it when it is
+    no longer needed. provider_totals still counts its claims until
+    `cli.py backfill-provider-totals` is run.
+
+    DETACH ... CONCURRENTLY is not available while a default partition exists,
+    so the detach takes a brief exclusive lock on claim; `PARTITION_LOCK_TIMEOUT`
+    bounds how long it waits for it.
+    """
+    name = partition_name(month_start(month))
+    session.exec(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+    session.exec(text(f"ALTER TABLE claim DETACH PARTITION {name}"))
+    session.commit()
+    return name
@@ -0,0 +1,240 @@
+"""Rate limiter storages for slowapi (the `limits` storage interface).
+
+slowapi checks limits synchronously, on the event loop, for every limited
+request, so a storage must not wait on the network. Both storages here keep
+fixed-window counters in a bounded in-process LRU; the counter of an idle
+client is evicted instead of accumulating forever.
+
+* `bounded-memory://`: process-local counters only.
+* `claimdb://`: the counters are also shared by every API process through the
+  rate_limit_counters table. Increments are counted locally and a background
+  thread adds them to the shared counters every RATE_LIMIT_SYNC_SECONDS, in
+  one batched upsert that returns the up-to-date totals. A limit check is a
+  dictionary update; the database is never on the request path.
+
+Synchronizing in batches trades exactness for latency: a process only learns
+the shared total of a key when it syncs its own hits on that key. Once a limit
+is reached, every process keeps admitting requests until its next sync, so the
+limit can be exceeded by what the processes admit within one sync interval.
+Within a single process the limit is exact.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from limits.storage import Storage
+from sqlalchemy import delete, func, text
+from sqlalchemy.exc import SQLAlchemyError
+try:
+    from app.database import engine as default_engine
+    from app.models import RateLimitCounter
+except ModuleNotFoundError:
+    from database import engine as default_engine
+    from models import RateLimitCounter
+
+logger = logging.getLogger(__name__)
+
+# Storage of the limiter: memory:// (slowapi's default), bounded-memory:// or claimdb://
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+# Counters kept in memory per process; the least recently used one is evicted beyond that
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+# Pause between two syncs of the local increments with the shared counters
+RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "0.1"))
+# How often the expired shared counters are deleted
+RATE_LIMIT_CLEANUP_SECONDS = float(os.getenv("RATE_LIMIT_CLEANUP_SECONDS", "60"))
+
+
+# One statement whatever the batch size: the increments are passed as three arrays
+SYNC_STATEMENT = text("""
+    INSERT INTO rate_limit_counters (key, count, expires_at)
+    SELECT key, count, now() + make_interval(secs => expiry)
+    FROM unnest(CAST(:keys AS varchar[]), CAST(:counts AS integer[]), CAST(:expiries AS integer[]))
+        AS batch (key, count, expiry)
+    ORDER BY key
+    ON CONFLICT (key) DO UPDATE SET
+        -- A counter whose window has ended starts over
+        count = CASE WHEN rate_limit_counters.expires_at <= now() THEN excluded.count
+                     ELSE rate_limit_counters.count + excluded.count END,
+        expires_at = CASE WHEN rate_limit_counters.expires_at <= now() THEN excluded.expires_at
+                          ELSE rate_limit_counters.expires_at END
+    RETURNING key, count, expires_at
+""")
+
+
+class WindowCounter:
+    __slots__ = ("expires_at", "synced", "pending")
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        # Shared total as of the last sync, plus the local hits not synced yet
+        self.synced = 0
+        self.pending = 0
+
+
+class BoundedMemoryStorage(Storage):
+    """Fixed-window counters in a process-local LRU of at most `max_keys` keys."""
+
+    STORAGE_SCHEME = ["bounded-memory"]
+
+    def __init__(self, uri: str | None = None, wrap_exceptions: bool = False, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 **options):
+        self.max_keys = max_keys
+        self.counters: OrderedDict[str, WindowCounter] = OrderedDict()
+        self.lock = threading.Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def counter(self, key: str, now: float) -> WindowCounter | None:
+        """The live counter of `key` (marked as recently used), None if absent or expired."""
+        counter = self.counters.get(key)
+        if counter is None:
+            return None
+        if counter.expires_at <= now:
+            del self.counters[key]
+            return None
+        self.counters.move_to_end(key)
+        return counter
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with self.lock:
+            counter = self.counter(key, now)
+            if counter is None:
+                counter = self.counters[key] = WindowCounter(now + expiry)
+                if len(self.counters) > self.max_keys:
+                    self.counters.popitem(last=False)
+            counter.pending += amount
+            self.increment(key, expiry, amount)
+            return counter.synced + counter.pending
+
+    def increment(self, key: str, expiry: int, amount: int) -> None:
+        """Hook called (under the lock) for every local increment."""
+
+    def get(self, key: str) -> int:
+        with self.lock:
+            counter = self.counter(key, time.time())
+            return counter.synced + counter.pending if counter else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        with self.lock:
+            counter = self.counter(key, now)
+            return counter.expires_at if counter else now
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> int | None:
+        with self.lock:
+            cleared = len(self.counters)
+            self.counters.clear()
+        return cleared
+
+    def clear(self, key: str) -> None:
+        with self.lock:
+            self.counters.pop(key, None)
+
+
+class PostgresStorage(BoundedMemoryStorage):
+    """Bounded local counters, synchronized in batches with the rate_limit_counters table."""
+
+    STORAGE_SCHEME = ["claimdb"]
+
+    def __init__(self, uri: str | None = None, wrap_exceptions: bool = False, engine=None,
+                 sync_seconds: float = RATE_LIMIT_SYNC_SECONDS, **options):
+        self.engine = engine if engine is not None else default_engine
+        self.sync_seconds = sync_seconds
+        # Increments not added to the shared counters yet: key -> [amount, window length]
+        self.unsynced: dict[str, list[int]] = {}
+        self.last_cleanup = time.monotonic()
+        self.thread: threading.Thread | None = None
+        self.thread_pid: int | None = None
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    def increment(self, key: str, expiry: int, amount: int) -> None:
+        pending = self.unsynced.setdefault(key, [0, expiry])
+        pending[0] += amount
+        # Started on first use, so each forked worker gets its own sync thread
+        if self.thread_pid != os.getpid():
+            self.thread_pid = os.getpid()
+            self.thread = threading.Thread(target=self.run_sync, name="rate-limit-sync", daemon=True)
+            self.thread.start()
+
+    def run_sync(self) -> None:
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Failed to sync the rate limit counters")
+
+    def sync(self) -> int:
+        """Add the local increments to the shared counters and refresh the local totals.
+
+        Returns the number of keys synced. On failure the increments are kept
+        for the next attempt.
+        """
+        with self.lock:
+            batch, self.unsynced = self.unsynced, {}
+        if not batch:
+            return 0
+
+        # Sorted, so that concurrent syncs of several processes lock the rows in the same order
+        keys = sorted(batch)
+        params = {
+            "keys": keys,
+            "counts": [batch[key][0] for key in keys],
+            "expiries": [batch[key][1] for key in keys],
+        }
+        try:
+            with self.engine.begin() as connection:
+                totals = connection.execute(SYNC_STATEMENT, params).all()
+                if time.monotonic() - self.last_cleanup >= RATE_LIMIT_CLEANUP_SECONDS:
+                    connection.execute(delete(RateLimitCounter).where(RateLimitCounter.expires_at < func.now()))
+                    self.last_cleanup = time.monotonic()
+        except Exception:
+            with self.lock:
+                for key, (amount, expiry) in batch.items():
+                    self.unsynced.setdefault(key, [0, expiry])[0] += amount
+            raise
+
+        now = time.time()
+        with self.lock:
+            for key, total, expires_at in totals:
+                counter = self.counter(key, now)
+                if counter is None:
+                    continue
+                counter.synced = total
+                # Hits made while the sync ran stay pending
+                counter.pending = max(counter.pending - batch[key][0], 0)
+                counter.expires_at = expires_at.timestamp()
+        return len(totals)
+
+    def check(self) -> bool:
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+
+    def reset(self) -> int | None:
+        cleared = super().reset()
+        with self.lock:
+            self.unsynced.clear()
+        with self.engine.begin() as connection:
+            connection.execute(delete(RateLimitCounter))
+        return cleared
+
+    def clear(self, key: str) -> None:
+        super().clear(key)
+        with self.lock:
+            self.unsynced.pop(key, None)
+        with self.engine.begin() as connection:
+            connection.execute(delete(RateLimitCounter).where(RateLimitCounter.key == key))
@@ -0,0 +1,198 @@
+"""Cache of the read endpoints' responses, with ETag revalidation.
+
+A GET on a cached route is answered from memory while its entry is fresh: at
+most RESPONSE_CACHE_TTL_SECONDS old, and built before the last change of the
+data the route reads. /top-providers/ reads the "claims" *source*, whose
+version is bumped when this process commits claims, so a claim committed here
+is visible on the next read. Writes made by other processes (other API
+workers, the queue worker, ingest-file) are picked up when the entry expires.
+The summary routes are TTL-only: provider_daily_summary is only written by
+the compaction worker, a separate process whose commits this cache cannot see.
+
+Responses carry a content hash as ETag. A request whose If-None-Match matches
+a fresh entry gets 304 Not Modified before any dependency runs, so without a
+database round trip; a stale entry is recomputed first, and still answers 304
+when the body did not change. A hit still counts against the route's rate
+limit: the middleware hits the counters of the endpoint's @limiter.limit
+through the public `limits` API.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import parse_qsl
+
+from limits import RateLimitItem, parse_many
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+try:
+    from app.metrics import RESPONSE_CACHE_LOOKUPS
+except ModuleNotFoundError:
+    from metrics import RESPONSE_CACHE_LOOKUPS
+
+# How long a cached response is served without being recomputed
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "5"))
+# Responses kept per process; the least recently used one is evicted beyond that
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+# Cache-Control max-age sent to clients; 0 makes them revalidate every time (cheap, with 304)
+RESPONSE_CACHE_MAX_AGE_SECONDS = int(os.getenv("RESPONSE_CACHE_MAX_AGE_SECONDS", "0"))
+
+# Cached routes and the data source each of them reads; None for TTL-only routes
+CACHED_ROUTES = {
+    "/top-providers/": "claims",
+    "/summaries/top-providers": None,
+    "/summaries/trend": None,
+}
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: list[tuple[bytes, bytes]]
+    etag: bytes
+    version: int
+    stored_at: float
+    # Matched route, so the metrics of a hit are recorded under the right template
+    route: object
+
+
+class ResponseCache:
+    """LRU of responses keyed by route and query parameters, invalidated by TTL and source versions."""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.versions: dict[str, int] = {}
+        self.entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+
+    def bump(self, source: str) -> None:
+        """Invalidate the responses built from `source` (call it after committing to it)."""
+        self.versions[source] = self.versions.get(source, 0) + 1
+
+    def version(self, source: str | None) -> int:
+        return self.versions.get(source, 0) if source is not None else 0
+
+    def get(self, key: tuple, source: str | None) -> CachedResponse | None:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != self.version(source) or self.clock() - entry.stored_at >= self.ttl:
+            RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self.entries.move_to_end(key)
+        RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+        return entry
+
+    def put(self, key: tuple, entry: CachedResponse) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+# Process-wide cache used by the middleware
+response_cache = ResponseCache()
+
+
+def cache_key(scope) -> tuple:
+    # Parameter order does not matter: ?limit=5&plan_group=A is ?plan_group=A&limit=5
+    params = tuple(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+    return scope["path"], params
+
+
+def etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    if if_none_match.strip() == b"*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    return any(tag.strip().removeprefix(b"W/") == etag for tag in if_none_match.split(b","))
+
+
+class ResponseCacheMiddleware:
+    """Pure ASGI middleware serving the GETs of CACHED_ROUTES from `cache`.
+
+    `rate_limits` maps a path to the limit string of its @limiter.limit: a hit
+    on that path is counted against `limiter` first, and answered 429 like the
+    route itself would once the limit is exceeded.
+    """
+
+    def __init__(self, app, cache: ResponseCache = response_cache, routes: dict[str, str | None] = CACHED_ROUTES,
+                 max_age: int = RESPONSE_CACHE_MAX_AGE_SECONDS, limiter: Limiter | None = None,
+                 rate_limits: dict[str, str] | None = None):
+        self.app = app
+        self.cache = cache
+        self.routes = routes
+        self.cache_control = f"max-age={max_age}, must-revalidate".encode()
+        self.limiter = limiter
+        self.rate_limits: dict[str, list[RateLimitItem]] = {
+            path: parse_many(limit) for path, limit in (rate_limits or {}).items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        source = self.routes[scope["path"]]
+        key = cache_key(scope)
+        if_none_match = next((value for name, value in scope["headers"] if name == b"if-none-match"), None)
+        entry = self.cache.get(key, source)
+        if entry is not None:
+            scope["route"] = entry.route
+            if await self.within_rate_limit(scope, receive, send):
+                await self.respond(send, entry, if_none_match)
+            return
+
+        # Read before the handler runs: a commit made meanwhile leaves the entry outdated
+        version = self.cache.version(source)
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        if start["status"] != 200:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = b'"' + hashlib.blake2b(body, digest_size=8).hexdigest().encode() + b'"'
+        headers = [(name, value) for name, value in start["headers"] if name not in (b"etag", b"cache-control")]
+        entry = CachedResponse(body, headers, etag, version, self.cache.clock(), scope.get("route"))
+        self.cache.put(key, entry)
+        await self.respond(send, entry, if_none_match)
+
+    async def within_rate_limit(self, scope, receive, send) -> bool:
+        """Count a hit against the path's limits; answers 429 and returns False once one is exceeded."""
+        limits = self.rate_limits.get(scope["path"])
+        if not limits or self.limiter is None or not self.limiter.enabled:
+            return True
+        # The counters of the route's @limiter.limit: the client address, scoped by the path (slowapi's "url" key style)
+        identifiers = (get_remote_address(Request(scope)), scope["path"])
+        for limit in limits:
+            if not self.limiter.limiter.hit(limit, *identifiers):
+                # The body slowapi's handler answers the route's own 429 with
+                response = JSONResponse({"error": f"Rate limit exceeded: {limit}"}, status_code=429)
+                await response(scope, receive, send)
+                return False
+        return True
+
+    async def respond(self, send, entry: CachedResponse, if_none_match: bytes | None) -> None:
+        validators = [(b"etag", entry.etag), (b"cache-control", self.cache_control)]
+        if if_none_match is not None and etag_matches(if_none_match, entry.etag):
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": entry.headers + validators})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -0,0 +1,87 @@
+import base64
+import binascii
+import json
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, func, insert, or_, text
+from sqlmodel import Session, select
+try:
+    from app.models import Claim, ProviderTotal
+except ModuleNotFoundError:
+    from models import Claim, ProviderTotal
+
+
+# Largest page of top providers served at once
+MAX_TOP_PROVIDERS_LIMIT = 100
+
+
+def encode_cursor(total_net_fee: Decimal, provider_npi: str) -> str:
+    """Opaque keyset cursor pointing after the given leaderboard row."""
+    return base64.urlsafe_b64encode(json.dumps([str(total_net_fee), provider_npi]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[Decimal, str]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        total_net_fee, provider_npi = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return Decimal(total_net_fee), str(provider_npi)
+    except (binascii.Error, TypeError, ValueError, ArithmeticError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def after_row(total_net_fee, provider_npi, after: tuple[Decimal, str]):
+    """Keyset condition for rows ranked after `after` in (total desc, provider_npi asc) order."""
+    after_total, after_npi = after
+    return or_(total_net_fee < after_total, and_(total_net_fee == after_total, provider_npi > after_npi))
+
+
+def top_providers_statement(limit: int = 10, after: tuple[Decimal, str] | None = None):
+    """Top providers by net fee, read from the rollup index instead of scanning claims."""
+    statement = select(ProviderTotal.provider_npi, ProviderTotal.total_net_fee)
+    if after is not None:
+        statement = statement.where(after_row(ProviderTotal.total_net_fee, ProviderTotal.provider_npi, after))
+    return statement.order_by(ProviderTotal.total_net_fee.desc(), ProviderTotal.provider_npi).limit(limit)
+
+
+def filtered_top_providers_statement(start: date | None = None, end: date | None = None,
+                                     plan_group: str | None = None, limit: int = 10,
+                                     after: tuple[Decimal, str] | None = None):
+    """Top providers by net fee over the claims with a service date in [start, end] and the given plan group.
+
+    The bounds are plain comparisons on the partition key, so Postgres only
+    scans the monthly partitions that overlap the range. Within them, the
+    covering indexes on (service_date, provider_npi) and (plan_group,
+    service_date) hold every column the query reads, allowing index-only scans.
+    """
+    total_net_fee = func.sum(Claim.net_fee).label("total_net_fee")
+    statement = select(Claim.provider_npi, total_net_fee)
+    if start is not None:
+        statement = statement.where(Claim.service_date >= start)
+    if end is not None:
+        statement = statement.where(Claim.service_date <= end)
+    if plan_group is not None:
+        statement = statement.where(Claim.plan_group == plan_group)
+    statement = statement.group_by(Claim.provider_npi)
+    if after is not None:
+        statement = statement.having(after_row(func.sum(Claim.net_fee), Claim.provider_npi, after))
+    return statement.order_by(total_net_fee.desc(), Claim.provider_npi).limit(limit)
+
+
+def backfill_provider_totals(session: Session) -> int:
+    """Rebuild provider_totals from the claim table and return the number of providers.
+
+    Claim inserts are blocked (SHARE lock) until the rebuild commits, so no
+    claim can be counted twice or missed by the trigger while it runs.
+    """
+    session.exec(text("LOCK TABLE claim IN SHARE MODE"))
+    session.exec(delete(ProviderTotal))
+    result = session.exec(
+        insert(ProviderTotal).from_select(
+            ["provider_npi", "total_net_fee", "claim_count"],
+            select(Claim.provider_npi, func.sum(Claim.net_fee), func.count())
+            .group_by(Claim.provider_npi),
+        )
+    )
+    session.commit()
+    return result.rowcount
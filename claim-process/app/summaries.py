@@ -0,0 +1,152 @@
+"""Daily provider summaries, compacted incrementally from the claim table.
+
+Every claim records the id of the transaction that wrote it (`ingest_xid`). A
+compaction run folds the claims written by the transactions between the stored
+watermark and the oldest transaction still running into provider_daily_summary,
+then moves the watermark, all in one transaction. Transactions older than that
+horizon have finished, so a later run can never find an older claim it missed,
+and no claim is counted twice. The price is that a long-running transaction
+delays the compaction of every claim written after it started.
+
+The summary endpoints read provider_daily_summary only: a year of history is a
+few rows per provider and day instead of every claim.
+"""
+import logging
+import os
+import time
+from datetime import date
+
+from sqlalchemy import Date, DateTime, cast, func, literal_column, or_, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+try:
+    from app.models import Claim, CompactionWatermark, ProviderDailySummary
+except ModuleNotFoundError:
+    from models import Claim, CompactionWatermark, ProviderDailySummary
+
+logger = logging.getLogger(__name__)
+
+DAILY_SUMMARY_JOB = "provider_daily_summary"
+# Pause between two compaction runs of the worker
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "60"))
+# Granularities of the trend endpoint (date_trunc fields)
+TREND_INTERVALS = ("day", "week", "month")
+
+
+def compact_daily_summary(session: Session) -> int:
+    """Fold the claims committed since the previous run into provider_daily_summary.
+
+    Concurrent runs are serialized on the watermark row. Returns the number of
+    summary rows inserted or updated.
+    """
+    session.exec(
+        insert(CompactionWatermark).values(job=DAILY_SUMMARY_JOB, watermark=0).on_conflict_do_nothing()
+    )
+    watermark = session.exec(
+        select(CompactionWatermark).where(CompactionWatermark.job == DAILY_SUMMARY_JOB).with_for_update()
+    ).one()
+    # Every transaction below the snapshot's xmin has committed or aborted
+    horizon = session.exec(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).one()[0]
+
+    new_claims = (Claim.ingest_xid >= watermark.watermark) & (Claim.ingest_xid < horizon)
+    if watermark.watermark == 0:
+        # First run: also take the claims written before ingest_xid existed
+        new_claims = or_(new_claims, Claim.ingest_xid.is_(None))
+    source = (
+        select(
+            Claim.provider_npi,
+            Claim.service_date,
+            Claim.plan_group,
+            func.sum(Claim.net_fee),
+            func.count(),
+            func.sum(Claim.provider_fees),
+            func.sum(Claim.allowed_fees),
+        )
+        .where(new_claims)
+        .group_by(Claim.provider_npi, Claim.service_date, Claim.plan_group)
+    )
+    statement = insert(ProviderDailySummary).from_select(
+        ["provider_npi", "day", "plan_group", "sum_net_fee", "claim_count", "sum_provider_fees", "sum_allowed_fees"],
+        source,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["provider_npi", "day", "plan_group"],
+        set_={
+            column: getattr(ProviderDailySummary, column) + getattr(statement.excluded, column)
+            for column in ("sum_net_fee", "claim_count", "sum_provider_fees", "sum_allowed_fees")
+        },
+    )
+    result = session.exec(statement)
+
+    watermark.watermark = horizon
+    watermark.updated_at = func.now()
+    session.add(watermark)
+    session.commit()
+    # Runs outside the API processes: their cached summary responses expire with the TTL
+    return result.rowcount
+
+
+def run_compaction_worker(session_factory, interval: float = COMPACTION_INTERVAL_SECONDS) -> None:
+    """Compact forever, one run (and one transaction) every `interval` seconds."""
+    while True:
+        try:
+            with session_factory() as session:
+                rows = compact_daily_summary(session)
+            logger.info("Compacted new claims into %d daily summary rows", rows)
+        except Exception:
+            logger.exception("Failed to compact the daily summaries")
+        time.sleep(interval)
+
+
+def summary_filters(start: date | None, end: date | None, plan_group: str | None,
+                    provider_npi: str | None = None) -> list:
+    filters = []
+    if start is not None:
+        filters.append(ProviderDailySummary.day >= start)
+    if end is not None:
+        filters.append(ProviderDailySummary.day <= end)
+    if plan_group is not None:
+        filters.append(ProviderDailySummary.plan_group == plan_group)
+    if provider_npi is not None:
+        filters.append(ProviderDailySummary.provider_npi == provider_npi)
+    return filters
+
+
+def summary_top_providers_statement(start: date | None = None, end: date | None = None,
+                                    plan_group: str | None = None, limit: int = 10):
+    """Top providers by net fee over [start, end], read from the daily summaries."""
+    total_net_fee = func.sum(ProviderDailySummary.sum_net_fee).label("total_net_fee")
+    return (
+        select(
+            ProviderDailySummary.provider_npi,
+            total_net_fee,
+            func.sum(ProviderDailySummary.claim_count).label("claim_count"),
+        )
+        .where(*summary_filters(start, end, plan_group))
+        .group_by(ProviderDailySummary.provider_npi)
+        .order_by(total_net_fee.desc(), ProviderDailySummary.provider_npi)
+        .limit(limit)
+    )
+
+
+def summary_trend_statement(start: date | None = None, end: date | None = None, interval: str = "day",
+                            provider_npi: str | None = None, plan_group: str | None = None):
+    """Totals per day, week or month over [start, end], read from the daily summaries."""
+    if interval not in TREND_INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(TREND_INTERVALS)}")
+    # Inlined (it is whitelisted) so the SELECT and GROUP BY expressions are identical
+    period = cast(
+        func.date_trunc(literal_column(f"'{interval}'"), cast(ProviderDailySummary.day, DateTime)), Date
+    ).label("period")
+    return (
+        select(
+            period,
+            func.sum(ProviderDailySummary.sum_net_fee).label("total_net_fee"),
+            func.sum(ProviderDailySummary.claim_count).label("claim_count"),
+            func.sum(ProviderDailySummary.sum_provider_fees).label("total_provider_fees"),
+            func.sum(ProviderDailySummary.sum_allowed_fees).label("total_allowed_fees"),
+        )
+        .where(*summary_filters(start, end, plan_group, provider_npi))
+        .group_by(period)
+        .order_by(period)
+    )
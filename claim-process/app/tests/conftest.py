@@ -1,35 +1,98 @@
+from datetime import date
 import pytest
-from ..database import get_session, engine
-from sqlmodel import SQLModel
-from ..models import Claim
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from ..database import async_engine, engine, read_async_engine
+from ..heavy_hitters import live_top_providers
+from ..leaderboard import leaderboard
+from ..main import app, limiter
+from ..partitions import DEFAULT_PARTITION
+from ..response_cache import response_cache
+from sqlmodel import Session, SQLModel
+from .factories import copy_claims
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "shared_data: reads data a module fixture committed; the tables are not emptied after the test"
+    )
+
+@pytest.fixture(autouse=True, scope="session")
+def database_schema():
+    """Create the schema once for the whole run (each test leaves the tables empty)."""
+    SQLModel.metadata.drop_all(engine)  # Drop the tables of an earlier run (clean state)
+    SQLModel.metadata.create_all(engine)
+    yield
+    SQLModel.metadata.drop_all(engine)
+
+def tables_dirty() -> bool:
+    """True if a test left rows behind or created claim partitions (one round trip)."""
+    checks = [f"EXISTS (SELECT FROM {table.name})" for table in SQLModel.metadata.sorted_tables]
+    checks.append("(SELECT count(*) FROM pg_inherits WHERE inhparent = 'claim'::regclass) > 1")
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT {' OR '.join(checks)}")).scalar()
+
+def empty_tables():
+    """Drop the monthly claim partitions and truncate every table, back to the schema of create_all."""
+    with engine.begin() as connection:
+        partitions = connection.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'claim'::regclass AND c.relname <> :default"
+        ), {"default": DEFAULT_PARTITION}).scalars().all()
+        for name in partitions:
+            connection.execute(text(f"DROP TABLE {name}"))
+        tables = ", ".join(table.name for table in SQLModel.metadata.sorted_tables)
+        connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY"))
 
 @pytest.fixture(autouse=True, scope="function")
-def create_test_database():
-    """Fixture to set up and tear down the test database for each test."""
-    
-    # Drop any existing tables and recreate them to start fresh for tests
-    SQLModel.metadata.drop_all(engine)  # Drop all existing tables (clean state)
-    SQLModel.metadata.create_all(engine)  # Create the tables for the test
+def create_test_database(request):
+    """Fixture to start every test with empty tables and empty in-process caches."""
+    leaderboard.clear()  # Forget the leaderboard of the previous test
+    live_top_providers.clear()  # And the live rankings
+    response_cache.clear()  # And the cached responses
+    limiter.reset()  # Start every test with a fresh rate limit budget
 
     # Yield control back to the test function
     yield
 
-    # After all tests are done, drop all tables to clean up
-    SQLModel.metadata.drop_all(engine)
+    # Rolled back tests leave nothing; the others are cleaned up here
+    if not request.node.get_closest_marker("shared_data") and tables_dirty():
+        empty_tables()
 
 @pytest.fixture(scope="function")
-def session():
-    """Fixture to provide a fresh database session for each test."""
-    
-    # Create a new session for each test function
-    session = next(get_session())
+def commits():
+    """Requested by the tests and fixtures whose data must be committed, to be seen by other connections.
+
+    The `session` fixture of such a test commits for real instead of working in
+    a transaction that is rolled back.
+    """
+
+@pytest.fixture(scope="function")
+def client(commits):
+    """Fixture to provide a test client whose event loop lives for the whole test."""
+    with TestClient(app=app) as client:
+        yield client
+        # Pooled asyncpg connections are bound to this client's event loop
+        client.portal.call(async_engine.dispose)
+        client.portal.call(read_async_engine.dispose)
+
+@pytest.fixture(scope="function")
+def session(request):
+    """Fixture to provide a fresh database session for each test.
 
-    # Yield the session for use in the tests
-    yield session
+    Unless the test `commits`, the session works in an outer transaction that
+    is rolled back after the test: its commits only release SAVEPOINTs.
+    """
+    if "commits" in request.fixturenames:
+        with Session(engine) as session:
+            yield session
+            session.rollback()
+        return
 
-    # Rollback session after each test to ensure a clean state
-    session.rollback()
-    session.close()
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+            yield session
+        transaction.rollback()
 
 # Test setup to insert sample data
 @pytest.fixture
@@ -54,21 +117,11 @@ def insert_sample_data(session):
         {"provider_npi": "2345678901", "net_fee": 1000.0, "provider_fees": 1100.0, "allowed_fees": 1500.0, "member_coinsurance": 60.0, "member_copay": 30.0}
     ]
     
-    # Insert claims into the database
-    for claim_data in sample_claims:
-        claim = Claim(
-            provider_npi=claim_data["provider_npi"],
-            net_fee=claim_data["net_fee"],
-            service_date="2025-01-01",
-            submitted_procedure="procedure_code",
-            quadrant="A",
-            plan_group="group1",
-            subscriber="subscriber1",
-            provider_fees=claim_data["provider_fees"],
-            allowed_fees=claim_data["allowed_fees"],
-            member_coinsurance=claim_data["member_coinsurance"],
-            member_copay=claim_data["member_copay"]
-        )
-        session.add(claim)
+    # Insert claims into the database, with a single COPY
+    copy_claims(session.connection(), (
+        {**claim_data, "service_date": date(2025, 1, 1), "quadrant": "Upper Left"} for claim_data in sample_claims
+    ))
     session.commit()
 
+    # The claims were written behind the service's back, so drop its cached leaderboard
+    leaderboard.clear()
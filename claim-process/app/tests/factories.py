@@ -0,0 +1,92 @@
+"""Claim factories for the tests: rows loaded with COPY, from a few claims to millions.
+
+`copy_claims` streams claims into the claim table with the `COPY` statement of
+the ingest-file command, in the caller's transaction: inside the `session`
+fixture's transaction, a test's claims are rolled back with it. The
+provider_totals trigger fires once per COPY chunk, as for a bulk insert.
+
+`FakeClock` stands in for `time.monotonic` in the in-process caches, whose
+tests move time forward by setting `now`.
+"""
+import csv
+import io
+import random
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import Iterable, Iterator
+
+from sqlalchemy import Connection
+
+from ..ingest import COPY_COLUMNS, COPY_STATEMENT, copy_value
+
+# Rows encoded and sent per COPY statement
+COPY_CHUNK_ROWS = 50_000
+
+CLAIM_DEFAULTS = {
+    "service_date": date(2025, 1, 1),
+    "submitted_procedure": "D0180",
+    "quadrant": None,
+    "plan_group": "group1",
+    "subscriber": "subscriber1",
+    "provider_npi": "1497775530",
+    "provider_fees": Decimal("150.00"),
+    "allowed_fees": Decimal("100.00"),
+    "member_coinsurance": Decimal("0.00"),
+    "member_copay": Decimal("0.00"),
+    "net_fee": Decimal("50.00"),
+}
+
+
+def copy_claims(connection: Connection, claims: Iterable[dict], chunk_rows: int = COPY_CHUNK_ROWS) -> int:
+    """Load claims (each a dict of CLAIM_DEFAULTS overrides) with COPY; returns the number of rows.
+
+    Runs in the connection's current transaction; commit it to make the claims
+    visible to other connections (the app's).
+    """
+    rows = (
+        [copy_value(row[column]) for column in COPY_COLUMNS]
+        for row in ({**CLAIM_DEFAULTS, "id": uuid.uuid4(), **claim} for claim in claims)
+    )
+    loaded = 0
+    with connection.connection.cursor() as cursor:
+        while chunk := list(islice(rows, chunk_rows)):
+            data = io.StringIO()
+            csv.writer(data, quoting=csv.QUOTE_ALL).writerows(chunk)
+            data.seek(0)
+            cursor.copy_expert(COPY_STATEMENT, data)
+            loaded += len(chunk)
+    return loaded
+
+
+def synthetic_claims(count: int, providers: int = 20_000, plan_groups: int = 50, first_day: date = date(2024, 1, 1),
+                     days: int = 366, seed: int = 0) -> Iterator[dict]:
+    """Deterministic claims spread over `days` days, `providers` providers and `plan_groups` plan groups.
+
+    Provider activity is skewed (a few providers send many claims) and the
+    fees are whole cents, so expected totals can be summed exactly.
+    """
+    rng = random.Random(seed)
+    dates = [first_day + timedelta(days=day) for day in range(days)]
+    for _ in range(count):
+        provider = min(int(rng.paretovariate(0.8)), providers) - 1 if rng.random() < 0.3 else rng.randrange(providers)
+        provider_fees = rng.randrange(5_000, 50_000)
+        allowed_fees = rng.randrange(0, provider_fees)
+        yield {
+            "service_date": rng.choice(dates),
+            "plan_group": f"GRP-{rng.randrange(plan_groups)}",
+            "subscriber": f"{rng.randrange(10**10):010d}",
+            "provider_npi": f"{provider:010d}",
+            "provider_fees": Decimal(provider_fees).scaleb(-2),
+            "allowed_fees": Decimal(allowed_fees).scaleb(-2),
+            "net_fee": Decimal(provider_fees - allowed_fees).scaleb(-2),
+        }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
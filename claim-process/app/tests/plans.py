@@ -0,0 +1,52 @@
+"""Query plan assertions for the tests: which index a statement is answered with.
+
+Plans depend on the table statistics: run these on tables loaded with a
+realistic amount of data and analyzed, not on the few rows of a unit test.
+"""
+from fnmatch import fnmatch
+from typing import Iterator
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from ..partitions import DEFAULT_PARTITION
+
+# Tables a sequential scan may read: the default partition stays small while partitions are created ahead
+SMALL_TABLES = (DEFAULT_PARTITION,)
+
+
+def compiled_sql(statement) -> str:
+    """SQL of a statement with its parameters inlined, as the planner sees a one-off query."""
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def explain(connection, statement) -> dict:
+    """EXPLAIN (FORMAT JSON) of a statement: the root plan node."""
+    return connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled_sql(statement)}")).scalar()[0]["Plan"]
+
+
+def plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def assert_index_used(connection, statement, index: str, index_only: bool = False,
+                      small_tables: tuple[str, ...] = SMALL_TABLES) -> list[dict]:
+    """Assert that the plan reads `index` (a glob, for the per-partition names) and scans no large table sequentially.
+
+    Returns the plan nodes, for further checks such as partition pruning.
+    """
+    nodes = list(plan_nodes(explain(connection, statement)))
+    scan_types = ("Index Only Scan",) if index_only else ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+    scans = "\n".join(
+        f"  {node['Node Type']} using {node.get('Index Name', '-')} on {node.get('Relation Name', '-')}"
+        for node in nodes if "Index Name" in node or "Relation Name" in node
+    )
+    assert any(node["Node Type"] in scan_types and fnmatch(node.get("Index Name", ""), index) for node in nodes), (
+        f"{index} is not used; the plan scans:\n{scans}"
+    )
+    assert not any(node["Node Type"] == "Seq Scan" and node["Relation Name"] not in small_tables for node in nodes), (
+        f"Sequential scan in the plan:\n{scans}"
+    )
+    return nodes
@@ -0,0 +1,143 @@
+import pytest
+from sqlmodel import select
+
+from .. import claim_queue, main
+from ..claim_queue import InMemoryClaimQueue, PostgresClaimQueue, get_claim_queue, process_batch
+from ..database import async_session_factory
+from ..models import Claim, ClaimQueueDeadLetter, ClaimQueueItem, ProviderTotal
+
+payload = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_npi": "1497775530",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+@pytest.fixture(params=[InMemoryClaimQueue, PostgresClaimQueue])
+def queue_mode(request, monkeypatch):
+    """Switch /claims/ to queue mode with a fresh queue of each backend."""
+    queue = request.param()
+    monkeypatch.setattr(main, "CLAIM_INGESTION_MODE", "queue")
+    main.app.dependency_overrides[get_claim_queue] = lambda: queue
+    yield queue
+    main.app.dependency_overrides.pop(get_claim_queue)
+
+
+async def drain(queue, max_size=500):
+    async with async_session_factory() as session:
+        return await process_batch(queue, session, max_size=max_size, max_wait=0)
+
+# Test that queue mode accepts the claim without writing it
+def test_process_claim_enqueues(client, session, queue_mode):
+    response = client.post("/claims/", json=payload)
+
+    assert response.status_code == 202
+    data = response.json()
+    assert data["net_fee"] == 50.0
+    assert data["provider_npi"] == payload["provider_npi"]
+
+    assert session.exec(select(Claim)).all() == []
+
+# Test that the worker writes queued claims in batches under the returned id
+def test_process_batch_writes_queued_claims(client, session, queue_mode):
+    ids = [client.post("/claims/", json=payload).json()["id"] for _ in range(3)]
+
+    assert client.portal.call(drain, queue_mode, 2) == 2
+    assert client.portal.call(drain, queue_mode, 2) == 1
+    assert client.portal.call(drain, queue_mode, 2) == 0
+
+    claims = session.exec(select(Claim)).all()
+    assert sorted(str(claim.id) for claim in claims) == sorted(ids)
+    assert session.get(ProviderTotal, payload["provider_npi"]).total_net_fee == 150.0
+    assert session.exec(select(ClaimQueueItem)).all() == []
+
+# Test that a batch which fails to write stays queued
+def test_process_batch_failure_keeps_messages(client, session, queue_mode, monkeypatch):
+    client.post("/claims/", json=payload)
+    client.post("/claims/", json=payload)
+
+    async def failing_insert(session, rows):
+        raise RuntimeError("database unavailable")
+    with monkeypatch.context() as patched:
+        patched.setattr(claim_queue, "insert_claim_rows", failing_insert)
+        with pytest.raises(RuntimeError):
+            client.portal.call(drain, queue_mode)
+
+    assert session.exec(select(Claim)).all() == []
+    assert client.portal.call(drain, queue_mode) == 2
+
+# Test that messages the database rejects are set aside, and the claims queued behind them written
+def test_process_batch_dead_letters_poison_messages(client, session, queue_mode):
+    queued = client.post("/claims/", json=payload).json()["id"]
+    # A plan group longer than its column, and a message that is not a claim, between two valid claims
+    poison = {**payload, "id": "8a3f9c1e-0000-4000-8000-000000000001", "net_fee": "50.00", "plan_group": "G" * 100}
+
+    async def put(messages):
+        async with async_session_factory() as worker_session:
+            await queue_mode.put(worker_session, messages)
+    client.portal.call(put, [poison, {"id": "not a claim"}])
+    valid_after = client.post("/claims/", json=payload).json()["id"]
+
+    assert client.portal.call(drain, queue_mode) == 4
+    assert client.portal.call(drain, queue_mode) == 0
+
+    assert sorted(str(claim.id) for claim in session.exec(select(Claim)).all()) == sorted([queued, valid_after])
+    assert session.get(ProviderTotal, payload["provider_npi"]).claim_count == 2
+    dead_letters = session.exec(select(ClaimQueueDeadLetter).order_by(ClaimQueueDeadLetter.id)).all()
+    assert sorted(dead_letter.payload["id"] for dead_letter in dead_letters) == sorted([poison["id"], "not a claim"])
+    assert any("too long" in dead_letter.error for dead_letter in dead_letters)
+    assert session.exec(select(ClaimQueueItem)).all() == []
+
+# Test that a claim enqueued twice under the same Idempotency-Key is written once
+def test_process_batch_idempotency_key(client, session, queue_mode):
+    headers = {"Idempotency-Key": "queued-retry-test"}
+    ids = [client.post("/claims/", json=payload, headers=headers).json()["id"] for _ in range(2)]
+    assert ids[0] == ids[1]
+
+    assert client.portal.call(drain, queue_mode) == 2
+
+    assert [str(claim.id) for claim in session.exec(select(Claim)).all()] == ids[:1]
+    assert session.get(ProviderTotal, payload["provider_npi"]).claim_count == 1
+
+    # Once written, a retry is answered without queueing, and another service_date is rejected
+    replay = client.post("/claims/", json=payload, headers=headers)
+    assert (replay.status_code, replay.headers["Idempotent-Replayed"]) == (200, "true")
+    assert client.post("/claims/", json={**payload, "service_date": "2025-03-02"}, headers=headers).status_code == 422
+    assert client.portal.call(drain, queue_mode) == 0
+
+# Test that the worker drops a queued claim whose key was used for a different claim
+def test_process_batch_idempotency_key_conflict(client, session, queue_mode):
+    headers = {"Idempotency-Key": "queued-conflict-test"}
+    client.post("/claims/", json=payload, headers=headers)
+    client.post("/claims/", json={**payload, "service_date": "2025-03-02"}, headers=headers)
+
+    assert client.portal.call(drain, queue_mode) == 2
+
+    assert [claim.service_date.isoformat() for claim in session.exec(select(Claim)).all()] == [payload["service_date"]]
+    assert session.get(ProviderTotal, payload["provider_npi"]).claim_count == 1
+
+# Test that a batch waiting to fill up holds no transaction, and that the interface is abstract
+def test_process_batch_waits_outside_transaction(client, session, queue_mode, monkeypatch):
+    client.post("/claims/", json=payload)
+    in_transaction = []
+
+    async def wait_and_drain():
+        async with async_session_factory() as worker_session:
+            async def sleep(seconds):
+                in_transaction.append(worker_session.in_transaction())
+            monkeypatch.setattr(claim_queue.asyncio, "sleep", sleep)
+            return await process_batch(queue_mode, worker_session, max_size=2, max_wait=0.05)
+
+    # The batch is not full: it waits for max_wait, then writes the one claim
+    assert client.portal.call(wait_and_drain) == 1
+    assert in_transaction and not any(in_transaction)
+
+    with pytest.raises(TypeError):
+        claim_queue.ClaimQueue()
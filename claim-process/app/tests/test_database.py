@@ -0,0 +1,166 @@
+import asyncio
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+
+from .. import database
+from ..database import (
+    ASYNC_READ_DATABASE_URL, ReplicaMonitor, SlowQueryLog, engine, init_db, migration_heads, migrations_at_head,
+    read_async_engine
+)
+from ..metrics import READ_SESSIONS
+from .factories import FakeClock
+
+
+def stamp(revision: str) -> None:
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE IF NOT EXISTS alembic_version (version_num varchar(32) PRIMARY KEY)"))
+        connection.execute(text("DELETE FROM alembic_version"))
+        connection.execute(text("INSERT INTO alembic_version VALUES (:revision)"), {"revision": revision})
+
+
+# Test that create_all only runs at startup when the schema is not at the Alembic head
+def test_init_db_skips_create_all_at_head():
+    # The tests may share the database of a migrated dev server: put its stamp back afterwards
+    had_stamp = inspect(engine).has_table("alembic_version")
+    if had_stamp:
+        with engine.connect() as connection:
+            previous = connection.execute(text("SELECT version_num FROM alembic_version")).scalars().all()
+    try:
+        SQLModel.metadata.drop_all(engine)
+        assert not migrations_at_head()
+        init_db()
+        assert inspect(engine).has_table("claim")
+
+        SQLModel.metadata.drop_all(engine)
+        stamp("0000000000")
+        assert not migrations_at_head()
+
+        # At the head, the schema is left to Alembic
+        (head,) = migration_heads()
+        stamp(head)
+        assert migrations_at_head()
+        init_db()
+        assert not inspect(engine).has_table("claim")
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        for revision in previous if had_stamp else ():
+            stamp(revision)
+        # The other tests share the schema created for the run
+        SQLModel.metadata.create_all(engine)
+
+
+def check_replica(url: str, **options) -> tuple[bool, float | None]:
+    async def check():
+        replica = create_async_engine(url)
+        try:
+            monitor = ReplicaMonitor(replica, **options)
+            return await monitor.use_replica(), monitor.lag
+        finally:
+            await replica.dispose()
+    return asyncio.run(check())
+
+
+# Test that a database that is not in recovery has no lag, and an unreachable replica is not used
+def test_replica_monitor_lag():
+    assert check_replica(ASYNC_READ_DATABASE_URL) == (True, 0.0)
+    unreachable = ASYNC_READ_DATABASE_URL.replace(f"@{database.DATABASE_READ_HOST}/", "@127.0.0.1:1/")
+    assert check_replica(unreachable) == (False, None)
+
+
+# Test that reads fall back to the primary while the replica lags, rechecking once per period
+def test_replica_monitor_falls_back_on_lag():
+    lags = iter([0.5, 12.0, 3.0])
+
+    async def measure_lag():
+        return next(lags)
+
+    monitor = ReplicaMonitor(None, max_lag=5, check_seconds=1, clock=FakeClock())
+    monitor.measure_lag = measure_lag
+
+    async def decisions():
+        result = [await monitor.use_replica()]
+        monitor.clock.now = 0.5
+        result.append(await monitor.use_replica())  # Cached: still 0.5s
+        monitor.clock.now = 1
+        result.append(await monitor.use_replica())  # 12s behind
+        monitor.clock.now = 2
+        result.append(await monitor.use_replica())  # Caught up to 3s
+        return result
+
+    assert asyncio.run(decisions()) == [True, True, False, True]
+
+
+# Test that the read-only endpoints are routed through the replica engine, and to the primary on fallback
+def test_read_endpoints_use_replica(client, monkeypatch):
+    def sessions(target):
+        return READ_SESSIONS.labels(target)._value.get()
+
+    # No replica configured: one engine, and reads go to the primary without a lag check
+    assert read_async_engine is database.async_engine
+    replica, primary = sessions("replica"), sessions("primary")
+    assert client.get("/summaries/top-providers").status_code == 200
+    assert (sessions("replica") - replica, sessions("primary") - primary) == (0, 1)
+
+    monkeypatch.setattr(database, "REPLICA_CONFIGURED", True)
+    replica, primary = sessions("replica"), sessions("primary")
+    assert client.get("/summaries/top-providers", params={"from": "2025-01-01"}).status_code == 200
+    assert client.get("/top-providers/").status_code == 200
+    assert (sessions("replica") - replica, sessions("primary") - primary) == (2, 0)
+
+    async def lagging():
+        return False
+
+    monkeypatch.setattr(database.replica_monitor, "use_replica", lagging)
+    assert client.get("/summaries/trend").status_code == 200
+    assert client.get("/claims/export").status_code == 200
+    assert (sessions("replica") - replica, sessions("primary") - primary) == (2, 2)
+
+
+# Test that slow queries are logged with their parameters, and sampled SELECTs with their plan
+def test_slow_query_log(client, caplog):
+    # The first slow query is not sampled, the others are
+    samples = iter([0.9] + [0.1] * 10)
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=0.5, sample=lambda: next(samples))
+    slow_query_log.attach(read_async_engine.sync_engine)
+    caplog.set_level(logging.WARNING, logger=database.__name__)
+    try:
+        for limit in (5, 10):
+            response = client.get("/top-providers/", params={"from": "2025-01-01", "to": "2025-01-31", "limit": limit})
+            assert response.status_code == 200
+    finally:
+        slow_query_log.detach(read_async_engine.sync_engine)
+
+    messages = [record.getMessage() for record in caplog.records]
+    slow = [message for message in messages if message.startswith("Slow query")]
+    assert any("FROM claim" in message and "datetime.date(2025, 1, 31)" in message for message in slow)
+    plans = [message for message in messages if message.startswith("Plan of the slow query")]
+    assert len(plans) == len(slow) - 1
+    assert all("actual time=" in plan and "Buffers:" in plan for plan in plans)
+
+
+# Test that writes are never explained again and that a failing EXPLAIN leaves the transaction usable
+def test_slow_query_log_explains_only_selects(caplog):
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1)
+    slow_query_log.attach(engine)
+    caplog.set_level(logging.WARNING, logger=database.__name__)
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TEMPORARY TABLE explained (n int) ON COMMIT DROP"))
+            connection.execute(text("INSERT INTO explained VALUES (1)"))
+            assert connection.execute(text("SELECT count(*) FROM explained")).scalar() == 1
+
+            # The EXPLAIN fails in its savepoint, the transaction goes on
+            assert slow_query_log.explain(connection, "SELECT * FROM not_a_table", {}) is None
+            assert connection.execute(text("SELECT n FROM explained")).scalar() == 1
+    finally:
+        slow_query_log.detach(engine)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Slow query") and "INSERT INTO explained" in message for message in messages)
+    plans = [message for message in messages if message.startswith("Plan of the slow query")]
+    # The two SELECTs, not the INSERT
+    assert len(plans) == 2 and "Aggregate" in plans[0]
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+
+from .. import exports
+from ..exports import export_claims_statement, stream_claims
+
+payload = {
+    "submitted_procedure": "D0180",
+    "quadrant": "UL",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+def post_claims(client, *claims) -> list[str]:
+    """Post (service_date, provider_npi) claims and return their ids."""
+    return [
+        client.post("/claims/", json={**payload, "service_date": service_date, "provider_npi": provider_npi}).json()["id"]
+        for service_date, provider_npi in claims
+    ]
+
+
+# Test the NDJSON export and its filters
+def test_export_claims_ndjson(client):
+    ids = post_claims(client, ("2025-01-15", "1111111111"), ("2025-02-15", "1111111111"), ("2025-01-20", "2222222222"))
+
+    response = client.get("/claims/export", params={"provider_npi": "1111111111", "from": "2025-02-01"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == [{
+        "id": ids[1], "service_date": "2025-02-15", "submitted_procedure": "D0180", "quadrant": "Upper Left",
+        "plan_group": "GRP-1000", "subscriber": "3730189502", "provider_npi": "1111111111", "provider_fees": 150.0,
+        "allowed_fees": 100.0, "member_coinsurance": 0.0, "member_copay": 0.0, "net_fee": 50.0,
+    }]
+
+    response = client.get("/claims/export")
+    assert sorted(json.loads(line)["id"] for line in response.text.splitlines()) == sorted(ids)
+
+    assert client.get("/claims/export", params={"from": "2025-02-01", "to": "2025-01-01"}).status_code == 400
+    assert client.get("/claims/export", params={"format": "xml"}).status_code == 422
+
+
+# Test the CSV export: a header row, then one row per claim with exact amounts
+def test_export_claims_csv(client):
+    post_claims(client, ("2025-01-15", "1111111111"), ("2025-01-20", "2222222222"))
+
+    response = client.get("/claims/export", params={"format": "csv", "to": "2025-01-15"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="claims.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1
+    assert rows[0]["provider_npi"] == "1111111111"
+    assert rows[0]["quadrant"] == "Upper Left"
+    assert rows[0]["net_fee"] == "50.00"
+    assert "ingest_xid" not in rows[0]
+
+
+# Test that rows are fetched and sent in batches of the server-side cursor
+def test_export_streams_in_batches(client, monkeypatch):
+    post_claims(client, *[("2025-01-15", "1111111111")] * 5)
+
+    async def collect():
+        return [chunk async for chunk in stream_claims(export_claims_statement(), "ndjson", batch_size=2)]
+
+    chunks = client.portal.call(collect)
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+    # The endpoint uses the configured batch size
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 2)
+    assert len(client.get("/claims/export").text.splitlines()) == 5
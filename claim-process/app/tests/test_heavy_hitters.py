@@ -0,0 +1,108 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+from ..heavy_hitters import SlidingTopK, SpaceSaving
+from .factories import FakeClock
+
+payload = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_npi": "1497775530",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+def make_window(capacity=3, clock=None):
+    # 60s window of 30 buckets of 2s, merged on every read
+    return SlidingTopK(60, capacity=capacity, refresh_seconds=0, clock=clock or FakeClock())
+
+
+# Test that the summary is exact while it holds fewer providers than its capacity
+def test_space_saving_exact_below_capacity():
+    summary = SpaceSaving(4)
+    for key, weight in [("a", 10), ("b", 5), ("a", 2), ("c", 1), ("b", 0), ("c", -4)]:
+        summary.add(key, weight)
+
+    assert summary.counts == {"a": 12, "b": 5, "c": 1}
+    assert summary.floor() == 0
+    assert summary.total == 18
+
+
+# Test the documented bounds on a skewed stream with many more providers than counters
+def test_error_bounds_hold_with_evictions():
+    rng = random.Random(7)
+    window = make_window(capacity=20)
+    exact = defaultdict(float)
+    for step in range(20000):
+        window.clock.now = step * 0.002  # 40s: spread over 20 buckets
+        key = f"{min(int(rng.paretovariate(1.2)), 500):010d}"
+        weight = rng.uniform(1, 100)
+        window.add(key, weight)
+        exact[key] += weight
+
+    ranking = window.top()
+    assert ranking["total_net_fee"] == pytest.approx(sum(exact.values()))
+    assert ranking["max_error"] <= ranking["total_net_fee"] / 20
+    listed = {key: (estimate, max_error) for key, estimate, max_error in ranking["top_providers"]}
+    for key, estimate_and_error in listed.items():
+        estimate, max_error = estimate_and_error
+        assert estimate - max_error - 1e-6 <= exact[key] <= estimate + 1e-6
+        assert max_error <= ranking["max_error"] + 1e-6
+    # Whoever is not listed has at most the window's error bound
+    assert all(total <= ranking["max_error"] + 1e-6 for key, total in exact.items() if key not in listed)
+    # The heaviest provider comes first
+    assert ranking["top_providers"][0][0] == max(exact, key=exact.get)
+
+
+# Test that the window slides one bucket at a time
+def test_window_slides():
+    window = make_window()
+    window.add("a", 10)
+    window.clock.now = 30
+    window.add("b", 5)
+
+    assert [row[:2] for row in window.top()["top_providers"]] == [("a", 10), ("b", 5)]
+    window.clock.now = 60
+    assert [row[:2] for row in window.top()["top_providers"]] == [("b", 5)]
+    window.clock.now = 90
+    assert window.top() == {"total_net_fee": 0.0, "max_error": 0.0, "top_providers": []}
+
+
+# Test that the ranking is only recomputed once the refresh period is over
+def test_ranking_refresh():
+    window = SlidingTopK(60, capacity=3, refresh_seconds=1, clock=FakeClock())
+    window.add("a", 10)
+    assert window.top()["total_net_fee"] == 10
+    window.add("a", 10)
+    assert window.top()["total_net_fee"] == 10
+    window.clock.now = 1
+    assert window.top()["total_net_fee"] == 20
+
+
+# Test the live endpoint fed by single and bulk inserts
+def test_live_top_providers_endpoint(client):
+    assert client.post("/claims/", json=payload).status_code == 200
+    assert client.post("/claims/", json={**payload, "provider_npi": "1111111111", "provider_fees": 300.00}).status_code == 200
+    response = client.post("/claims/bulk", json=[{**payload, "provider_npi": "2222222222"}] * 2)
+    assert response.status_code == 200
+
+    response = client.get("/top-providers/live", params={"window": "1h", "limit": 2})
+    assert response.status_code == 200
+    assert response.json() == {
+        "window": "1h",
+        "total_net_fee": 350.0,
+        "max_error": 0.0,
+        "top_providers": [
+            {"provider_npi": "1111111111", "total_net_fee": 200.0, "max_error": 0.0},
+            {"provider_npi": "2222222222", "total_net_fee": 100.0, "max_error": 0.0},
+        ],
+    }
+    assert client.get("/top-providers/live", params={"window": "2h"}).status_code == 422
@@ -0,0 +1,85 @@
+import csv
+import json
+from decimal import Decimal
+
+import pytest
+from sqlmodel import select
+
+from .. import ingest
+from ..database import engine
+from ..ingest import ingest_file, read_checkpoint
+from ..models import Claim, ProviderTotal, Quadrant
+
+claim = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "UL",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_npi": "1497775530",
+    "provider_fees": "150.10",
+    "allowed_fees": "100.00",
+    "member_coinsurance": "0.00",
+    "member_copay": "0.00"
+}
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(claim))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+# Test that valid rows are loaded with their net_fee and invalid rows go to the rejects file
+def test_ingest_csv(session, tmp_path):
+    rows = [claim, {**claim, "provider_npi": "14977"}, {**claim, "quadrant": ""}, {**claim, "subscriber": "S,\"1\""}]
+    path = write_csv(tmp_path / "claims.csv", rows)
+
+    report = ingest_file(engine, path, chunk_size=2, workers=2)
+
+    assert (report.loaded, report.rejected, report.skipped) == (3, 1, 0)
+    claims = session.exec(select(Claim)).all()
+    assert sorted(claim.subscriber for claim in claims) == ["3730189502", "3730189502", "S,\"1\""]
+    assert {claim.net_fee for claim in claims} == {Decimal("50.10")}
+    assert {claim.quadrant for claim in claims} == {Quadrant.UPPER_LEFT, None}
+    # COPY fires the provider_totals trigger like any insert
+    assert session.get(ProviderTotal, "1497775530").claim_count == 3
+
+    rejects = [json.loads(line) for line in open(tmp_path / "claims.csv.rejects.ndjson")]
+    assert [(reject["row"], reject["errors"][0]["loc"]) for reject in rejects] == [(2, ["provider_npi"])]
+
+    # Running it again finds everything checkpointed
+    report = ingest_file(engine, path, chunk_size=2, workers=2)
+    assert (report.loaded, report.skipped) == (0, 4)
+    assert len(session.exec(select(Claim)).all()) == 3
+
+
+# Test that an interrupted NDJSON load resumes after its last committed chunk
+def test_ingest_ndjson_resumes(session, tmp_path, monkeypatch):
+    path = tmp_path / "claims.ndjson"
+    path.write_text("".join(json.dumps({**claim, "subscriber": f"S{i}"}) + "\n" for i in range(5)) + "{not json\n")
+
+    copy_chunk = ingest.copy_chunk
+    calls = []
+
+    def failing_copy_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        copy_chunk(*args)
+
+    monkeypatch.setattr(ingest, "copy_chunk", failing_copy_chunk)
+    with pytest.raises(RuntimeError):
+        ingest_file(engine, path, chunk_size=2, workers=1)
+    assert len(session.exec(select(Claim)).all()) == 2
+    assert read_checkpoint(engine, str(path.resolve())) == 2
+
+    report = ingest_file(engine, path, chunk_size=2, workers=1)
+
+    assert (report.loaded, report.rejected, report.skipped) == (3, 1, 2)
+    session.expire_all()
+    assert sorted(claim.subscriber for claim in session.exec(select(Claim)).all()) == [f"S{i}" for i in range(5)]
+    rejects = [json.loads(line) for line in open(tmp_path / "claims.ndjson.rejects.ndjson")]
+    assert [(reject["row"], reject["input"]) for reject in rejects] == [(6, "{not json")]
@@ -0,0 +1,61 @@
+from ..leaderboard import LeaderboardCache
+from .factories import FakeClock
+
+
+def make_cache(rows, size=3, ttl=60):
+    clock = FakeClock()
+    cache = LeaderboardCache(size=size, ttl=ttl, clock=clock)
+    cache.load(rows)
+    return cache, clock
+
+# Test that reads are hits until the TTL forces a reload
+def test_top_hits_until_ttl_expires():
+    cache, clock = make_cache([("a", 30.0), ("b", 20.0), ("c", 10.0)])
+
+    assert cache.top() == [("a", 30.0), ("b", 20.0), ("c", 10.0)]
+    clock.now = 59
+    assert cache.top() is not None
+    clock.now = 60
+    assert cache.top() is None
+
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 3, "fresh": False}
+
+# Test that fees of cached providers are applied locally and reorder the board
+def test_apply_updates_cached_provider():
+    cache, _ = make_cache([("a", 30.0), ("b", 20.0), ("c", 10.0)])
+
+    assert cache.apply("c", 25.0)
+
+    assert cache.top() == [("c", 35.0), ("a", 30.0), ("b", 20.0)]
+
+# Test that an unknown provider needs its exact total when the board is full
+def test_apply_unknown_provider_needs_total():
+    cache, _ = make_cache([("a", 30.0), ("b", 20.0), ("c", 10.0)])
+
+    assert not cache.apply("d", 15.0)
+    assert cache.apply("d", -5.0)
+
+    cache.record("d", 15.0)
+    assert cache.top() == [("a", 30.0), ("b", 20.0), ("d", 15.0)]
+
+    cache.record("e", 5.0)
+    assert cache.top() == [("a", 30.0), ("b", 20.0), ("d", 15.0)]
+
+# Test that a board holding every provider admits new providers directly
+def test_apply_on_complete_board():
+    cache, _ = make_cache([("a", 30.0)])
+
+    assert cache.apply("b", 5.0)
+    assert cache.apply("c", 50.0)
+    assert cache.apply("d", 1.0)
+
+    assert cache.top() == [("c", 50.0), ("a", 30.0), ("b", 5.0)]
+    assert not cache.complete
+
+# Test that a cached provider dropping below the floor invalidates the board
+def test_record_drop_below_floor_invalidates():
+    cache, _ = make_cache([("a", 30.0), ("b", 20.0), ("c", 10.0)])
+
+    cache.record("b", 5.0)
+
+    assert cache.top() is None
@@ -1,13 +1,18 @@
-from fastapi.testclient import TestClient
-from ..main import app
-from ..models import Claim
+import json
+from datetime import date
+from decimal import Decimal
+from .. import claims
+from ..claims import validate_claim
+from ..database import async_engine
+from ..leaderboard import leaderboard
+from ..models import Claim, ProviderTotal, Quadrant
+from ..rollups import backfill_provider_totals
+from sqlalchemy import delete, event
 from sqlmodel import select
 
 
-client = TestClient(app=app)
-
 # Define a test case for valid data
-def test_process_claim_valid(session):
+def test_process_claim_valid(client, session):
     payload = {
         "service_date": "2025-01-15",
         "submitted_procedure": "D0180",
@@ -42,7 +47,7 @@ def test_process_claim_valid(session):
     stmt = select(Claim).where(Claim.id == data["id"])
     db_claim = session.exec(stmt).first()
     assert db_claim is not None  # Ensure the claim exists in the database
-    assert db_claim.service_date == payload["service_date"]
+    assert db_claim.service_date.isoformat() == payload["service_date"]
     assert db_claim.submitted_procedure == payload["submitted_procedure"]
     assert db_claim.quadrant == payload["quadrant"]
     assert db_claim.plan_group == payload["plan_group"]
@@ -62,7 +67,7 @@ def test_process_claim_valid(session):
     assert total_claims == 1  # Check that only one claim has been inserted
 
 # Test when 'submitted_procedure' does not start with 'D'
-def test_process_claim_invalid_procedure(session):
+def test_process_claim_invalid_procedure(client, session):
     payload = {
         "service_date": "2025-01-15",
         "submitted_procedure": "A0180",  # Invalid, does not start with 'D'
@@ -99,7 +104,7 @@ def test_process_claim_invalid_procedure(session):
 
 
 # Test when 'provider_npi' is not a 10-digit number
-def test_process_claim_invalid_npi(session):
+def test_process_claim_invalid_npi(client, session):
     payload = {
         "service_date": "2025-01-15",
         "submitted_procedure": "D0180",
@@ -136,7 +141,7 @@ def test_process_claim_invalid_npi(session):
     assert total_claims == 0
 
 # Test missing required fields
-def test_process_claim_missing_fields(session):
+def test_process_claim_missing_fields(client, session):
     payload = {}
     # Notice that quadrant is not a required field
     expected_require_fields = [
@@ -175,7 +180,7 @@ def test_process_claim_missing_fields(session):
     assert total_claims == 0
 
 # Test function for the get_top_providers endpoint
-def test_get_top_providers_with_duplicate_providers(insert_sample_data, session):
+def test_get_top_providers_with_duplicate_providers(client, insert_sample_data, session):
 
     # Send GET request to the /top-providers/ endpoint
     response = client.get("/top-providers/")
@@ -199,3 +204,375 @@ def test_get_top_providers_with_duplicate_providers(insert_sample_data, session)
     # Check that the last provider has the lowest net fee
     assert data["top_providers"][-1]["provider_npi"] == "7890123456"
     assert data["top_providers"][-1]["total_net_fee"] == 2000
+
+# Test bulk ingestion from a JSON array with an invalid row in the middle
+def test_process_claims_bulk_json_array(client, session):
+    valid_claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "quadrant": "Upper",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 10.00,
+        "member_copay": 5.00
+    }
+    payload = [valid_claim, {**valid_claim, "provider_npi": "14977"}, valid_claim]
+
+    response = client.post("/claims/bulk", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["inserted"] == 2
+    assert data["failed"] == 1
+    assert [claim["index"] for claim in data["claims"]] == [0, 2]
+    assert data["errors"][0]["index"] == 1
+    assert data["errors"][0]["errors"][0]["loc"] == ["provider_npi"]
+    assert data["errors"][0]["errors"][0]["msg"] == "Value error, Provider NPI must be a 10-digit number"
+
+    # Check that only the valid rows were written, with their net_fee
+    results = session.exec(select(Claim)).all()
+    assert len(results) == 2
+    assert {str(claim.id) for claim in results} == {claim["id"] for claim in data["claims"]}
+    assert all(claim.net_fee == 65.00 for claim in results)
+
+# Test bulk ingestion from an NDJSON stream, including a malformed line
+def test_process_claims_bulk_ndjson(client, session):
+    valid_claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 100.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    body = "\n".join([json.dumps(valid_claim), "{not json", json.dumps(valid_claim), ""])
+
+    response = client.post("/claims/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["inserted"] == 2
+    assert data["errors"][0]["index"] == 1
+    assert data["errors"][0]["errors"][0]["type"] == "json_invalid"
+
+    results = session.exec(select(Claim)).all()
+    assert len(results) == 2
+
+# Test that a body which is not a JSON array is rejected as a whole
+def test_process_claims_bulk_not_an_array(client, session):
+    response = client.post("/claims/bulk", json={"service_date": "2025-01-15"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Request body must be a JSON array of claims"}
+
+# Test that provider_totals is kept in step with every claim insert path
+def test_provider_totals_follow_claim_inserts(client, session):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+
+    assert client.post("/claims/", json=claim).status_code == 200
+    assert client.post("/claims/bulk", json=[claim, {**claim, "provider_npi": "2345678901"}]).status_code == 200
+
+    totals = {total.provider_npi: total for total in session.exec(select(ProviderTotal)).all()}
+    assert totals["1497775530"].total_net_fee == 100.0
+    assert totals["1497775530"].claim_count == 2
+    assert totals["2345678901"].total_net_fee == 50.0
+    assert totals["2345678901"].claim_count == 1
+
+# Test that the backfill rebuilds provider_totals from the claim table
+def test_backfill_provider_totals(insert_sample_data, session):
+    session.exec(delete(ProviderTotal))
+    session.commit()
+
+    assert backfill_provider_totals(session) == 13
+
+    total = session.get(ProviderTotal, "1234567890")
+    assert total.total_net_fee == 7000.0
+    assert total.claim_count == 2
+
+# Test that committed claims update the cached leaderboard without a reload
+def test_get_top_providers_served_from_cache(client, session):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    # The leaderboard was warmed (empty) by the lifespan hook
+    misses = leaderboard.misses
+
+    client.post("/claims/", json=claim)
+    client.post("/claims/bulk", json=[claim, {**claim, "provider_npi": "2345678901", "provider_fees": 300.00}])
+
+    response = client.get("/top-providers/")
+    assert response.json() == {"top_providers": [
+        {"provider_npi": "2345678901", "total_net_fee": 200.0},
+        {"provider_npi": "1497775530", "total_net_fee": 100.0},
+    ], "next_cursor": None}
+    assert leaderboard.misses == misses
+
+# Test that the connection pool metrics are exported
+def test_metrics_reports_pool_usage(client):
+    client.get("/top-providers/")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'db_pool_checked_out{pool="primary_async"}' in response.text
+    assert 'db_pool_checkout_seconds_count{pool="primary_async"}' in response.text
+
+# Test that per-route latency, stage timings and SQL statement counts are exported
+def test_metrics_reports_routes_and_stages(client):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    client.post("/claims/", json=claim)
+    client.post("/claims/bulk", json=[claim])
+
+    text = client.get("/metrics").text
+
+    assert 'http_requests_total{method="POST",route="/claims/",status="200"}' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/claims/bulk"}' in text
+    assert 'http_request_sql_statements_count{route="/claims/"}' in text
+    for stage in ("validation", "db_commit", "db_query", "serialization"):
+        assert f'claim_stage_duration_seconds_count{{stage="{stage}"}}' in text
+
+# Test that storing a claim is a single INSERT, with no re-read of the row
+def test_process_claim_does_not_read_back(client):
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_statement)
+    try:
+        response = client.post("/claims/", json={
+            "service_date": "2025-01-15",
+            "submitted_procedure": "D0180",
+            "plan_group": "GRP-1000",
+            "subscriber": "3730189502",
+            "provider_npi": "1497775530",
+            "provider_fees": 100.00,
+            "allowed_fees": 100.00,
+            "member_coinsurance": 0.00,
+            "member_copay": 0.00
+        })
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_statement)
+
+    assert response.status_code == 200
+    assert statements == ["INSERT"]
+
+# Test that the payload is parsed into the compact column types
+def test_process_claim_typed_columns(client, session):
+    payload = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "quadrant": "ur",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 100.10,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.10,
+        "member_copay": 0.10
+    }
+
+    response = client.post("/claims/", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["quadrant"] == "Upper Right"
+    assert data["net_fee"] == 0.30
+
+    db_claim = session.exec(select(Claim)).one()
+    assert db_claim.service_date == date(2025, 1, 15)
+    assert db_claim.quadrant == Quadrant.UPPER_RIGHT
+    # Exact cents, where float arithmetic gives 0.29999999999998295
+    assert db_claim.net_fee == Decimal("0.30")
+
+    response = client.post("/claims/", json={**payload, "provider_fees": 100.001, "quadrant": "Middle"})
+    assert response.status_code == 422
+    assert [error["loc"][-1] for error in response.json()["detail"]] == ["quadrant", "provider_fees"]
+
+# Test that a request retried with the same Idempotency-Key is answered with the original claim
+def test_process_claim_idempotency_key(client, session):
+    payload = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    headers = {"Idempotency-Key": "a3f1c9e2-retry-test"}
+
+    first = client.post("/claims/", json=payload, headers=headers)
+    replay = client.post("/claims/", json=payload, headers=headers)
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.json() == first.json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert replay.headers["Idempotent-Replayed"] == "true"
+
+    # One row, counted once in the totals and the leaderboard
+    assert len(session.exec(select(Claim)).all()) == 1
+    assert session.get(ProviderTotal, "1497775530").claim_count == 1
+    assert client.get("/top-providers/").json()["top_providers"] == [
+        {"provider_npi": "1497775530", "total_net_fee": 50.0}
+    ]
+
+    # The same key with another claim is rejected
+    response = client.post("/claims/", json={**payload, "provider_fees": 200.00}, headers=headers)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Idempotency-Key was already used for a different claim"}
+
+    # Without a key, every request is a new claim
+    assert client.post("/claims/", json=payload).json()["id"] != first.json()["id"]
+
+# Test that a retry under the same Idempotency-Key with another service_date is rejected, not stored twice
+def test_process_claim_idempotency_key_other_service_date(client, session):
+    payload = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    headers = {"Idempotency-Key": "moved-service-date-test"}
+
+    assert client.post("/claims/", json=payload, headers=headers).status_code == 200
+    # Same id, another partition key: the claim's primary key alone would not collide
+    response = client.post("/claims/", json={**payload, "service_date": "2025-03-02"}, headers=headers)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Idempotency-Key was already used for a different claim"}
+    # The same amounts written differently are the same claim
+    assert client.post("/claims/", json={**payload, "provider_fees": 150}, headers=headers).status_code == 200
+
+    bulk_headers = {"Idempotency-Key": "moved-service-date-bulk-test"}
+    client.post("/claims/bulk", json=[payload], headers=bulk_headers)
+    retry = client.post("/claims/bulk", json=[{**payload, "service_date": "2025-03-02"}], headers=bulk_headers).json()
+    assert (retry["inserted"], retry["replayed"], retry["failed"]) == (0, 0, 1)
+    assert retry["errors"][0]["errors"][0]["msg"] == "Idempotency-Key was already used for a different claim"
+
+    assert [claim.service_date for claim in session.exec(select(Claim)).all()] == [date(2025, 1, 15)] * 2
+    assert session.get(ProviderTotal, "1497775530").claim_count == 2
+
+# Test that a retried bulk request only writes the rows the first attempt did not
+def test_process_claims_bulk_idempotency_key(client, session):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    headers = {"Idempotency-Key": "bulk-retry-test"}
+
+    first = client.post("/claims/bulk", json=[claim, claim], headers=headers).json()
+    assert (first["inserted"], first["replayed"]) == (2, 0)
+
+    # The retry also carries a row the first attempt did not have
+    retry = client.post("/claims/bulk", json=[claim, claim, claim], headers=headers).json()
+    assert (retry["inserted"], retry["replayed"]) == (1, 2)
+    assert [claim["id"] for claim in retry["claims"][:2]] == [claim["id"] for claim in first["claims"]]
+    assert [claim.get("replayed", False) for claim in retry["claims"]] == [True, True, False]
+
+    assert len(session.exec(select(Claim)).all()) == 3
+    assert session.get(ProviderTotal, "1497775530").total_net_fee == 150.0
+
+# Test that a single claim's key never collides with the key of a bulk row
+def test_bulk_row_keys_do_not_collide_with_single_claim_keys(client, session):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 150.00,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+
+    single = client.post("/claims/", json=claim, headers={"Idempotency-Key": "collision-test:0"})
+    bulk = client.post("/claims/bulk", json=[{**claim, "provider_fees": 200.00}],
+                       headers={"Idempotency-Key": "collision-test"}).json()
+    assert single.status_code == 200
+    assert (bulk["inserted"], bulk["replayed"], bulk["failed"]) == (1, 0, 0)
+    assert bulk["claims"][0]["id"] != single.json()["id"]
+    assert len(session.exec(select(Claim)).all()) == 2
+
+    # The prefix of the bulk rows' keys is reserved
+    response = client.post("/claims/", json=claim, headers={"Idempotency-Key": "bulk:collision-test:0"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Idempotency-Key may not start with 'bulk:'"}
+
+# Test that a valid JSON array is validated in one batch call, and an invalid one row by row
+def test_process_claims_bulk_batch_validation(client, session, monkeypatch):
+    claim = {
+        "service_date": "2025-01-15",
+        "submitted_procedure": "D0180",
+        "quadrant": "UL",
+        "plan_group": "GRP-1000",
+        "subscriber": "3730189502",
+        "provider_npi": "1497775530",
+        "provider_fees": 100.10,
+        "allowed_fees": 100.00,
+        "member_coinsurance": 0.00,
+        "member_copay": 0.00
+    }
+    row_by_row = []
+    monkeypatch.setattr(claims, "validate_claim", lambda index, item: row_by_row.append(index) or validate_claim(index, item))
+
+    response = client.post("/claims/bulk", json=[claim, claim])
+    assert response.json()["inserted"] == 2
+    assert row_by_row == []
+    assert {claim.net_fee for claim in session.exec(select(Claim)).all()} == {Decimal("0.10")}
+
+    response = client.post("/claims/bulk", json=[claim, {**claim, "submitted_procedure": "X0180"}])
+    assert response.json()["inserted"] == 1
+    assert response.json()["errors"][0]["index"] == 1
+    assert row_by_row == [0, 1]
@@ -0,0 +1,127 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .. import partitions
+from ..database import engine
+from ..models import ProviderTotal
+from ..partitions import create_claim_partition, detach_claim_partition, ensure_claim_partitions, list_claim_partitions
+
+payload = {
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+def post_claims(client, *claims):
+    """Post (service_date, provider_npi) claims, each with a net fee of 50."""
+    for service_date, provider_npi in claims:
+        response = client.post("/claims/", json={**payload, "service_date": service_date, "provider_npi": provider_npi})
+        assert response.status_code == 200
+
+
+def rows_per_partition(session) -> dict[str, int]:
+    rows = session.exec(text("SELECT tableoid::regclass::text, count(*) FROM claim GROUP BY 1"))
+    return dict(rows.all())
+
+
+# Test that partitions are created ahead of time and take over the rows of the default partition
+def test_ensure_claim_partitions(client, session):
+    post_claims(client, ("2025-01-15", "1497775530"), ("2025-03-02", "1497775530"))
+    assert rows_per_partition(session) == {"claim_default": 2}
+
+    created = ensure_claim_partitions(session, today=date(2025, 1, 20), ahead=2)
+
+    assert created == ["claim_p2025_01", "claim_p2025_02", "claim_p2025_03"]
+    assert list_claim_partitions(session) == ["claim_default", *created]
+    assert rows_per_partition(session) == {"claim_p2025_01": 1, "claim_p2025_03": 1}
+    # Moving rows between partitions is not a new claim
+    assert session.get(ProviderTotal, "1497775530").claim_count == 2
+    # Already existing partitions are left alone
+    assert ensure_claim_partitions(session, today=date(2025, 1, 20), ahead=2) == []
+
+    # New claims are routed to their month
+    post_claims(client, ("2025-02-10", "1497775530"))
+    assert rows_per_partition(session)["claim_p2025_02"] == 1
+
+
+# Test that a date range on /top-providers/ only aggregates the claims in that range
+def test_top_providers_date_range(client, session):
+    post_claims(
+        client,
+        ("2025-01-15", "1111111111"),
+        ("2025-01-31", "1111111111"),
+        ("2025-02-01", "2222222222"),
+        ("2025-03-10", "3333333333"),
+    )
+
+    response = client.get("/top-providers/", params={"from": "2025-01-01", "to": "2025-01-31"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "top_providers": [{"provider_npi": "1111111111", "total_net_fee": 100.0}], "next_cursor": None
+    }
+
+    response = client.get("/top-providers/", params={"from": "2025-02-01"})
+    assert [provider["provider_npi"] for provider in response.json()["top_providers"]] == ["2222222222", "3333333333"]
+
+    response = client.get("/top-providers/", params={"from": "2025-02-01", "to": "2025-01-01"})
+    assert response.status_code == 400
+
+
+# Test that Postgres prunes the partitions outside the requested range
+def test_date_range_prunes_partitions(session):
+    for month in (date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)):
+        create_claim_partition(session, month)
+
+    plan = session.exec(text(
+        "EXPLAIN SELECT provider_npi, sum(net_fee) FROM claim "
+        "WHERE service_date >= '2025-02-01' AND service_date <= '2025-02-28' GROUP BY provider_npi"
+    )).all()
+    plan = "\n".join(line for line, in plan)
+
+    assert "claim_p2025_02" in plan
+    assert "claim_p2025_01" not in plan
+    assert "claim_p2025_03" not in plan
+    assert "claim_default" not in plan
+
+
+# Test that a detached partition keeps its rows as a standalone table
+def test_detach_claim_partition(client, session):
+    create_claim_partition(session, date(2025, 1, 1))
+    post_claims(client, ("2025-01-15", "1497775530"), ("2025-02-15", "1497775530"))
+
+    try:
+        assert detach_claim_partition(session, date(2025, 1, 1)) == "claim_p2025_01"
+
+        assert "claim_p2025_01" not in list_claim_partitions(session)
+        assert rows_per_partition(session) == {"claim_default": 1}
+        assert session.exec(text("SELECT count(*) FROM claim_p2025_01")).one()[0] == 1
+    finally:
+        # Detached tables are not dropped with claim
+        session.exec(text("DROP TABLE IF EXISTS claim_p2025_01"))
+        session.commit()
+
+
+# Test that creating a partition gives up after PARTITION_LOCK_TIMEOUT instead of queueing inserts behind it
+def test_create_claim_partition_lock_timeout(session, monkeypatch):
+    monkeypatch.setattr(partitions, "PARTITION_LOCK_TIMEOUT", "100ms")
+    with engine.connect() as writer:
+        # An insert in progress into the default partition
+        writer.execute(text("LOCK TABLE claim_default IN ROW EXCLUSIVE MODE"))
+        with pytest.raises(OperationalError, match="lock timeout"):
+            create_claim_partition(session, date(2025, 1, 1))
+        writer.rollback()
+    session.rollback()
+
+    assert create_claim_partition(session, date(2025, 1, 1))
+    assert session.exec(text(
+        "SELECT count(*) FROM pg_constraint WHERE conrelid = 'claim_p2025_01'::regclass AND contype = 'c'"
+    )).one()[0] == 0
@@ -0,0 +1,63 @@
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from sqlmodel import select
+
+from ..database import engine
+from ..models import RateLimitCounter
+from ..ratelimit import BoundedMemoryStorage, PostgresStorage
+
+limit = parse("5/minute")
+
+
+def hits(limiter, client, count):
+    return [limiter.hit(limit, client) for _ in range(count)]
+
+
+# Test that idle clients are evicted once max_keys counters are kept
+def test_bounded_memory_storage_evicts_idle_keys():
+    storage = BoundedMemoryStorage(max_keys=2)
+    limiter = FixedWindowRateLimiter(storage)
+
+    assert hits(limiter, "10.0.0.1", 6) == [True] * 5 + [False]
+    hits(limiter, "10.0.0.2", 1)
+    hits(limiter, "10.0.0.3", 1)
+
+    assert len(storage.counters) == 2
+    assert limiter.get_window_stats(limit, "10.0.0.1").remaining == 5
+    assert limiter.get_window_stats(limit, "10.0.0.3").remaining == 4
+
+
+# Test that two processes enforce one shared limit once their hits are synced
+def test_postgres_storage_shares_counters(session):
+    first = PostgresStorage(engine=engine, sync_seconds=3600)
+    second = PostgresStorage(engine=engine, sync_seconds=3600)
+    first_limiter, second_limiter = FixedWindowRateLimiter(first), FixedWindowRateLimiter(second)
+
+    assert hits(first_limiter, "10.0.0.1", 3) == [True] * 3
+    assert first.sync() == 1
+    assert hits(second_limiter, "10.0.0.1", 2) == [True] * 2
+    second.sync()
+
+    # The second process now knows the shared total
+    assert second_limiter.hit(limit, "10.0.0.1") is False
+    assert session.exec(select(RateLimitCounter.count)).one() == 5
+
+    # The first one is one sync behind: it admits a hit, then learns the total
+    assert first_limiter.hit(limit, "10.0.0.1") is True
+    first.sync()
+    assert first_limiter.hit(limit, "10.0.0.1") is False
+
+    # Other clients are not affected
+    assert first_limiter.hit(limit, "10.0.0.2") is True
+
+    first.reset()
+    session.expire_all()
+    assert session.exec(select(RateLimitCounter)).all() == []
+
+
+# Test that the storage is selected with RATE_LIMIT_STORAGE_URI's scheme
+def test_limiter_storage_uri():
+    limiter = Limiter(key_func=get_remote_address, storage_uri="claimdb://")
+    assert isinstance(limiter._storage, PostgresStorage)
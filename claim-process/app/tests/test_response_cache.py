@@ -0,0 +1,153 @@
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+from ..database import async_engine, read_async_engine
+from ..models import Claim
+from ..response_cache import CachedResponse, ResponseCache, cache_key, etag_matches, response_cache
+from .factories import FakeClock
+
+payload = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_npi": "1497775530",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+# Aggregated from the claims on every uncached request
+DATE_RANGE = {"from": "2025-01-01", "to": "2025-01-31"}
+
+
+@contextmanager
+def recorded_statements():
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # One engine when no replica is configured
+    engines = {async_engine.sync_engine, read_async_engine.sync_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record_statement)
+
+
+def entry(version=0, stored_at=0.0):
+    return CachedResponse(b"{}", [], b'"etag"', version, stored_at, None)
+
+
+# Test that a repeated read is served from the cache, without a query
+def test_repeated_read_is_cached(client):
+    client.post("/claims/", json=payload)
+    first = client.get("/top-providers/", params=DATE_RANGE)
+    assert first.status_code == 200
+    assert first.headers["etag"].startswith('"')
+    assert first.headers["cache-control"] == "max-age=0, must-revalidate"
+
+    with recorded_statements() as statements:
+        # Same parameters in another order: same entry
+        second = client.get("/top-providers/", params={"to": "2025-01-31", "from": "2025-01-01"})
+    assert statements == []
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-type"] == "application/json"
+
+
+# Test that a matching If-None-Match gets 304 without touching the database
+def test_if_none_match_gets_not_modified(client):
+    client.post("/claims/", json=payload)
+    etag = client.get("/top-providers/", params=DATE_RANGE).headers["etag"]
+
+    with recorded_statements() as statements:
+        response = client.get("/top-providers/", params=DATE_RANGE, headers={"If-None-Match": f'"other", W/{etag}'})
+    assert statements == []
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    assert client.get("/top-providers/", params=DATE_RANGE, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+# Test that committing a claim invalidates the cached responses, and that an unchanged body still revalidates
+def test_committed_claim_invalidates(client):
+    client.post("/claims/", json=payload)
+    before = client.get("/top-providers/", params=DATE_RANGE)
+
+    client.post("/claims/", json=payload)
+    after = client.get("/top-providers/", params=DATE_RANGE, headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.json()["top_providers"][0]["total_net_fee"] == 100.0
+    assert after.headers["etag"] != before.headers["etag"]
+
+    # A claim outside the range changes nothing: recomputed, but still not modified
+    client.post("/claims/", json={**payload, "service_date": "2025-02-15"})
+    response = client.get("/top-providers/", params=DATE_RANGE, headers={"If-None-Match": after.headers["etag"]})
+    assert response.status_code == 304
+
+
+# Test that writes this process did not make are picked up once the entry expires
+def test_entries_expire(client, session, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, "clock", clock)
+    client.post("/claims/", json=payload)
+    assert len(client.get("/top-providers/", params=DATE_RANGE).json()["top_providers"]) == 1
+
+    # A claim committed by another process (ingest-file, another API worker)
+    session.add(Claim(**{**payload, "service_date": date(2025, 1, 20), "provider_npi": "2222222222", "net_fee": 50}))
+    session.commit()
+    assert len(client.get("/top-providers/", params=DATE_RANGE).json()["top_providers"]) == 1
+
+    clock.now = response_cache.ttl
+    assert len(client.get("/top-providers/", params=DATE_RANGE).json()["top_providers"]) == 2
+
+
+# Test that errors are not cached
+def test_errors_are_not_cached(client):
+    params = {"from": "2025-02-01", "to": "2025-01-01"}
+    assert client.get("/top-providers/", params=params).status_code == 400
+    assert "etag" not in client.get("/top-providers/", params=params).headers
+    assert not response_cache.entries
+
+
+# Test that cache hits still count against the per-IP limit of /top-providers/
+def test_cache_hits_are_rate_limited(client):
+    # One miss counted by the route's @limiter.limit, then hits counted by the middleware, on the same counter
+    responses = [client.get("/top-providers/") for _ in range(11)]
+    assert [response.status_code for response in responses] == [200] * 10 + [429]
+    assert response_cache.entries
+    # Answered like the route itself answers once the limit is exceeded
+    miss = client.get("/top-providers/", params={"limit": 5})
+    assert miss.status_code == 429
+    assert responses[-1].json() == miss.json() == {"error": "Rate limit exceeded: 10 per 1 minute"}
+
+
+# Test the LRU eviction, the source versions and the If-None-Match parsing
+def test_cache_eviction_and_versions():
+    cache = ResponseCache(ttl=5, max_entries=2, clock=FakeClock())
+    cache.put(("/a", ()), entry())
+    cache.put(("/b", ()), entry())
+    assert cache.get(("/a", ()), "claims") is not None
+    cache.put(("/c", ()), entry())
+    # /b was the least recently used
+    assert cache.get(("/b", ()), "claims") is None
+    assert cache.get(("/a", ()), "claims") is not None
+
+    cache.bump("claims")
+    assert cache.get(("/a", ()), "claims") is None
+    # TTL-only entries ignore the versions
+    assert cache.get(("/c", ()), None) is not None
+
+    assert cache_key({"path": "/x", "query_string": b"b=2&a=1&a="}) == ("/x", (("a", ""), ("a", "1"), ("b", "2")))
+    assert etag_matches(b"*", b'"x"')
+    assert etag_matches(b'"y", W/"x"', b'"x"')
+    assert not etag_matches(b'"y"', b'"x"')
@@ -0,0 +1,161 @@
+"""/top-providers/ on a large claim table: exact rankings, bounded latency and the expected indexes.
+
+The claims are loaded once for the module with COPY, into monthly partitions
+as in production. SCALING_TEST_CLAIMS sets their number (100k by default, a
+few seconds to load); run with SCALING_TEST_CLAIMS=1000000 for the
+million-row scenario. The latency budgets hold at both sizes on one vCPU.
+"""
+import os
+import statistics
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session
+
+from ..database import engine
+from ..exports import export_claims_statement
+from ..leaderboard import LEADERBOARD_SIZE
+from ..main import limiter
+from ..partitions import ensure_claim_partitions
+from ..response_cache import response_cache
+from ..rollups import filtered_top_providers_statement, top_providers_statement
+from ..summaries import compact_daily_summary, summary_top_providers_statement, summary_trend_statement
+from .conftest import empty_tables
+from .factories import copy_claims, synthetic_claims
+from .plans import assert_index_used
+
+pytestmark = pytest.mark.shared_data
+
+SCALING_TEST_CLAIMS = int(os.getenv("SCALING_TEST_CLAIMS", "100000"))
+WEEK = {"from": "2024-03-04", "to": "2024-03-10"}
+PLAN_GROUP = "GRP-7"
+# p50 budgets in ms: served from memory, one page of the rollup, aggregated from one week of claims
+LATENCY_BUDGETS_MS = {"leaderboard": 20, "rollup_page": 50, "date_range": 100}
+WEEK_DATES = (date.fromisoformat(WEEK["from"]), date.fromisoformat(WEEK["to"]))
+# Query of each read endpoint, with the index it must be answered with (a glob: partitions have their own)
+ENDPOINT_QUERIES = {
+    "top-providers leaderboard": (top_providers_statement(LEADERBOARD_SIZE), "ix_provider_totals_total_net_fee"),
+    "top-providers page": (
+        top_providers_statement(100, (Decimal("1000.00"), "0000000100")), "ix_provider_totals_total_net_fee"
+    ),
+    "top-providers date range": (
+        filtered_top_providers_statement(*WEEK_DATES, limit=100), "claim_p2024_03_service_date_provider_npi*"
+    ),
+    "top-providers plan group": (
+        filtered_top_providers_statement(plan_group=PLAN_GROUP, limit=100), "claim_p*_plan_group_service_date*"
+    ),
+    "summaries top-providers": (summary_top_providers_statement(*WEEK_DATES), "ix_provider_daily_summary_day"),
+    "summaries trend of a provider": (
+        summary_trend_statement(provider_npi="0000000042", interval="week"), "provider_daily_summary_pkey"
+    ),
+    "claims export of a provider": (export_claims_statement(provider_npi="0000000042"), "claim_p*_provider_npi*"),
+}
+
+
+@pytest.fixture(scope="module")
+def expected_totals():
+    """Load the claims and return their exact totals in cents: overall, for WEEK and for PLAN_GROUP."""
+    totals = {name: defaultdict(int) for name in ("all", "week", "plan_group")}
+
+    def tracked(claims):
+        for claim in claims:
+            cents = int(claim["net_fee"] * 100)
+            totals["all"][claim["provider_npi"]] += cents
+            if WEEK_DATES[0] <= claim["service_date"] <= WEEK_DATES[1]:
+                totals["week"][claim["provider_npi"]] += cents
+            if claim["plan_group"] == PLAN_GROUP:
+                totals["plan_group"][claim["provider_npi"]] += cents
+            yield claim
+
+    with Session(engine) as session:
+        ensure_claim_partitions(session, today=date(2024, 12, 1), ahead=0, since=date(2024, 1, 1))
+    with engine.begin() as connection:
+        copy_claims(connection, tracked(synthetic_claims(SCALING_TEST_CLAIMS)))
+    with Session(engine) as session:
+        compact_daily_summary(session)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in ("claim", "provider_totals", "provider_daily_summary"):
+            connection.execute(text(f"VACUUM ANALYZE {table}"))
+    yield totals
+    empty_tables()
+
+
+@pytest.fixture
+def uncached(monkeypatch):
+    """Every request reaches the endpoint: no response cache, no rate limit."""
+    monkeypatch.setattr(response_cache, "ttl", 0)
+    monkeypatch.setattr(limiter, "enabled", False)
+
+
+def ranking(totals: dict[str, int], limit: int, offset: int = 0) -> list[tuple[str, int]]:
+    """Expected order of /top-providers/: net fee descending, then NPI."""
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))[offset:offset + limit]
+
+
+def rows(response) -> list[tuple[str, int]]:
+    assert response.status_code == 200
+    return [(row["provider_npi"], round(row["total_net_fee"] * 100)) for row in response.json()["top_providers"]]
+
+
+# Test that the cached leaderboard and the rollup pages rank every provider exactly
+def test_top_providers_match_totals(client, expected_totals, uncached):
+    assert rows(client.get("/top-providers/")) == ranking(expected_totals["all"], 10)
+
+    params, offset = {"limit": 100}, 0
+    for _ in range(5):
+        response = client.get("/top-providers/", params=params)
+        assert rows(response) == ranking(expected_totals["all"], 100, offset)
+        params["cursor"], offset = response.json()["next_cursor"], offset + 100
+
+
+# Test that the date range and plan group rankings, aggregated from the claims, are exact
+def test_filtered_top_providers_match_totals(client, expected_totals, uncached):
+    response = client.get("/top-providers/", params={**WEEK, "limit": 100})
+    assert rows(response) == ranking(expected_totals["week"], 100)
+
+    response = client.get("/top-providers/", params={"plan_group": PLAN_GROUP, "limit": 100})
+    assert rows(response) == ranking(expected_totals["plan_group"], 100)
+
+
+# Test that the latency of each query stays within its budget on the large table
+@pytest.mark.parametrize("query, params", [
+    ("leaderboard", {}),
+    ("rollup_page", {"limit": 100, "cursor": None}),
+    ("date_range", WEEK),
+])
+def test_top_providers_latency(client, expected_totals, uncached, query, params):
+    if "cursor" in params:
+        # The second page: always read from provider_totals
+        params = {**params, "cursor": client.get("/top-providers/", params={"limit": 100}).json()["next_cursor"]}
+    client.get("/top-providers/", params=params)
+
+    latencies = []
+    for _ in range(30):
+        start = time.perf_counter()
+        assert client.get("/top-providers/", params=params).status_code == 200
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    assert statistics.median(latencies) < LATENCY_BUDGETS_MS[query]
+
+
+# Test that each read endpoint's query is answered with its index, not a sequential scan
+@pytest.mark.parametrize("query", ENDPOINT_QUERIES)
+def test_endpoint_queries_use_indexes(expected_totals, query):
+    statement, index = ENDPOINT_QUERIES[query]
+    with engine.connect() as connection:
+        assert_index_used(connection, statement, index)
+
+
+# Test that the guard catches a plan that lost its index
+def test_missing_index_is_reported(expected_totals):
+    statement, index = ENDPOINT_QUERIES["top-providers page"]
+    with engine.connect() as connection:
+        # Dropped in a transaction that is rolled back
+        connection.execute(text("DROP INDEX ix_provider_totals_total_net_fee"))
+        with pytest.raises(AssertionError, match="Seq Scan using - on provider_totals"):
+            assert_index_used(connection, statement, index)
+        connection.rollback()
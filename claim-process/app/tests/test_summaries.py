@@ -0,0 +1,111 @@
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlmodel import select
+
+from ..database import engine
+from ..models import ProviderDailySummary
+from ..summaries import compact_daily_summary
+
+payload = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "provider_npi": "1497775530",
+    "provider_fees": 150.00,
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+def post_claim(client, **fields):
+    assert client.post("/claims/", json={**payload, **fields}).status_code == 200
+
+
+def summaries(session) -> dict[tuple, tuple]:
+    session.expire_all()
+    return {
+        (row.provider_npi, str(row.day), row.plan_group): (row.sum_net_fee, row.claim_count)
+        for row in session.exec(select(ProviderDailySummary)).all()
+    }
+
+
+# Test that each compaction only folds in the claims written since the previous one
+def test_compaction_is_incremental(client, session):
+    post_claim(client)
+    post_claim(client)
+    post_claim(client, service_date="2025-01-16")
+
+    assert compact_daily_summary(session) == 2
+    assert summaries(session) == {
+        ("1497775530", "2025-01-15", "GRP-1000"): (Decimal("100.00"), 2),
+        ("1497775530", "2025-01-16", "GRP-1000"): (Decimal("50.00"), 1),
+    }
+
+    # Nothing new: the summaries are left as they are
+    assert compact_daily_summary(session) == 0
+
+    post_claim(client)
+    post_claim(client, plan_group="GRP-2000")
+    assert compact_daily_summary(session) == 2
+    assert summaries(session)[("1497775530", "2025-01-15", "GRP-1000")] == (Decimal("150.00"), 3)
+    assert summaries(session)[("1497775530", "2025-01-15", "GRP-2000")] == (Decimal("50.00"), 1)
+
+
+# Test that claims are only compacted once every older transaction has finished
+def test_compaction_waits_for_running_transactions(client, session):
+    with engine.connect() as connection:
+        # A transaction that writes a claim and is still open during the compaction
+        connection.execute(text("""
+            INSERT INTO claim (id, service_date, submitted_procedure, plan_group, subscriber, provider_npi,
+                               provider_fees, allowed_fees, member_coinsurance, member_copay, net_fee)
+            VALUES (gen_random_uuid(), '2025-01-15', 'D0180', 'GRP-1000', 'S1', '1111111111', 10, 0, 0, 0, 10)
+        """))
+        post_claim(client)
+
+        # The open transaction holds the horizon back, so the newer claim waits too
+        compact_daily_summary(session)
+        assert summaries(session) == {}
+
+        connection.commit()
+
+    compact_daily_summary(session)
+    assert summaries(session)[("1111111111", "2025-01-15", "GRP-1000")] == (Decimal("10.00"), 1)
+    assert summaries(session)[("1497775530", "2025-01-15", "GRP-1000")] == (Decimal("50.00"), 1)
+
+
+# Test the top-N and trend endpoints served from the summaries
+def test_summary_endpoints(client, session):
+    post_claim(client, provider_npi="1111111111", service_date="2025-01-05")
+    post_claim(client, provider_npi="1111111111", service_date="2025-02-05", plan_group="GRP-2000")
+    post_claim(client, provider_npi="2222222222", service_date="2025-02-06", provider_fees=250.00)
+    compact_daily_summary(session)
+    # Not compacted yet, so not visible
+    post_claim(client, provider_npi="3333333333", provider_fees=1000.00)
+
+    response = client.get("/summaries/top-providers", params={"from": "2025-01-01", "to": "2025-12-31"})
+    assert response.status_code == 200
+    assert response.json() == {"top_providers": [
+        {"provider_npi": "2222222222", "total_net_fee": 150.0, "claim_count": 1},
+        {"provider_npi": "1111111111", "total_net_fee": 100.0, "claim_count": 2},
+    ]}
+
+    response = client.get("/summaries/top-providers", params={"plan_group": "GRP-2000"})
+    assert response.json()["top_providers"] == [{"provider_npi": "1111111111", "total_net_fee": 50.0, "claim_count": 1}]
+
+    response = client.get("/summaries/trend", params={"interval": "month", "from": "2025-01-01"})
+    assert response.status_code == 200
+    assert response.json() == {"trend": [
+        {"period": "2025-01-01", "total_net_fee": 50.0, "claim_count": 1,
+         "total_provider_fees": 150.0, "total_allowed_fees": 100.0},
+        {"period": "2025-02-01", "total_net_fee": 200.0, "claim_count": 2,
+         "total_provider_fees": 400.0, "total_allowed_fees": 200.0},
+    ]}
+
+    response = client.get("/summaries/trend", params={"provider_npi": "1111111111"})
+    assert [point["period"] for point in response.json()["trend"]] == ["2025-01-05", "2025-02-05"]
+
+    assert client.get("/summaries/trend", params={"interval": "year"}).status_code == 422
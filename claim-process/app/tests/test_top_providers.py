@@ -0,0 +1,116 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from ..database import engine
+from ..partitions import create_claim_partition
+from ..rollups import filtered_top_providers_statement
+from .plans import assert_index_used
+
+payload = {
+    "service_date": "2025-01-15",
+    "submitted_procedure": "D0180",
+    "quadrant": "Upper",
+    "plan_group": "GRP-1000",
+    "subscriber": "3730189502",
+    "allowed_fees": 100.00,
+    "member_coinsurance": 0.00,
+    "member_copay": 0.00
+}
+
+
+def post_claim(client, provider_npi, net_fee, **fields):
+    response = client.post("/claims/", json={
+        **payload, "provider_npi": provider_npi, "provider_fees": 100.00 + net_fee, **fields
+    })
+    assert response.status_code == 200
+
+
+def npis(response):
+    return [provider["provider_npi"] for provider in response.json()["top_providers"]]
+
+
+# Test that the whole leaderboard can be paged through with the cursor, ties included
+def test_top_providers_pagination(client):
+    for provider_npi, net_fee in [("1000000001", 30), ("1000000002", 20), ("1000000003", 20),
+                                  ("1000000004", 10), ("1000000005", 5)]:
+        post_claim(client, provider_npi, net_fee)
+
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/top-providers/", params=params)
+        assert response.status_code == 200
+        pages.append(npis(response))
+        if response.json()["next_cursor"] is None:
+            break
+        params["cursor"] = response.json()["next_cursor"]
+
+    assert pages == [["1000000001", "1000000002"], ["1000000003", "1000000004"], ["1000000005"]]
+
+
+# Test the plan_group and date filters, combined with the cursor
+def test_top_providers_filters(client):
+    post_claim(client, "1000000001", 30, plan_group="GRP-1")
+    post_claim(client, "1000000002", 20, plan_group="GRP-1")
+    post_claim(client, "1000000003", 50, plan_group="GRP-2")
+    post_claim(client, "1000000004", 10, plan_group="GRP-1", service_date="2025-02-01")
+
+    response = client.get("/top-providers/", params={"plan_group": "GRP-1", "limit": 1})
+    assert npis(response) == ["1000000001"]
+
+    response = client.get("/top-providers/", params={
+        "plan_group": "GRP-1", "limit": 1, "cursor": response.json()["next_cursor"]
+    })
+    assert npis(response) == ["1000000002"]
+
+    response = client.get("/top-providers/", params={"plan_group": "GRP-1", "from": "2025-02-01"})
+    assert response.json() == {
+        "top_providers": [{"provider_npi": "1000000004", "total_net_fee": 10.0}], "next_cursor": None
+    }
+
+
+@pytest.mark.parametrize("params", [{"cursor": "not-a-cursor"}, {"limit": 0}, {"limit": 101}])
+def test_top_providers_invalid_parameters(client, params):
+    assert client.get("/top-providers/", params=params).status_code in (400, 422)
+
+
+@pytest.fixture
+def claims_of_a_year(commits):
+    """100k claims spread over 2024, 50 plan groups and 500 providers, vacuumed and analyzed."""
+    with engine.connect() as connection:
+        connection.execute(text("""
+            INSERT INTO claim (id, service_date, submitted_procedure, plan_group, subscriber, provider_npi,
+                               provider_fees, allowed_fees, member_coinsurance, member_copay, net_fee)
+            SELECT gen_random_uuid(), DATE '2024-01-01' + i % 366, 'D0180', 'GRP-' || i % 50, 'S' || i,
+                   lpad((i * 7919 % 500)::text, 10, '1'), 100, 90, 0, 0, 10
+            FROM generate_series(1, 100000) i
+        """))
+        connection.commit()
+    # Index-only scans need an up to date visibility map
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE claim"))
+
+
+# Test that date-range rankings are answered with an index-only scan of the covering index
+def test_date_range_uses_covering_index(session, claims_of_a_year):
+    for month in range(1, 13):
+        create_claim_partition(session, date(2024, month, 1))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE claim"))
+
+    with engine.connect() as connection:
+        nodes = assert_index_used(connection, filtered_top_providers_statement(date(2024, 3, 1), date(2024, 3, 10)),
+                                  "claim_p2024_03_service_date_provider_npi*", index_only=True)
+
+    assert {node.get("Relation Name") for node in nodes} - {None} == {"claim_p2024_03"}
+
+
+# Test that plan group rankings are answered with an index-only scan of the covering index
+def test_plan_group_uses_covering_index(claims_of_a_year):
+    with engine.connect() as connection:
+        statement = filtered_top_providers_statement(date(2024, 1, 1), date(2024, 6, 30), plan_group="GRP-7")
+        # No partitions here: the default partition holds every claim
+        assert_index_used(connection, statement, "claim_default_plan_group_service_date*", index_only=True,
+                          small_tables=())